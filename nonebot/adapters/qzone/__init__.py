@@ -1,4 +1,16 @@
 from .bot import Bot
-from .event import PublishEvent, LoginEvent, LogoutEvent, QueryEvent
+from .event import (
+    PublishEvent,
+    LoginEvent,
+    LogoutEvent,
+    QueryEvent,
+    FeedEvent,
+    CommentEvent,
+    ReplyEvent,
+    LikeEvent,
+)
 from .adapter import Adapter
 from .message import Message, MessageSegment
+from .publisher import Priority, PublishJob
+from .scheduler import ScheduledPost
+from .session import SessionState
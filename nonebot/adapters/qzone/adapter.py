@@ -1,15 +1,29 @@
-from typing import Any, List, Optional, Tuple
+import hmac
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
 from typing_extensions import override
 
-from nonebot.drivers import Driver
+from nonebot.drivers import URL, Driver, Request, Response, HTTPServerSetup
 from nonebot.adapters import Adapter as BaseAdapter
+from nonebot.utils import escape_tag
 
+from .archive import Archive, ArchiveReport
 from .bot import Bot
+from .cleanup import Cleanup, CleanupReport
 from .config import ADAPTER_NAME, Config
-from .message import Message, Text, Image
-from .utils import log
-from .session import Session
-from .exception import ApiNotAvailable
+from .feed import FeedPoller
+from .imaging import ImageProcessor
+from .media import MediaSource, VideoMedia
+from .metrics import Metrics
+from .message import Message, Text, Image, Video
+from .utils import log, log_lazy
+from .pool import SessionPool
+from .session import Session, SessionState
+from .transport import create_transport
+from .publisher import Deferred, Priority, PublishJob, PublishQueue
+from .scheduler import Scheduler, ScheduledPost
+from .store import create_store
+from .exception import ApiNotAvailable, CircuitOpen
 
 
 class Adapter(BaseAdapter):
@@ -18,13 +32,19 @@ class Adapter(BaseAdapter):
         super().__init__(driver, **kwargs)
 
         self.adapter_config: Config = Config(**self.config.dict())
-        log("DEBUG", self.adapter_config.bot_id)
+        log("DEBUG", str(self.adapter_config.account_ids))
         log("DEBUG", str(self.adapter_config.cache_path))
 
-        self.bot = Bot(self, self.adapter_config.bot_id)
+        self._bots = [Bot(self, bot_id) for bot_id in self.adapter_config.account_ids]
         self._setup()
 
-        self.session: Optional[Session] = None
+        self.pool = SessionPool(self.adapter_config.route_penalty)
+        self.queue: Optional[PublishQueue] = None
+        self.scheduler: Optional[Scheduler] = None
+        self.metrics = Metrics()
+        self.processor = ImageProcessor(self.adapter_config)
+        self.store = create_store(self.adapter_config)
+        self.pollers: Dict[str, FeedPoller] = {}
 
     @classmethod
     @override
@@ -34,54 +54,405 @@ class Adapter(BaseAdapter):
     def _setup(self) -> None:
         self.driver.on_startup(self._startup)
         self.driver.on_shutdown(self._shutdown)
+        if self.adapter_config.metrics_path:
+            try:
+                self.setup_http_server(
+                    HTTPServerSetup(
+                        URL(self.adapter_config.metrics_path),
+                        "GET",
+                        f"{self.get_name()} Metrics",
+                        self._handle_metrics,
+                    )
+                )
+            except TypeError:
+                log("WARNING", "Driver has no HTTP server, metrics endpoint disabled")
+
+    async def _handle_metrics(self, request: Request) -> Response:
+        token = self.adapter_config.metrics_token
+        if token and not hmac.compare_digest(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        ):
+            return Response(401, headers={"WWW-Authenticate": "Bearer"})
+        return Response(
+            200,
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+            content=self.metrics.render(),
+        )
 
     async def _startup(self) -> None:
-        self.session = Session(self.request, self.adapter_config)
-        self.bot_connect(self.bot)
+        for bot in self._bots:
+            transport = create_transport(self.adapter_config, self.request)
+            session = Session(
+                transport,
+                self.adapter_config,
+                bot.self_id,
+                self.metrics,
+                self.processor,
+                self.store,
+            )
+            await session.start()
+            self.pool.add(session)
+            self.bot_connect(bot)
+            if self.adapter_config.feed_poll:
+                poller = FeedPoller(
+                    self.pool.get(bot.self_id), self.adapter_config, bot.handle_event
+                )
+                poller.start()
+                self.pollers[bot.self_id] = poller
+        self.queue = PublishQueue(
+            self._handle_job,
+            (
+                self.adapter_config.publish_queue_path
+                if self.adapter_config.publish_queue_persist
+                else None
+            ),
+            self.adapter_config.publish_queue_size,
+            self.adapter_config.publish_workers,
+            self.adapter_config.publish_queue_block,
+        )
+        await self.queue.start()
+        self.metrics.queue_depth.set_function(self.queue.__len__)
+        self.scheduler = Scheduler(
+            self._fire_scheduled,
+            self._prefetch_scheduled,
+            (
+                self.adapter_config.schedule_path
+                if self.adapter_config.schedule_persist
+                else None
+            ),
+            self.adapter_config.schedule_prefetch.total_seconds(),
+        )
+        await self.scheduler.start()
 
     async def _shutdown(self) -> None:
-        assert self.session
-        self.session.close()
-        self.bot_disconnect(self.bot)
+        if self.scheduler:
+            await self.scheduler.stop()
+        if self.queue:
+            await self.queue.stop()
+        for poller in self.pollers.values():
+            await poller.stop()
+        self.pollers.clear()
+        for bot in self._bots:
+            session = self.pool.remove(bot.self_id)
+            if session:
+                await session.close()
+            self.bot_disconnect(bot)
+        self.processor.close()
+        await self.store.close()
+
+    def _session_of(self, bot: Bot) -> Session:
+        return self.pool.get(bot.self_id)
+
+    async def login(self, session: Session) -> None:
+        await session.login()
+
+    async def logout(self, session: Session) -> None:
+        await session.logout()
+
+    async def submit_publish(
+        self,
+        message: Message,
+        session: Optional[Session] = None,
+        priority: Priority = Priority.NORMAL,
+    ) -> PublishJob:
+        assert self.queue
+        return await self.queue.submit(
+            message, priority, session.bot_id if session else None
+        )
+
+    async def publish(
+        self,
+        message: Message,
+        session: Optional[Session] = None,
+        priority: Priority = Priority.NORMAL,
+    ) -> Tuple[str, List[str]]:
+        job = await self.submit_publish(message, session, priority)
+        return await job.future
+
+    def get_publish_job(self, job_id: str) -> Optional[PublishJob]:
+        assert self.queue
+        return self.queue.get(job_id)
 
-    async def login(self) -> None:
-        assert self.session
-        await self.session.login()
+    def schedule_publish(
+        self,
+        message: Message,
+        at: datetime,
+        session: Optional[Session] = None,
+        priority: Priority = Priority.NORMAL,
+    ) -> ScheduledPost:
+        assert self.scheduler
+        return self.scheduler.schedule(
+            message, at, session.bot_id if session else None, priority
+        )
 
-    async def logout(self) -> None:
-        assert self.session
-        await self.session.logout()
+    def cancel_scheduled(self, post_id: str) -> bool:
+        assert self.scheduler
+        return self.scheduler.cancel(post_id)
 
-    async def publish(self, message: Message) -> Tuple[str, List[str]]:
-        assert self.session
+    def list_scheduled(self, session: Optional[Session] = None) -> List[ScheduledPost]:
+        assert self.scheduler
+        return self.scheduler.list(session.bot_id if session else None)
+
+    async def _prefetch_scheduled(self, post: ScheduledPost) -> None:
+        _, images, _ = self._extract(post.message)
+        if not images:
+            return
+        if post.bot_id is None:
+            # the upload cache is per account, so stick to this one
+            post.bot_id = self.pool.select().bot_id
+        await self.pool.get(post.bot_id).upload_images(images)
+        log_lazy(
+            "DEBUG",
+            lambda: f"Prefetched {len(images)} images of scheduled post {post.id}",
+        )
+
+    async def _fire_scheduled(self, post: ScheduledPost) -> None:
+        assert self.queue
+        job = await self.queue.submit(post.message, post.priority, post.bot_id)
+        job.future.add_done_callback(
+            lambda future: (
+                log("ERROR", f"Scheduled post {post.id} failed", future.exception())
+                if not future.cancelled() and future.exception()
+                else None
+            )
+        )
+
+    async def _handle_job(self, job: PublishJob) -> Tuple[str, List[str]]:
+        if job.bot_id is None:
+            session = self.pool.select()
+        else:
+            session = self.pool.get(job.bot_id)
+        # queued jobs wait out an open circuit or the rate limit instead of
+        # failing, back in the queue so other accounts aren't held up
+        wait = session.breaker.retry_after()
+        if wait > 0 or not session.publish_limiter.try_acquire():
+            wait = max(wait, session.publish_limiter.delay())
+            log_lazy(
+                "DEBUG",
+                lambda: f"Job {job.id} deferred {wait:.3f}s for {session.bot_id}",
+            )
+            raise Deferred(wait, session.bot_id)
+        try:
+            return await self._publish_now(job.message, session)
+        except CircuitOpen as err:
+            log_lazy(
+                "DEBUG", lambda: f"Job {job.id} waiting for circuit of {session.bot_id}"
+            )
+            raise Deferred(err.retry_after, session.bot_id) from None
+
+    async def _publish_now(
+        self, message: Message, session: Session
+    ) -> Tuple[str, List[str]]:
+        return await session.publish(*self._extract(message))
+
+    async def publish_many(
+        self, messages: List[Message], session: Optional[Session] = None
+    ) -> List[Union[Tuple[str, List[str]], Exception]]:
+        if session is None:
+            session = self.pool.select()
+        return await session.publish_many(
+            [self._extract(message) for message in messages]
+        )
+
+    @staticmethod
+    def _extract(
+        message: Message,
+    ) -> Tuple[str, List[MediaSource], Optional[VideoMedia]]:
         content = ""
-        images: List[str] = []
+        images: List[MediaSource] = []
+        video: Optional[VideoMedia] = None
         # log("DEBUG", f"Message: {message}")
         for sgm in message:
             if isinstance(sgm, Text):
-                log("DEBUG", f"Text: {type(sgm)} {sgm.data}")
-                content = sgm.data["text"]
+                log_lazy("DEBUG", lambda: escape_tag(f"Text: {sgm.data}"))
+                content += sgm.data["text"]
             if isinstance(sgm, Image):
-                log("DEBUG", f"Image: {type(sgm)}")
+                log_lazy("DEBUG", lambda: escape_tag(f"Image: {sgm.data['file']}"))
                 images.append(sgm.data["file"])
+            if isinstance(sgm, Video):
+                log_lazy("DEBUG", lambda: escape_tag(f"Video: {sgm.data['file']}"))
+                if video is not None:
+                    raise ValueError("A post can carry only one video")
+                video = (sgm.data["file"], sgm.data["cover"])
+        return content, images, video
+
+    def _text_of(self, message: Message) -> str:
+        content, images, video = self._extract(message)
+        if images or video:
+            raise ValueError("Comments can't carry images or videos")
+        return content
+
+    async def like(
+        self, session: Session, tid: str, owner: Optional[str] = None
+    ) -> None:
+        await session.like(tid, owner)
+
+    async def comment(
+        self,
+        session: Session,
+        tid: str,
+        message: Message,
+        owner: Optional[str] = None,
+    ) -> Optional[str]:
+        return await session.comment(tid, self._text_of(message), owner)
+
+    async def reply(
+        self,
+        session: Session,
+        tid: str,
+        comment_id: str,
+        user_id: str,
+        message: Message,
+        owner: Optional[str] = None,
+    ) -> Optional[str]:
+        return await session.reply(
+            tid, comment_id, user_id, self._text_of(message), owner
+        )
+
+    async def engage_many(
+        self, session: Session, actions: List[Dict[str, Any]]
+    ) -> List[Union[Optional[str], Exception]]:
+        prepared = []
+        for action in actions:
+            action = dict(action)
+            if "message" in action:
+                action["content"] = self._text_of(Message(action.pop("message")))
+            if "user_id" in action:
+                action["comment_uin"] = action.pop("user_id")
+            prepared.append(action)
+        return await session.engage_many(prepared)
+
+    async def delete(self, session: Session, tid: str) -> None:
+        await session.delete(tid)
+
+    async def cleanup(
+        self,
+        session: Session,
+        tids: Optional[List[str]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> CleanupReport:
+        if tids is None and since is None and until is None:
+            raise ValueError("Cleanup needs tids or a date range")
+        path = self.adapter_config.cleanup_path_of(session.bot_id)
+        return await Cleanup(session, path, tids, since, until).run()
+
+    async def archive(self, session: Session) -> ArchiveReport:
+        return await Archive(
+            session,
+            self.adapter_config.archive_path_of(session.bot_id),
+            self.adapter_config.archive_cursor_path_of(session.bot_id),
+            self.adapter_config.archive_media_dir,
+            self.adapter_config.archive_concurrency,
+        ).run()
+
+    async def query(self, session: Session) -> Optional[str]:
+        return session.qq_number
+
+    async def get_profile(self, session: Session) -> Dict[str, Any]:
+        return await session.get_profile()
+
+    async def get_posts(
+        self, session: Session, pos: int = 0, num: int = 20
+    ) -> List[Dict[str, Any]]:
+        return await session.get_posts(pos, num, cached=True)
+
+    async def get_post(self, session: Session, tid: str) -> Dict[str, Any]:
+        return await session.get_post(tid)
+
+    async def get_visitors(self, session: Session) -> Dict[str, Any]:
+        return await session.get_visitors()
+
+    async def state(self, session: Session) -> SessionState:
+        return session.state
 
-        return await self.session.publish(content, images)
+    async def stats(self) -> Dict[str, Dict[str, object]]:
+        return self.metrics.snapshot()
 
-    async def query(self) -> Optional[str]:
-        assert self.session
-        return self.session.qq_number
+    async def get_exchanges(self, session: Session) -> List[Dict[str, Any]]:
+        # the recent requests of the account, newest last
+        return [exchange.to_dict() for exchange in session.exchanges]
 
     @override
     async def _call_api(self, bot: Bot, api: str, **data: Any) -> Any:
         # log("DEBUG", f"Adapter _call_api: {bot} {api} {data}")
+        session = self._session_of(bot)
 
         if api == "publish":
-            return await self.publish(data["message"])
+            return await self.publish(
+                data["message"],
+                None if data.get("route") else session,
+                data.get("priority", Priority.NORMAL),
+            )
+        if api == "submit_publish":
+            return await self.submit_publish(
+                data["message"],
+                None if data.get("route") else session,
+                data.get("priority", Priority.NORMAL),
+            )
+        if api == "publish_many":
+            return await self.publish_many(
+                data["messages"], None if data.get("route") else session
+            )
+        if api == "schedule_publish":
+            return self.schedule_publish(
+                data["message"],
+                data["at"],
+                None if data.get("route") else session,
+                data.get("priority", Priority.NORMAL),
+            )
+        if api == "cancel_scheduled":
+            return self.cancel_scheduled(data["post_id"])
+        if api == "list_scheduled":
+            return self.list_scheduled(None if data.get("all") else session)
+        if api == "get_publish_job":
+            return self.get_publish_job(data["job_id"])
+        if api == "like":
+            return await self.like(session, data["tid"], data.get("owner"))
+        if api == "comment":
+            return await self.comment(
+                session, data["tid"], data["message"], data.get("owner")
+            )
+        if api == "reply":
+            return await self.reply(
+                session,
+                data["tid"],
+                data["comment_id"],
+                data["user_id"],
+                data["message"],
+                data.get("owner"),
+            )
+        if api == "engage_many":
+            return await self.engage_many(session, data["actions"])
+        if api == "delete":
+            return await self.delete(session, data["tid"])
+        if api == "cleanup":
+            return await self.cleanup(
+                session, data.get("tids"), data.get("since"), data.get("until")
+            )
+        if api == "archive":
+            return await self.archive(session)
         if api == "login":
-            return await self.login()
+            return await self.login(session)
         if api == "logout":
-            return await self.logout()
+            return await self.logout(session)
         if api == "query":
-            return await self.query()
+            return await self.query(session)
+        if api == "get_profile":
+            return await self.get_profile(session)
+        if api == "get_posts":
+            return await self.get_posts(
+                session, data.get("pos", 0), data.get("num", 20)
+            )
+        if api == "get_post":
+            return await self.get_post(session, data["tid"])
+        if api == "get_visitors":
+            return await self.get_visitors(session)
+        if api == "state":
+            return await self.state(session)
+        if api == "stats":
+            return await self.stats()
+        if api == "get_exchanges":
+            return await self.get_exchanges(session)
 
         raise ApiNotAvailable
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from .exception import UnexpectedResponse
+from .media import guess_mime
+from .session import Session
+from .utils import atomic_write_text, log, remove_file_if_exists
+
+# msglist pages are capped at 20 posts
+PAGE_SIZE = 20
+# comments kept with each post, Qzone caps the page anyway
+REPLY_PAGE = 100
+# urls of a picture from the largest down
+PICTURE_KEYS = ("url3", "url2", "url1", "smallurl")
+
+
+@dataclass
+class ArchiveReport:
+    path: str
+    posts: int = 0
+    media: int = 0
+    failed: Dict[str, str] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class Archive:
+    # Pages through the account newest first and appends every post to a
+    # JSONL file. Only one page and its media are held at a time; after each
+    # page the file is synced and the cursor saved, so a run cut short picks
+    # up where it stopped.
+
+    def __init__(
+        self,
+        session: Session,
+        path: Path,
+        cursor_path: Path,
+        media_dir: Path,
+        concurrency: int,
+    ) -> None:
+        self.session = session
+        self.path = path
+        self.cursor_path = cursor_path
+        self.media_dir = media_dir
+        self.report = ArchiveReport(str(path))
+        self.pos = 0
+        # creation time of the oldest post written so far, and the posts of
+        # that second, nothing orders posts within a second
+        self.last: Optional[int] = None
+        self.edge: Set[str] = set()
+        self.size = 0
+        self._downloads = asyncio.Semaphore(concurrency)
+
+    async def run(self) -> ArchiveReport:
+        await asyncio.to_thread(self._resume)
+        log("INFO", f"Archiving {self.session.bot_id} to {self.path}")
+        # posts deleted since the cursor was saved shift the rest up, so step
+        # back a page; posts written already are filtered out below, as are
+        # posts published while the archive runs
+        pos = max(0, self.pos - PAGE_SIZE)
+        while True:
+            posts = await self.session.get_posts(pos, PAGE_SIZE, REPLY_PAGE)
+            fresh = [post for post in posts if self._is_new(post)]
+            if fresh:
+                await self._write_page(fresh)
+            pos = self.pos = pos + len(posts)
+            if len(posts) < PAGE_SIZE:
+                break
+            await asyncio.to_thread(self._checkpoint)
+        await asyncio.to_thread(remove_file_if_exists, self.cursor_path)
+        log(
+            "INFO",
+            f"Archived {self.report.posts} posts and {self.report.media} media "
+            f"of {self.session.bot_id}",
+        )
+        return self.report
+
+    def _resume(self) -> None:
+        if not self.cursor_path.is_file():
+            # a finished archive is replaced, not appended to
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_bytes(b"")
+            return
+        try:
+            data = json.loads(self.cursor_path.read_text(encoding="utf-8"))
+            self.pos = data["pos"]
+            self.size = data["size"]
+            self.last = data["last"]
+            self.edge = set(data["edge"])
+            self.report = ArchiveReport(
+                str(self.path), data["posts"], data["media"], data["failed"]
+            )
+        except (json.decoder.JSONDecodeError, TypeError, KeyError) as err:
+            log(
+                "WARNING",
+                f"Archive cursor {self.cursor_path} failed to parse: "
+                f"<{type(err).__name__}: {err}>",
+            )
+            self.pos, self.size, self.last, self.edge = 0, 0, None, set()
+            self.report = ArchiveReport(str(self.path))
+        # drop whatever was written after the last checkpoint
+        with open(self.path, "ab") as file:
+            file.truncate(self.size)
+        log("INFO", f"Resuming archive of {self.session.bot_id} at post {self.pos}")
+
+    def _checkpoint(self) -> None:
+        atomic_write_text(
+            self.cursor_path,
+            json.dumps(
+                {
+                    "pos": self.pos,
+                    "size": self.size,
+                    "last": self.last,
+                    "edge": sorted(self.edge),
+                    "posts": self.report.posts,
+                    "media": self.report.media,
+                    "failed": self.report.failed,
+                }
+            ),
+        )
+
+    async def _write_page(self, posts: List[Dict[str, Any]]) -> None:
+        media = await asyncio.gather(*(self._download_all(post) for post in posts))
+        lines = [
+            json.dumps({**post, "media": saved}, ensure_ascii=False)
+            for post, saved in zip(posts, media)
+        ]
+        self.size = await asyncio.to_thread(self._append, lines)
+        self.report.posts += len(posts)
+        for post in posts:
+            created = post.get("created_time", 0)
+            if self.last is None or created < self.last:
+                self.last, self.edge = created, set()
+            self.edge.add(str(post["tid"]))
+
+    def _is_new(self, post: Dict[str, Any]) -> bool:
+        if self.last is None:
+            return True
+        created = post.get("created_time", 0)
+        return created < self.last or (
+            created == self.last and str(post["tid"]) not in self.edge
+        )
+
+    def _append(self, lines: List[str]) -> int:
+        with open(self.path, "ab") as file:
+            file.write("".join(line + "\n" for line in lines).encode("utf-8"))
+            file.flush()
+            os.fsync(file.fileno())
+            return file.tell()
+
+    async def _download_all(self, post: Dict[str, Any]) -> List[Dict[str, Any]]:
+        urls = []
+        for picture in post.get("pic") or []:
+            url = next((picture[key] for key in PICTURE_KEYS if picture.get(key)), None)
+            if url:
+                urls.append(url)
+        return list(await asyncio.gather(*(self._download(url) for url in urls)))
+
+    async def _download(self, url: str) -> Dict[str, Any]:
+        async with self._downloads:
+            try:
+                response = await self.session.get(url)
+                if response.status_code != 200:
+                    raise UnexpectedResponse(f"HTTP {response.status_code}")
+                assert isinstance(response.content, bytes)
+                path = await asyncio.to_thread(self._store, response.content)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                log("WARNING", f"Failed to download {url}", err)
+                self.report.failed[url] = repr(err)
+                return {"url": url, "error": repr(err)}
+        self.report.media += 1
+        return {"url": url, "path": str(path.relative_to(self.media_dir))}
+
+    def _store(self, data: bytes) -> Path:
+        digest = hashlib.sha256(data).hexdigest()
+        extension = mimetypes.guess_extension(guess_mime(data, "")) or ""
+        path = self.media_dir / digest[:2] / (digest + extension)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".tmp-{path.name}")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return path
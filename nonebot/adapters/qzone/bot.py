@@ -1,12 +1,22 @@
-from typing import Any, Union
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Union
 from typing_extensions import override
 
 from nonebot.adapters import Bot as BaseBot
 from nonebot.message import handle_event
 
-from .event import Event, PublishEvent, LoginEvent, LogoutEvent, QueryEvent
+from .event import (
+    Event,
+    PublishEvent,
+    LoginEvent,
+    LogoutEvent,
+    QueryEvent,
+    CommentEvent,
+    ReplyEvent,
+)
 from .message import Message, MessageSegment
-from .utils import log
+from .publisher import Priority
+from .utils import log_lazy
 from .exception import ApiNotAvailable
 
 
@@ -18,17 +28,28 @@ class Bot(BaseBot):
         message: Union[str, Message, MessageSegment],
         **kwargs,
     ) -> Any:
-        log("DEBUG", f"Received {event}")
+        log_lazy("DEBUG", lambda: f"Received {event}")
 
         if isinstance(event, PublishEvent):
             assert message
-            return await self.publish(message)
+            return await self.publish(message, **kwargs)
         if isinstance(event, LoginEvent):
             return await self.login()
         if isinstance(event, LogoutEvent):
             return await self.logout()
         if isinstance(event, QueryEvent):
             return await self.query()
+        if isinstance(event, ReplyEvent):
+            # stay in the thread of the comment that was replied to
+            return await self.reply(
+                event.tid,
+                event.comment_id,
+                event.comment_user_id,
+                Message(f"@{{uin:{event.user_id},nick:{event.nickname},auto:1}} ")
+                + message,
+            )
+        if isinstance(event, CommentEvent):
+            return await self.reply(event.tid, event.comment_id, event.user_id, message)
 
         raise ApiNotAvailable
 
@@ -39,8 +60,107 @@ class Bot(BaseBot):
     async def call_api(self, api: str, **data: Any) -> Any:
         return await super().call_api(api, **data)
 
-    async def publish(self, message: Union[str, Message, MessageSegment]) -> Any:
-        return await self.call_api("publish", message=Message(message))
+    async def publish(
+        self,
+        message: Union[str, Message, MessageSegment],
+        route: bool = False,
+        priority: Priority = Priority.NORMAL,
+    ) -> Any:
+        return await self.call_api(
+            "publish", message=Message(message), route=route, priority=priority
+        )
+
+    async def submit_publish(
+        self,
+        message: Union[str, Message, MessageSegment],
+        route: bool = False,
+        priority: Priority = Priority.NORMAL,
+    ) -> Any:
+        return await self.call_api(
+            "submit_publish", message=Message(message), route=route, priority=priority
+        )
+
+    async def publish_many(
+        self,
+        messages: Iterable[Union[str, Message, MessageSegment]],
+        route: bool = False,
+    ) -> Any:
+        return await self.call_api(
+            "publish_many",
+            messages=[Message(message) for message in messages],
+            route=route,
+        )
+
+    async def schedule_publish(
+        self,
+        message: Union[str, Message, MessageSegment],
+        at: datetime,
+        route: bool = False,
+        priority: Priority = Priority.NORMAL,
+    ) -> Any:
+        return await self.call_api(
+            "schedule_publish",
+            message=Message(message),
+            at=at,
+            route=route,
+            priority=priority,
+        )
+
+    async def cancel_scheduled(self, post_id: str) -> Any:
+        return await self.call_api("cancel_scheduled", post_id=post_id)
+
+    async def list_scheduled(self, all: bool = False) -> Any:
+        return await self.call_api("list_scheduled", all=all)
+
+    async def get_publish_job(self, job_id: str) -> Any:
+        return await self.call_api("get_publish_job", job_id=job_id)
+
+    async def like(self, tid: str, owner: Optional[str] = None) -> Any:
+        return await self.call_api("like", tid=tid, owner=owner)
+
+    async def comment(
+        self,
+        tid: str,
+        message: Union[str, Message, MessageSegment],
+        owner: Optional[str] = None,
+    ) -> Any:
+        return await self.call_api(
+            "comment", tid=tid, message=Message(message), owner=owner
+        )
+
+    async def reply(
+        self,
+        tid: str,
+        comment_id: str,
+        user_id: str,
+        message: Union[str, Message, MessageSegment],
+        owner: Optional[str] = None,
+    ) -> Any:
+        return await self.call_api(
+            "reply",
+            tid=tid,
+            comment_id=comment_id,
+            user_id=user_id,
+            message=Message(message),
+            owner=owner,
+        )
+
+    async def engage_many(self, actions: Iterable[Dict[str, Any]]) -> Any:
+        return await self.call_api("engage_many", actions=list(actions))
+
+    async def delete(self, tid: str) -> Any:
+        return await self.call_api("delete", tid=tid)
+
+    async def cleanup(
+        self,
+        tids: Optional[List[str]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Any:
+        return await self.call_api("cleanup", tids=tids, since=since, until=until)
+
+    async def archive(self) -> Any:
+        return await self.call_api("archive")
 
     async def login(self) -> Any:
         return await self.call_api("login")
@@ -50,3 +170,24 @@ class Bot(BaseBot):
 
     async def query(self) -> Any:
         return await self.call_api("query")
+
+    async def get_profile(self) -> Any:
+        return await self.call_api("get_profile")
+
+    async def get_posts(self, pos: int = 0, num: int = 20) -> Any:
+        return await self.call_api("get_posts", pos=pos, num=num)
+
+    async def get_post(self, tid: str) -> Any:
+        return await self.call_api("get_post", tid=tid)
+
+    async def get_visitors(self) -> Any:
+        return await self.call_api("get_visitors")
+
+    async def state(self) -> Any:
+        return await self.call_api("state")
+
+    async def stats(self) -> Any:
+        return await self.call_api("stats")
+
+    async def get_exchanges(self) -> Any:
+        return await self.call_api("get_exchanges")
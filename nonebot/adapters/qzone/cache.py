@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+from .utils import log, atomic_write_text
+
+
+def image_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class UploadCache:
+    def __init__(
+        self, directory: Optional[Path], max_size: int, ttl: timedelta
+    ) -> None:
+        self._directory = directory
+        self._max_size = max_size
+        self._ttl = ttl.total_seconds()
+        self._scopes: Dict[str, "OrderedDict[str, Tuple[float, dict]]"] = {}
+        self._dirty: Set[str] = set()
+        self._lock = asyncio.Lock()
+
+    def _scope_path(self, scope: str) -> Optional[Path]:
+        if self._directory is None:
+            return None
+        return self._directory / f"{scope}.json"
+
+    def _read_scope(self, scope: str) -> "OrderedDict[str, Tuple[float, dict]]":
+        entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        path = self._scope_path(scope)
+        if path is None or not os.path.isfile(path):
+            return entries
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            now = time.time()
+            for digest, (expires, value) in data.items():
+                if expires > now:
+                    entries[digest] = (expires, value)
+        except (json.decoder.JSONDecodeError, TypeError, ValueError) as err:
+            log(
+                "WARNING",
+                f"Upload cache {path} failed to parse: <{type(err).__name__}: {err}>",
+            )
+        return entries
+
+    async def _entries(self, scope: str) -> "OrderedDict[str, Tuple[float, dict]]":
+        if scope not in self._scopes:
+            async with self._lock:
+                if scope not in self._scopes:
+                    self._scopes[scope] = await asyncio.to_thread(
+                        self._read_scope, scope
+                    )
+        return self._scopes[scope]
+
+    async def get(self, scope: str, digest: str) -> Optional[dict]:
+        entries = await self._entries(scope)
+        entry = entries.get(digest)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.time():
+            del entries[digest]
+            self._dirty.add(scope)
+            return None
+        entries.move_to_end(digest)
+        return value
+
+    async def put(self, scope: str, digest: str, value: dict) -> None:
+        entries = await self._entries(scope)
+        entries[digest] = (time.time() + self._ttl, value)
+        entries.move_to_end(digest)
+        while len(entries) > self._max_size:
+            entries.popitem(last=False)
+        self._dirty.add(scope)
+
+    async def flush(self) -> None:
+        if self._directory is None:
+            self._dirty.clear()
+            return
+        for scope in list(self._dirty):
+            # cleared before the write so a put meanwhile marks it again
+            self._dirty.discard(scope)
+            path = self._scope_path(scope)
+            assert path
+            text = json.dumps(dict(self._scopes.get(scope, {})))
+            try:
+                await asyncio.to_thread(atomic_write_text, path, text)
+            except OSError as err:
+                log("ERROR", f"Failed to write {path}", err)
+                # the next flush tries again
+                self._dirty.add(scope)
@@ -0,0 +1,169 @@
+import asyncio
+import json
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from .exception import CircuitOpen, QzoneApiError, Throttled
+from .session import Session
+from .utils import log, DebouncedWriter
+
+# msglist pages are capped at 20 posts
+PAGE_SIZE = 20
+# retries of a delete that may succeed later, before leaving it to a resume
+RETRIES = 3
+
+
+def _retryable(err: Exception) -> bool:
+    # answers other than throttling won't change on a retry
+    return not isinstance(err, QzoneApiError) or isinstance(err, Throttled)
+
+
+@dataclass
+class CleanupReport:
+    deleted: int = 0
+    failed: Dict[str, str] = field(default_factory=dict)
+    pending: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class Cleanup:
+    def __init__(
+        self,
+        session: Session,
+        path: Path,
+        tids: Optional[List[str]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> None:
+        self.session = session
+        self.path = path
+        self.spec = {
+            "tids": sorted(tids) if tids is not None else None,
+            "since": since.timestamp() if since else None,
+            "until": until.timestamp() if until else None,
+        }
+        self.pending: Optional[Set[str]] = None
+        self.report = CleanupReport()
+        self._writer = DebouncedWriter(path, 1)
+
+    async def run(self) -> CleanupReport:
+        await asyncio.to_thread(self._resume)
+        try:
+            if self.pending is None:
+                self.pending = await self._collect()
+                self._save()
+            self.report.pending = len(self.pending)
+            log("INFO", f"Cleanup of {self.session.bot_id}: {len(self.pending)} posts")
+            queue = deque(sorted(self.pending))
+            workers = min(self.session.config.engage_concurrency, len(queue))
+            await asyncio.gather(*(self._work(queue) for _ in range(workers)))
+        finally:
+            await self._writer.flush()
+        if self.pending:
+            log(
+                "WARNING",
+                f"Cleanup of {self.session.bot_id} left {len(self.pending)} posts "
+                "for the next run",
+            )
+            return self.report
+        # finished, nothing left to resume
+        self._writer.schedule_delete()
+        await self._writer.flush()
+        return self.report
+
+    def _resume(self) -> None:
+        if not self.path.is_file():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("spec") != self.spec:
+                log("INFO", f"Discarding checkpoint of a different cleanup {self.path}")
+                return
+            pending = set(data["pending"])
+            report = CleanupReport(data["deleted"], dict(data["failed"]))
+        except (
+            json.decoder.JSONDecodeError,
+            TypeError,
+            KeyError,
+            AttributeError,
+            ValueError,
+        ) as err:
+            log(
+                "WARNING",
+                f"Cleanup checkpoint {self.path} failed to parse: "
+                f"<{type(err).__name__}: {err}>",
+            )
+            return
+        self.pending, self.report = pending, report
+        log("INFO", f"Resuming cleanup, {len(self.pending)} posts left")
+
+    def _save(self) -> None:
+        assert self.pending is not None
+        snapshot = {
+            "spec": self.spec,
+            "pending": sorted(self.pending),
+            "deleted": self.report.deleted,
+            "failed": dict(self.report.failed),
+        }
+        self._writer.schedule(lambda: json.dumps(snapshot))
+
+    async def _collect(self) -> Set[str]:
+        if self.spec["tids"] is not None:
+            return set(self.spec["tids"])
+        since, until = self.spec["since"], self.spec["until"]
+        tids: Set[str] = set()
+        pos = 0
+        while True:
+            posts = await self.session.get_posts(pos, PAGE_SIZE)
+            for post in posts:
+                created = post.get("created_time", 0)
+                if (since is None or created >= since) and (
+                    until is None or created < until
+                ):
+                    tids.add(str(post["tid"]))
+            # newest first, so nothing older can match anymore
+            if len(posts) < PAGE_SIZE or (
+                since is not None and posts[-1].get("created_time", 0) < since
+            ):
+                return tids
+            pos += len(posts)
+
+    async def _work(self, queue: Deque[str]) -> None:
+        while queue:
+            await self._delete(queue.popleft())
+
+    async def _delete(self, tid: str) -> None:
+        assert self.pending is not None
+        attempt = 0
+        while True:
+            try:
+                await self.session.delete(tid)
+            except asyncio.CancelledError:
+                raise
+            except CircuitOpen as err:
+                # nothing was sent, wait out the breaker
+                await asyncio.sleep(err.retry_after)
+                continue
+            except Exception as err:
+                if _retryable(err) and attempt < RETRIES:
+                    attempt += 1
+                    await asyncio.sleep(0.5 * 2**attempt)
+                    continue
+                log("WARNING", f"Failed to delete {tid}", err)
+                self.report.failed[tid] = repr(err)
+                if _retryable(err):
+                    # stays pending, the next run tries again
+                    self._save()
+                    return
+            else:
+                self.report.deleted += 1
+                self.report.failed.pop(tid, None)
+            break
+        self.pending.discard(tid)
+        self.report.pending = len(self.pending)
+        self._save()
@@ -1,19 +1,117 @@
 import os
+from datetime import timedelta
 from pathlib import Path
+from typing import Dict, List, Optional
 
 from pydantic import Field, BaseModel, validator
 
-
 ADAPTER_NAME = "Qzone"
 
 
 class Config(BaseModel):
     bot_id: str = Field(default="qzone", alias="qzone_bot_id")
+    accounts: List[str] = Field(default_factory=list, alias="qzone_accounts")
     cache_path: Path = Field(
         default=Path(__file__).parent / "cache",
         validate_default=True,
         alias="qzone_cache_path",
     )
+    upload_concurrency: int = Field(default=3, alias="qzone_upload_concurrency")
+    upload_hosts: List[str] = Field(
+        default_factory=lambda: [
+            "https://up.qzone.qq.com/cgi-bin/upload/cgi_upload_image",
+            "https://upbak.photo.qzone.qq.com/cgi-bin/upload/cgi_upload_image",
+        ],
+        alias="qzone_upload_hosts",
+    )
+    upload_hedge_percentile: Optional[float] = Field(
+        default=None, alias="qzone_upload_hedge_percentile"
+    )
+    upload_cache_size: int = Field(default=512, alias="qzone_upload_cache_size")
+    upload_cache_ttl: timedelta = Field(
+        default=timedelta(days=7), alias="qzone_upload_cache_ttl"
+    )
+    upload_cache_persist: bool = Field(default=True, alias="qzone_upload_cache_persist")
+    upload_slice_threshold: Optional[int] = Field(
+        default=4 * 1024 * 1024, alias="qzone_upload_slice_threshold"
+    )
+    upload_slice_concurrency: int = Field(
+        default=4, alias="qzone_upload_slice_concurrency"
+    )
+    upload_slice_retries: int = Field(default=3, alias="qzone_upload_slice_retries")
+    video_cover: bool = Field(default=True, alias="qzone_video_cover")
+    ffmpeg_path: str = Field(default="ffmpeg", alias="qzone_ffmpeg_path")
+    auto_login: bool = Field(default=True, alias="qzone_auto_login")
+    cookie_save_delay: timedelta = Field(
+        default=timedelta(seconds=2), alias="qzone_cookie_save_delay"
+    )
+    http_pool: bool = Field(default=True, alias="qzone_http_pool")
+    http2: bool = Field(default=True, alias="qzone_http2")
+    http_max_connections: int = Field(default=20, alias="qzone_http_max_connections")
+    http_max_keepalive: int = Field(default=10, alias="qzone_http_max_keepalive")
+    http_keepalive_expiry: timedelta = Field(
+        default=timedelta(seconds=60), alias="qzone_http_keepalive_expiry"
+    )
+    endpoint_timeouts: Dict[str, float] = Field(
+        default_factory=lambda: {
+            "cgi_upload_image": 60.0,
+            "FileUpload": 30.0,
+            "emotion_cgi_publish_v6": 30.0,
+        },
+        alias="qzone_endpoint_timeouts",
+    )
+    exchange_log_size: int = Field(default=50, alias="qzone_exchange_log_size")
+    read_cache_ttl: timedelta = Field(
+        default=timedelta(seconds=30), alias="qzone_read_cache_ttl"
+    )
+    read_cache_size: int = Field(default=256, alias="qzone_read_cache_size")
+    archive_concurrency: int = Field(default=8, alias="qzone_archive_concurrency")
+    # off unless a path is set, the labels carry account numbers
+    metrics_path: Optional[str] = Field(default=None, alias="qzone_metrics_path")
+    metrics_token: Optional[str] = Field(default=None, alias="qzone_metrics_token")
+    route_penalty: timedelta = Field(
+        default=timedelta(minutes=1), alias="qzone_route_penalty"
+    )
+    publish_rate: float = Field(default=0.2, alias="qzone_publish_rate")
+    publish_burst: int = Field(default=3, alias="qzone_publish_burst")
+    publish_prefetch: int = Field(default=2, alias="qzone_publish_prefetch")
+    publish_workers: int = Field(default=2, alias="qzone_publish_workers")
+    publish_queue_size: int = Field(default=1000, alias="qzone_publish_queue_size")
+    publish_queue_block: bool = Field(default=True, alias="qzone_publish_queue_block")
+    publish_queue_persist: bool = Field(
+        default=True, alias="qzone_publish_queue_persist"
+    )
+    image_preprocess: bool = Field(default=False, alias="qzone_image_preprocess")
+    image_max_side: int = Field(default=2048, alias="qzone_image_max_side")
+    image_quality: int = Field(default=85, alias="qzone_image_quality")
+    image_min_bytes: int = Field(default=256 * 1024, alias="qzone_image_min_bytes")
+    image_workers: int = Field(default=2, alias="qzone_image_workers")
+    feed_poll: bool = Field(default=False, alias="qzone_feed_poll")
+    feed_posts: int = Field(default=10, alias="qzone_feed_posts")
+    feed_interval_min: timedelta = Field(
+        default=timedelta(seconds=5), alias="qzone_feed_interval_min"
+    )
+    feed_interval_max: timedelta = Field(
+        default=timedelta(minutes=2), alias="qzone_feed_interval_max"
+    )
+    feed_save_delay: timedelta = Field(
+        default=timedelta(seconds=2), alias="qzone_feed_save_delay"
+    )
+    engage_concurrency: int = Field(default=4, alias="qzone_engage_concurrency")
+    engage_coalesce: timedelta = Field(
+        default=timedelta(seconds=3), alias="qzone_engage_coalesce"
+    )
+    schedule_prefetch: timedelta = Field(
+        default=timedelta(minutes=10), alias="qzone_schedule_prefetch"
+    )
+    schedule_persist: bool = Field(default=True, alias="qzone_schedule_persist")
+    session_store: str = Field(default="file", alias="qzone_session_store")
+    adaptive_throttle: bool = Field(default=True, alias="qzone_adaptive_throttle")
+    throttle_codes: List[int] = Field(default=[-10000], alias="qzone_throttle_codes")
+    circuit_threshold: int = Field(default=5, alias="qzone_circuit_threshold")
+    circuit_reset: timedelta = Field(
+        default=timedelta(minutes=1), alias="qzone_circuit_reset"
+    )
 
     @validator("cache_path")
     @classmethod
@@ -24,6 +122,71 @@ class Config(BaseModel):
             os.makedirs(v)
         return v
 
+    @validator(
+        "upload_concurrency",
+        "publish_burst",
+        "publish_workers",
+        "circuit_threshold",
+        "image_max_side",
+        "image_workers",
+        "feed_posts",
+        "engage_concurrency",
+        "archive_concurrency",
+        "upload_slice_concurrency",
+    )
+    @classmethod
+    def is_positive(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("value must be at least 1")
+        return v
+
+    @validator("upload_hosts")
+    @classmethod
+    def is_not_empty(cls, v: List[str]) -> List[str]:
+        if not v:
+            raise ValueError("'upload_hosts' must not be empty")
+        # the upload form carries skey and p_skey
+        if not all(url.startswith("https://") for url in v):
+            raise ValueError("'upload_hosts' must all be https urls")
+        return v
+
+    @validator("upload_hedge_percentile")
+    @classmethod
+    def is_percentile(cls, v: Optional[float]) -> Optional[float]:
+        if v is not None and not 1 <= v <= 99:
+            raise ValueError(
+                "'upload_hedge_percentile' must be between 1 and 99, e.g. 95"
+            )
+        return v
+
+    @validator("session_store")
+    @classmethod
+    def is_store(cls, v: str) -> str:
+        if v not in ("file", "sqlite") and not v.startswith(("sqlite:", "redis://")):
+            raise ValueError(
+                "'session_store' must be 'file', 'sqlite', 'sqlite:<path>' "
+                "or 'redis://host:port/db'"
+            )
+        return v
+
+    @validator("image_quality")
+    @classmethod
+    def is_quality(cls, v: int) -> int:
+        if not 1 <= v <= 95:
+            raise ValueError("'image_quality' must be between 1 and 95")
+        return v
+
+    @validator("publish_rate")
+    @classmethod
+    def is_positive_rate(cls, v: float) -> float:
+        if v <= 0:
+            raise ValueError("'publish_rate' must be greater than 0")
+        return v
+
+    @property
+    def account_ids(self) -> List[str]:
+        return self.accounts or [self.bot_id]
+
     @property
     def qrcode_path(self) -> Path:
         return self.cache_path / "qrcode.png"
@@ -32,6 +195,48 @@ class Config(BaseModel):
     def cookie_path(self) -> Path:
         return self.cache_path / "cookies"
 
+    def qrcode_path_of(self, bot_id: str) -> Path:
+        if bot_id == self.bot_id:
+            return self.qrcode_path
+        return self.cache_path / f"qrcode-{bot_id}.png"
+
+    def cookie_path_of(self, bot_id: str) -> Path:
+        if bot_id == self.bot_id:
+            return self.cookie_path
+        return self.cache_path / f"cookies-{bot_id}"
+
+    @property
+    def upload_cache_dir(self) -> Path:
+        return self.cache_path / "uploads"
+
+    @property
+    def upload_slice_dir(self) -> Path:
+        return self.cache_path / "uploads" / "slices"
+
+    @property
+    def publish_queue_path(self) -> Path:
+        return self.cache_path / "publish-queue.json"
+
+    @property
+    def schedule_path(self) -> Path:
+        return self.cache_path / "schedule.json"
+
+    def cleanup_path_of(self, bot_id: str) -> Path:
+        return self.cache_path / f"cleanup-{bot_id}.json"
+
+    def feed_cursor_path_of(self, bot_id: str) -> Path:
+        return self.cache_path / f"feed-{bot_id}.json"
+
+    def archive_path_of(self, bot_id: str) -> Path:
+        return self.cache_path / "archive" / f"{bot_id}.jsonl"
+
+    def archive_cursor_path_of(self, bot_id: str) -> Path:
+        return self.cache_path / "archive" / f".{bot_id}.cursor.json"
+
+    @property
+    def archive_media_dir(self) -> Path:
+        return self.cache_path / "archive" / "media"
+
     class Config:
         extra = "ignore"
         allow_population_by_field_name = True
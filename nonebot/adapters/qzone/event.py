@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing_extensions import override
 
 from nonebot.adapters import Event as BaseEvent
@@ -74,3 +75,81 @@ class QueryEvent(Event):
     @override
     def get_type(self) -> str:
         return "query"
+
+
+class FeedEvent(Event):
+    tid: str
+    user_id: str
+    nickname: str
+    time: datetime
+
+    @override
+    def get_user_id(self) -> str:
+        return self.user_id
+
+    @override
+    def get_session_id(self) -> str:
+        return f"{self.tid}_{self.user_id}"
+
+
+class CommentEvent(FeedEvent):
+    comment_id: str
+    message: Message
+
+    @override
+    def get_event_name(self) -> str:
+        return "comment"
+
+    @override
+    def get_type(self) -> str:
+        return "message"
+
+    @override
+    def get_event_description(self) -> str:
+        return escape_tag(
+            f"Comment {self.comment_id} on {self.tid} from "
+            f"{self.nickname}({self.user_id}): {self.message}"
+        )
+
+    @override
+    def get_message(self) -> Message:
+        return self.message
+
+    @override
+    def is_tome(self) -> bool:
+        return True
+
+
+class ReplyEvent(CommentEvent):
+    reply_id: str
+    comment_user_id: str
+    to_me: bool = False
+
+    @override
+    def get_event_name(self) -> str:
+        return "reply"
+
+    @override
+    def get_event_description(self) -> str:
+        return escape_tag(
+            f"Reply {self.reply_id} to comment {self.comment_id} on {self.tid} "
+            f"from {self.nickname}({self.user_id}): {self.message}"
+        )
+
+    @override
+    def is_tome(self) -> bool:
+        return self.to_me
+
+
+class LikeEvent(FeedEvent):
+    @override
+    def get_event_name(self) -> str:
+        return "like"
+
+    @override
+    def get_type(self) -> str:
+        return "notice"
+
+    @override
+    def get_event_description(self) -> str:
+        return escape_tag(f"Like on {self.tid} from {self.nickname}({self.user_id})")
@@ -22,3 +22,72 @@ class NotLoggedIn(QzoneAdapterException):
 
 class AlreadyLoggedIn(QzoneAdapterException):
     pass
+
+
+class PublishQueueFull(QzoneAdapterException):
+    pass
+
+
+class QzoneApiError(QzoneAdapterException):
+    @override
+    def __init__(self, code: int, message: str = "") -> None:
+        super().__init__()
+        self.code = code
+        self.message = message
+
+    def __repr__(self) -> str:
+        return f"<QzoneApiError code={self.code} message={self.message!r}>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+
+class HostUnavailable(QzoneAdapterException):
+    @override
+    def __init__(self, url: str, reason: str) -> None:
+        super().__init__()
+        self.url = url
+        self.reason = reason
+
+    def __repr__(self) -> str:
+        return f"<HostUnavailable url={self.url!r} reason={self.reason!r}>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+
+class Throttled(QzoneApiError):
+    pass
+
+
+class AuthExpired(QzoneApiError):
+    pass
+
+
+class UnexpectedResponse(QzoneAdapterException):
+    @override
+    def __init__(self, reason: str, content: bytes = b"") -> None:
+        super().__init__()
+        self.reason = reason
+        self.content = content
+
+    def __repr__(self) -> str:
+        return (
+            f"<UnexpectedResponse reason={self.reason!r} content={self.content[:64]!r}>"
+        )
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+
+class CircuitOpen(QzoneAdapterException):
+    @override
+    def __init__(self, retry_after: float) -> None:
+        super().__init__()
+        self.retry_after = retry_after
+
+    def __repr__(self) -> str:
+        return f"<CircuitOpen retry_after={self.retry_after:.1f}>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
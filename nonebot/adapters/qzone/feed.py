@@ -0,0 +1,278 @@
+import asyncio
+import json
+import re
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Type
+
+from .config import Config
+from .event import CommentEvent, FeedEvent, LikeEvent, ReplyEvent
+from .message import Message
+from .session import Session
+from .utils import log, DebouncedWriter
+
+MENTION = re.compile(r"@\{uin:(\d+),nick:([^,}]*)[^}]*\}")
+# comments fetched with each post, Qzone caps the page anyway
+REPLY_PAGE = 100
+
+
+def clean_content(content: str) -> Tuple[str, Set[str]]:
+    # mentions come as @{uin:..,nick:..,who:1}, keep the nickname only
+    mentioned = {match.group(1) for match in MENTION.finditer(content)}
+    return MENTION.sub(lambda match: f"@{match.group(2)}", content), mentioned
+
+
+def _comment_count(post: Dict[str, Any]) -> int:
+    return int(post.get("cmtnum") or 0)
+
+
+class PostCursor:
+    def __init__(
+        self,
+        seen: Optional[List[str]] = None,
+        likes: int = 0,
+        likers: Optional[List[str]] = None,
+        comments: int = 0,
+    ) -> None:
+        self.seen: Set[str] = set(seen or ())
+        self.likes = likes
+        self.likers: Set[str] = set(likers or ())
+        self.comments = comments
+
+    def dump(self) -> Dict[str, Any]:
+        return {
+            "seen": sorted(self.seen),
+            "likes": self.likes,
+            "likers": sorted(self.likers),
+            "comments": self.comments,
+        }
+
+    @classmethod
+    def load(cls, data: Dict[str, Any]) -> "PostCursor":
+        return cls(
+            data.get("seen"),
+            data.get("likes", 0),
+            data.get("likers"),
+            data.get("comments", 0),
+        )
+
+
+class FeedPoller:
+    # replies to older comments leave a post's comment count alone, every
+    # FullSweep-th poll fetches all posts with their comments to find them
+    FullSweep = 10
+
+    def __init__(
+        self,
+        session: Session,
+        config: Config,
+        dispatch: Callable[[FeedEvent], Awaitable[None]],
+    ) -> None:
+        self.session = session
+        self.dispatch = dispatch
+        self.posts = config.feed_posts
+        self.interval_min = config.feed_interval_min.total_seconds()
+        self.interval_max = config.feed_interval_max.total_seconds()
+        self.interval = self.interval_min
+        self.path = config.feed_cursor_path_of(session.bot_id)
+        self._writer = DebouncedWriter(
+            self.path, config.feed_save_delay.total_seconds()
+        )
+        self.cursor: Optional[Dict[str, PostCursor]] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._handlers: Set["asyncio.Task[None]"] = set()
+        self._polls = 0
+
+    def start(self) -> None:
+        self._load()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        for task in (self._task, *self._handlers):
+            if task:
+                task.cancel()
+        await asyncio.gather(
+            *(task for task in (self._task, *self._handlers) if task),
+            return_exceptions=True,
+        )
+        await self._writer.flush()
+
+    def _load(self) -> None:
+        if not self.path.is_file():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self.cursor = {
+                tid: PostCursor.load(post) for tid, post in data["posts"].items()
+            }
+        except (json.decoder.JSONDecodeError, TypeError, KeyError) as err:
+            log(
+                "WARNING",
+                f"Feed cursor {self.path} failed to parse: <{type(err).__name__}: {err}>",
+            )
+
+    def _save(self) -> None:
+        cursor = {tid: post.dump() for tid, post in (self.cursor or {}).items()}
+        self._writer.schedule(lambda: json.dumps({"posts": cursor}))
+
+    async def _run(self) -> None:
+        while True:
+            if not self.session.logged_in:
+                await asyncio.sleep(self.interval_max)
+                continue
+            try:
+                events = await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                log("WARNING", f"Feed poll of {self.session.bot_id} failed", err)
+                events = []
+            for event in events:
+                task = asyncio.create_task(self.dispatch(event))
+                self._handlers.add(task)
+                task.add_done_callback(self._handlers.discard)
+            # poll fast while people are active, back off while it's quiet
+            if events:
+                self.interval = self.interval_min
+            else:
+                self.interval = min(self.interval_max, self.interval * 1.5)
+            await asyncio.sleep(self.interval)
+
+    async def poll(self) -> List[FeedEvent]:
+        session = self.session
+        # the first poll only records where we are, history isn't replayed
+        baseline = self.cursor is None
+        previous = self.cursor or {}
+        self._polls += 1
+        full = baseline or self._polls >= self.FullSweep
+        if full:
+            self._polls = 0
+        posts = await session.get_posts(
+            num=self.posts, replies=REPLY_PAGE if full else 0
+        )
+        cursor = {
+            str(post["tid"]): previous.get(str(post["tid"])) or PostCursor()
+            for post in posts
+        }
+        if full:
+            detailed = posts
+        else:
+            # posts are newest first, comments are only fetched down to the
+            # last post whose comment count moved
+            depth = max(
+                (
+                    index + 1
+                    for index, post in enumerate(posts)
+                    if _comment_count(post) != cursor[str(post["tid"])].comments
+                ),
+                default=0,
+            )
+            detailed = (
+                await session.get_posts(num=depth, replies=REPLY_PAGE) if depth else []
+            )
+        counts = await session.get_like_counts(list(cursor))
+        # only posts whose like count grew need their likers listed
+        grown = [tid for tid, count in counts.items() if count > cursor[tid].likes]
+        likers = await asyncio.gather(*(session.get_likers(tid) for tid in grown))
+
+        # everything is fetched, a failure above leaves the cursor untouched
+        events: List[FeedEvent] = []
+        counted = False
+        for post in detailed:
+            tid = str(post["tid"])
+            # a post published between the two requests waits for the next poll
+            if tid not in cursor:
+                continue
+            events.extend(self._comments(tid, post, cursor[tid]))
+            counted |= cursor[tid].comments != _comment_count(post)
+            cursor[tid].comments = _comment_count(post)
+        for tid, liked in zip(grown, likers):
+            events.extend(self._likes(tid, liked, cursor[tid]))
+        for tid, count in counts.items():
+            cursor[tid].likes = count
+
+        changed = (
+            baseline or counted or bool(events) or cursor.keys() != previous.keys()
+        )
+        self.cursor = cursor
+        if changed:
+            self._save()
+        if baseline:
+            return []
+        for event in events:
+            self.session.metrics.feed_events.inc(
+                type=event.get_event_name(), account=session.bot_id
+            )
+        return events
+
+    def _comments(
+        self, tid: str, post: Dict[str, Any], state: PostCursor
+    ) -> List[FeedEvent]:
+        events: List[FeedEvent] = []
+        for comment in post.get("commentlist") or []:
+            comment_id = str(comment["tid"])
+            if comment_id not in state.seen:
+                state.seen.add(comment_id)
+                event = self._comment(CommentEvent, tid, comment, comment_id)
+                if event:
+                    events.append(event)
+            for reply in comment.get("list_3") or []:
+                reply_id = f"{comment_id}.{reply['tid']}"
+                if reply_id in state.seen:
+                    continue
+                state.seen.add(reply_id)
+                event = self._comment(
+                    ReplyEvent,
+                    tid,
+                    reply,
+                    comment_id,
+                    reply_id=str(reply["tid"]),
+                    comment_user_id=str(comment["uin"]),
+                )
+                if event:
+                    events.append(event)
+        return events
+
+    def _comment(
+        self,
+        cls: Type[CommentEvent],
+        tid: str,
+        data: Dict[str, Any],
+        comment_id: str,
+        **extra: Any,
+    ) -> Optional[FeedEvent]:
+        user_id = str(data["uin"])
+        if user_id == self.session.qq_number:
+            return None
+        content, mentioned = clean_content(data.get("content", ""))
+        if cls is ReplyEvent:
+            extra["to_me"] = self.session.qq_number in mentioned
+        return cls(
+            tid=tid,
+            user_id=user_id,
+            nickname=data.get("name", ""),
+            time=datetime.fromtimestamp(data.get("create_time", 0)),
+            comment_id=comment_id,
+            message=Message(content),
+            **extra,
+        )
+
+    def _likes(
+        self, tid: str, likers: List[Dict[str, Any]], state: PostCursor
+    ) -> List[FeedEvent]:
+        now = datetime.now()
+        events: List[FeedEvent] = []
+        for liker in likers:
+            user_id = str(liker["fuin"])
+            if user_id in state.likers:
+                continue
+            state.likers.add(user_id)
+            if user_id != self.session.qq_number:
+                events.append(
+                    LikeEvent(
+                        tid=tid,
+                        user_id=user_id,
+                        nickname=liker.get("nick", ""),
+                        time=now,
+                    )
+                )
+        return events
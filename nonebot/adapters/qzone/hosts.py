@@ -0,0 +1,72 @@
+import statistics
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+
+class HostHealth:
+    FailureMemory = 300.0
+
+    def __init__(self, url: str, alpha: float = 0.2) -> None:
+        self.url = url
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.last_failure: Optional[float] = None
+
+    def _sample(self, latency: float) -> None:
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.alpha * (latency - self.latency)
+
+    def record_success(self, latency: float) -> None:
+        self._sample(latency)
+        self.failures = 0
+
+    def record_loss(self, latency: float) -> None:
+        # lost a hedge race and was cancelled, it would have taken at least this
+        self._sample(latency)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.last_failure = time.monotonic()
+
+    def recent_failures(self) -> int:
+        # old failures are forgiven so a host gets another try
+        if (
+            self.last_failure is not None
+            and time.monotonic() - self.last_failure > self.FailureMemory
+        ):
+            return 0
+        return self.failures
+
+
+class HostSelector:
+    MinSamples = 20
+
+    def __init__(self, urls: List[str], window: int = 200) -> None:
+        self.hosts = [HostHealth(url) for url in urls]
+        self._latencies: Deque[float] = deque(maxlen=window)
+
+    def observe(self, latency: float) -> None:
+        self._latencies.append(latency)
+
+    def ranked(self) -> List[HostHealth]:
+        # failing hosts go last, then the faster first; unmeasured hosts count
+        # as the slowest measured one, so backups don't jump the primary before
+        # they have proven faster and configuration order breaks ties
+        measured = [host.latency for host in self.hosts if host.latency is not None]
+        default = max(measured, default=0.0)
+
+        def key(host: HostHealth) -> Tuple[int, float]:
+            latency = host.latency if host.latency is not None else default
+            return host.recent_failures(), latency
+
+        return sorted(self.hosts, key=key)
+
+    def hedge_delay(self, percentile: float) -> Optional[float]:
+        if len(self._latencies) < self.MinSamples:
+            return None
+        cuts = statistics.quantiles(self._latencies, n=100, method="inclusive")
+        return cuts[round(percentile) - 1]
@@ -0,0 +1,82 @@
+import asyncio
+import io
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from .config import Config
+from .utils import log, log_lazy
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover
+    Image = ImageOps = None
+
+
+def preprocess_image(data: bytes, max_side: int, quality: int) -> bytes:
+    # runs in a worker process, keep it free of adapter state
+    with Image.open(io.BytesIO(data)) as image:
+        if getattr(image, "is_animated", False):
+            return data
+        # bake the EXIF orientation in, the metadata itself isn't kept
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        output = io.BytesIO()
+        if image.mode in ("RGBA", "LA") or (
+            image.mode == "P" and "transparency" in image.info
+        ):
+            image.save(output, format="PNG", optimize=True)
+        else:
+            image.convert("RGB").save(
+                output, format="JPEG", quality=quality, optimize=True, progressive=True
+            )
+    return output.getvalue()
+
+
+class ImageProcessor:
+    def __init__(self, config: Config) -> None:
+        self.enabled = config.image_preprocess
+        self.max_side = config.image_max_side
+        self.quality = config.image_quality
+        self.min_bytes = config.image_min_bytes
+        self.workers = config.image_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        if self.enabled and Image is None:
+            log("WARNING", "Pillow is not installed, images are uploaded as is")
+            self.enabled = False
+
+    @property
+    def variant(self) -> str:
+        # settings the processed bytes depend on, part of the cache key
+        if not self.enabled:
+            return ""
+        return f"{self.max_side}x{self.quality}"
+
+    async def process(self, data: bytes) -> bytes:
+        if not self.enabled or len(data) < self.min_bytes:
+            return data
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+        try:
+            processed = await asyncio.get_running_loop().run_in_executor(
+                self._executor, preprocess_image, data, self.max_side, self.quality
+            )
+        except Exception as err:
+            log("WARNING", "Image preprocessing failed, uploading original", err)
+            return data
+        if len(processed) >= len(data):
+            # already well compressed, re-encoding only made it bigger
+            log_lazy(
+                "DEBUG",
+                lambda: f"Preprocessing grew image to {len(processed)} bytes, skipped",
+            )
+            return data
+        log(
+            "DEBUG",
+            f"Preprocessed image from {len(data)} to {len(processed)} bytes",
+        )
+        return processed
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
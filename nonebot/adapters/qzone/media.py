@@ -0,0 +1,196 @@
+import asyncio
+import base64
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Optional,
+    Tuple,
+    Union,
+)
+
+
+def guess_mime(data: bytes, default: str = "image/jpeg") -> str:
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.startswith(b"BM"):
+        return "image/bmp"
+    return default
+
+
+def to_data_uri(data: bytes, mime: str) -> str:
+    return f"data:{mime};base64,{base64.b64encode(data).decode()}"
+
+
+class MediaSource(ABC):
+    # sources are immutable handles, so message copies can share them
+    def __copy__(self) -> "MediaSource":
+        return self
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "MediaSource":
+        return self
+
+    @abstractmethod
+    async def read(self) -> bytes:
+        raise NotImplementedError
+
+    async def chunks(self, size: int) -> AsyncIterator[bytes]:
+        # sources held in memory anyway just slice what read() returns
+        data = await self.read()
+        for start in range(0, len(data), size):
+            yield data[start : start + size]
+
+    @property
+    def reopenable(self) -> bool:
+        return True
+
+    async def size(self) -> Optional[int]:
+        # None when only reading it all would tell
+        return None
+
+    def dump(self) -> Optional[Dict[str, Any]]:
+        # None marks a source that cannot survive a restart
+        return None
+
+    @staticmethod
+    def load(data: Dict[str, Any]) -> "MediaSource":
+        if data["kind"] == "uri":
+            return UriSource(data["uri"])
+        if data["kind"] == "path":
+            return PathSource(data["path"])
+        if data["kind"] == "bytes":
+            return BytesSource(base64.b64decode(data["data"]))
+        raise ValueError(f"Unknown media source {data['kind']}")
+
+
+class UriSource(MediaSource):
+    def __init__(self, uri: str) -> None:
+        self.uri = uri
+
+    def __repr__(self) -> str:
+        return f"UriSource({self.uri[:32]}...)"
+
+    async def read(self) -> bytes:
+        _, sep, payload = self.uri.partition("base64,")
+        if not sep:
+            raise ValueError("Only base64 data URIs are supported")
+        return await asyncio.to_thread(base64.b64decode, payload)
+
+    def dump(self) -> Optional[Dict[str, Any]]:
+        return {"kind": "uri", "uri": self.uri}
+
+
+class PathSource(MediaSource):
+    def __init__(self, path: Union[Path, str]) -> None:
+        self.path = Path(path)
+
+    def __repr__(self) -> str:
+        return f"PathSource({self.path})"
+
+    async def read(self) -> bytes:
+        return await asyncio.to_thread(self.path.read_bytes)
+
+    async def size(self) -> Optional[int]:
+        return (await asyncio.to_thread(self.path.stat)).st_size
+
+    async def chunks(self, size: int) -> AsyncIterator[bytes]:
+        file = await asyncio.to_thread(open, self.path, "rb")
+        try:
+            while chunk := await asyncio.to_thread(file.read, size):
+                yield chunk
+        finally:
+            file.close()
+
+    def dump(self) -> Optional[Dict[str, Any]]:
+        return {"kind": "path", "path": str(self.path)}
+
+
+class BytesSource(MediaSource):
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    def __repr__(self) -> str:
+        return f"BytesSource({len(self.data)} bytes)"
+
+    async def read(self) -> bytes:
+        return self.data
+
+    async def size(self) -> Optional[int]:
+        return len(self.data)
+
+    def dump(self) -> Optional[Dict[str, Any]]:
+        return {"kind": "bytes", "data": base64.b64encode(self.data).decode()}
+
+
+class StreamSource(MediaSource):
+    def __init__(
+        self,
+        stream: Union[AsyncIterable[bytes], Callable[[], AsyncIterable[bytes]]],
+    ) -> None:
+        self._stream = stream
+
+    def __repr__(self) -> str:
+        return "StreamSource()"
+
+    @property
+    def reopenable(self) -> bool:
+        return callable(self._stream)
+
+    def open(self) -> AsyncIterable[bytes]:
+        # a factory can be reopened on retry, a bare iterable only once
+        if callable(self._stream):
+            return self._stream()
+        return self._stream
+
+    async def read(self) -> bytes:
+        chunks = [chunk async for chunk in self.open()]
+        return b"".join(chunks)
+
+    async def chunks(self, size: int) -> AsyncIterator[bytes]:
+        # the stream's own chunks come in any size, regroup them
+        buffer = bytearray()
+        async for chunk in self.open():
+            buffer += chunk
+            while len(buffer) >= size:
+                yield bytes(buffer[:size])
+                del buffer[:size]
+        if buffer:
+            yield bytes(buffer)
+
+
+MediaFile = Union[
+    str,
+    Path,
+    bytes,
+    AsyncIterable[bytes],
+    Callable[[], AsyncIterable[bytes]],
+    MediaSource,
+]
+
+
+# a video and its cover, None to take the first frame
+VideoMedia = Tuple[MediaSource, Optional[MediaSource]]
+
+
+def to_source(file: MediaFile) -> MediaSource:
+    if isinstance(file, MediaSource):
+        return file
+    if isinstance(file, str):
+        if file.startswith("data:"):
+            return UriSource(file)
+        return PathSource(file.removeprefix("file://"))
+    if isinstance(file, Path):
+        return PathSource(file)
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        return BytesSource(bytes(file))
+    return StreamSource(file)
@@ -1,9 +1,11 @@
-from typing import Type, Iterable
+from typing import Any, Dict, List, Optional, Type, Iterable
 from typing_extensions import override
 
 from nonebot.adapters import Message as BaseMessage
 from nonebot.adapters import MessageSegment as BaseMessageSegment
 
+from .media import MediaFile, MediaSource, to_source
+
 
 class MessageSegment(BaseMessageSegment["Message"]):
     @classmethod
@@ -24,8 +26,12 @@ class MessageSegment(BaseMessageSegment["Message"]):
         return Text(content)
 
     @staticmethod
-    def image(uri: str) -> "Image":
-        return Image(uri)
+    def image(file: MediaFile) -> "Image":
+        return Image(file)
+
+    @staticmethod
+    def video(file: MediaFile, cover: Optional[MediaFile] = None) -> "Video":
+        return Video(file, cover)
 
 
 class Text(MessageSegment):
@@ -40,14 +46,30 @@ class Text(MessageSegment):
 
 class Image(MessageSegment):
     @override
-    def __init__(self, uri: str):
-        super().__init__("image", {"file": uri})
+    def __init__(self, file: MediaFile):
+        super().__init__("image", {"file": to_source(file)})
 
     @override
     def __str__(self) -> str:
         return f"<image: {self.data['file']}>"
 
 
+class Video(MessageSegment):
+    @override
+    def __init__(self, file: MediaFile, cover: Optional[MediaFile] = None):
+        super().__init__(
+            "video",
+            {
+                "file": to_source(file),
+                "cover": to_source(cover) if cover is not None else None,
+            },
+        )
+
+    @override
+    def __str__(self) -> str:
+        return f"<video: {self.data['file']}>"
+
+
 class Message(BaseMessage[MessageSegment]):
     @classmethod
     @override
@@ -58,3 +80,39 @@ class Message(BaseMessage[MessageSegment]):
     @override
     def _construct(msg: str) -> Iterable[MessageSegment]:
         yield Text(msg)
+
+    def dump(self) -> List[Dict[str, Any]]:
+        data: List[Dict[str, Any]] = []
+        for sgm in self:
+            if isinstance(sgm, (Image, Video)):
+                dumped: Dict[str, Any] = {}
+                for key, source in sgm.data.items():
+                    if source is None:
+                        continue
+                    dumped[key] = source.dump()
+                    if dumped[key] is None:
+                        raise ValueError(f"{source} cannot be serialized")
+                data.append({"type": sgm.type, "data": dumped})
+            else:
+                data.append({"type": sgm.type, "data": dict(sgm.data)})
+        return data
+
+    @classmethod
+    def load(cls, data: List[Dict[str, Any]]) -> "Message":
+        message = cls()
+        for sgm in data:
+            if sgm["type"] == "text":
+                message.append(Text(sgm["data"]["text"]))
+            elif sgm["type"] == "image":
+                message.append(Image(MediaSource.load(sgm["data"]["file"])))
+            elif sgm["type"] == "video":
+                cover = sgm["data"].get("cover")
+                message.append(
+                    Video(
+                        MediaSource.load(sgm["data"]["file"]),
+                        MediaSource.load(cover) if cover else None,
+                    )
+                )
+            else:
+                raise ValueError(f"Unknown segment type {sgm['type']}")
+        return message
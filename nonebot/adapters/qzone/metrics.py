@@ -0,0 +1,216 @@
+import bisect
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in items
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    @abstractmethod
+    def snapshot(self) -> Dict[str, object]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        super().__init__(name, documentation)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        key = _labels(labels)
+        self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+    def snapshot(self) -> Dict[str, object]:
+        return {_format_labels(key): value for key, value in self._values.items()}
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        super().__init__(name, documentation)
+        self._functions: Dict[Labels, Callable[[], Optional[float]]] = {}
+
+    def set_function(self, func: Callable[[], Optional[float]], **labels: str) -> None:
+        # evaluated on collection, so the hot path pays nothing
+        self._functions[_labels(labels)] = func
+
+    def _collect(self) -> Dict[Labels, float]:
+        values: Dict[Labels, float] = {}
+        for labels, func in self._functions.items():
+            value = func()
+            if value is not None:
+                values[labels] = value
+        return values
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, value in self._collect().items():
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+    def snapshot(self) -> Dict[str, object]:
+        return {_format_labels(key): value for key, value in self._collect().items()}
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, counts in self._counts.items():
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                le = _format_labels(labels, ("le", str(bound)))
+                lines.append(f"{self.name}_bucket{le} {total}")
+            total += counts[-1]
+            le = _format_labels(labels, ("le", "+Inf"))
+            lines.append(f"{self.name}_bucket{le} {total}")
+            lines.append(
+                f"{self.name}_sum{_format_labels(labels)} {self._sums[labels]}"
+            )
+            lines.append(f"{self.name}_count{_format_labels(labels)} {total}")
+        return lines
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            _format_labels(labels): {
+                "count": sum(counts),
+                "sum": self._sums[labels],
+                "buckets": dict(zip(self.buckets + (float("inf"),), counts)),
+            }
+            for labels, counts in self._counts.items()
+        }
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.request_seconds = Histogram(
+            "qzone_request_seconds", "Latency of HTTP requests to Qzone by endpoint"
+        )
+        self.requests = Counter(
+            "qzone_requests_total", "HTTP requests to Qzone by endpoint and status"
+        )
+        self.operation_seconds = Histogram(
+            "qzone_operation_seconds", "Latency of adapter operations"
+        )
+        self.api_errors = Counter(
+            "qzone_api_errors_total", "Qzone responses with a non-zero return code"
+        )
+        self.upload_bytes = Counter(
+            "qzone_upload_bytes_total", "Image bytes uploaded to Qzone"
+        )
+        self.preprocess_saved_bytes = Counter(
+            "qzone_preprocess_saved_bytes_total",
+            "Image bytes saved by preprocessing before upload",
+        )
+        self.upload_slice_retries = Counter(
+            "qzone_upload_slice_retries_total", "Upload slices sent again after failing"
+        )
+        self.upload_cache_hits = Counter(
+            "qzone_upload_cache_hits_total", "Uploads skipped thanks to the cache"
+        )
+        self.throttled = Counter(
+            "qzone_throttled_total", "Calls rejected by Qzone for being too frequent"
+        )
+        self.circuit_open = Gauge(
+            "qzone_circuit_open", "Whether calls of an account are failing fast"
+        )
+        self.publish_rate = Gauge(
+            "qzone_publish_rate", "Current adaptive publish rate per second"
+        )
+        self.upload_limit = Gauge(
+            "qzone_upload_limit", "Current adaptive upload concurrency"
+        )
+        self.read_cache = Counter(
+            "qzone_read_cache_total", "Cached reads by operation and outcome"
+        )
+        self.feed_events = Counter(
+            "qzone_feed_events_total", "Events produced by the feed poller"
+        )
+        self.queue_depth = Gauge("qzone_queue_depth", "Jobs waiting in publish queue")
+        self.cookie_age = Gauge(
+            "qzone_cookie_age_seconds", "Seconds since the cookies were refreshed"
+        )
+
+    def __iter__(self) -> Iterator[Metric]:
+        return iter(
+            metric for metric in vars(self).values() if isinstance(metric, Metric)
+        )
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        return {metric.name: metric.snapshot() for metric in self}
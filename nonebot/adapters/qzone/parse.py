@@ -0,0 +1,153 @@
+import json
+from dataclasses import dataclass, asdict, fields
+from typing import Any, Collection, Dict, Optional
+
+from .exception import AuthExpired, Throttled, QzoneApiError, UnexpectedResponse
+
+AUTH_FAILURE_CODES = frozenset({-3000})
+THROTTLE_CODES = frozenset({-10000})
+# throttling isn't always given its own code, the message gives it away
+THROTTLE_MESSAGES = ("频繁", "频率")
+
+
+def parse_response(content: bytes) -> Dict[str, Any]:
+    # Qzone answers with bare JSON, `callback({...});` or a jsonhtml page
+    # running `frameElement.callback({...});`, only the object is wanted
+    marker = content.find(b"callback(")
+    start = content.find(b"{", marker + 9 if marker >= 0 else 0)
+    end = content.rfind(b"}")
+    if start < 0 or end < start:
+        raise UnexpectedResponse("no JSON object", content)
+    try:
+        return json.loads(content[start : end + 1])
+    except ValueError as err:
+        raise UnexpectedResponse(f"invalid JSON: {err}", content) from err
+
+
+def api_error(
+    code: int, message: str, throttle_codes: Collection[int] = THROTTLE_CODES
+) -> QzoneApiError:
+    if code in AUTH_FAILURE_CODES:
+        return AuthExpired(code, message)
+    if code in throttle_codes or any(text in message for text in THROTTLE_MESSAGES):
+        return Throttled(code, message)
+    return QzoneApiError(code, message)
+
+
+def check_code(
+    payload: Dict[str, Any], throttle_codes: Collection[int] = THROTTLE_CODES
+) -> Dict[str, Any]:
+    code = payload.get("ret", payload.get("code", 0))
+    message = str(payload.get("message") or payload.get("msg") or "")
+    try:
+        code = int(code or 0)
+    except (TypeError, ValueError):
+        # still an error, the raw code goes into the message
+        message = f"{message} (code {code!r})"
+        code = -1
+    if code:
+        raise api_error(code, message, throttle_codes)
+    return payload
+
+
+def parse_checked(
+    content: bytes, throttle_codes: Collection[int] = THROTTLE_CODES
+) -> Dict[str, Any]:
+    return check_code(parse_response(content), throttle_codes)
+
+
+@dataclass
+class UploadResult:
+    albumid: str
+    lloc: str
+    sloc: str
+    type: int
+    height: int
+    width: int
+    pre: str
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "UploadResult":
+        required = {field.name for field in fields(cls)}
+        if not isinstance(data, dict) or not required <= set(data):
+            raise UnexpectedResponse(f"incomplete upload result: {data!r}")
+        return cls(
+            albumid=data["albumid"],
+            lloc=data["lloc"],
+            sloc=data["sloc"],
+            type=data["type"],
+            height=data["height"],
+            width=data["width"],
+            pre=data["pre"],
+        )
+
+    @classmethod
+    def from_slices(cls, data: Dict[str, Any]) -> "UploadResult":
+        # the sliced upload names the same fields differently
+        biz = data.get("biz") if isinstance(data, dict) else None
+        if not isinstance(biz, dict) or not {"sAlbumID", "sPhotoID", "sBURL"} <= set(
+            biz
+        ):
+            raise UnexpectedResponse(f"incomplete sliced upload result: {data!r}")
+        return cls(
+            albumid=biz["sAlbumID"],
+            lloc=biz["sPhotoID"],
+            sloc=biz.get("sSloc") or biz["sPhotoID"],
+            type=biz.get("iPhotoType", 1),
+            height=biz.get("iHeight", 0),
+            width=biz.get("iWidth", 0),
+            pre=biz["sBURL"],
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @property
+    def richval(self) -> str:
+        return ",{0},{1},{2},{3},{4},{5},,{4},{5}".format(
+            self.albumid, self.lloc, self.sloc, self.type, self.height, self.width
+        )
+
+    @property
+    def bo(self) -> str:
+        return self.pre[self.pre.find("bo=") + 3 :]
+
+
+@dataclass
+class VideoResult:
+    vid: str
+    duration: int
+    width: int
+    height: int
+
+    @classmethod
+    def from_slices(cls, data: Dict[str, Any]) -> "VideoResult":
+        biz = data.get("biz") if isinstance(data, dict) else None
+        if not isinstance(biz, dict) or not biz.get("sVid"):
+            raise UnexpectedResponse(f"incomplete video upload result: {data!r}")
+        return cls(
+            vid=biz["sVid"],
+            duration=biz.get("iDuration", 0),
+            width=biz.get("iWidth", 0),
+            height=biz.get("iHeight", 0),
+        )
+
+    def richval(self, cover: Optional[UploadResult]) -> str:
+        return "{0},{1},{2},{3},{4}".format(
+            self.vid,
+            cover.lloc if cover else "",
+            self.width,
+            self.height,
+            self.duration,
+        )
+
+
+@dataclass
+class PublishResult:
+    tid: str
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PublishResult":
+        if not data.get("t1_tid"):
+            raise UnexpectedResponse(f"no t1_tid in publish result: {data!r}")
+        return cls(tid=data["t1_tid"])
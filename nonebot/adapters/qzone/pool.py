@@ -0,0 +1,45 @@
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from .session import Session
+from .exception import NotLoggedIn
+
+
+class SessionPool:
+    def __init__(self, penalty: timedelta) -> None:
+        self.penalty = penalty
+        self.sessions: Dict[str, Session] = {}
+
+    def add(self, session: Session) -> None:
+        self.sessions[session.bot_id] = session
+
+    def remove(self, bot_id: str) -> Optional[Session]:
+        return self.sessions.pop(bot_id, None)
+
+    def get(self, bot_id: str) -> Session:
+        return self.sessions[bot_id]
+
+    def available(self) -> List[Session]:
+        return [session for session in self.sessions.values() if session.logged_in]
+
+    def select(self) -> Session:
+        # skip accounts failing fast, prefer those that haven't failed
+        # recently, then the soonest free rate limiter, then the shortest queue
+        candidates = self.available()
+        if not candidates:
+            raise NotLoggedIn
+        return min(
+            candidates,
+            key=lambda session: (
+                session.breaker.is_open,
+                session.recently_failed(self.penalty),
+                session.publish_limiter.delay(),
+                session.pending_publishes,
+            ),
+        )
+
+    def __iter__(self):
+        return iter(list(self.sessions.values()))
+
+    def __len__(self) -> int:
+        return len(self.sessions)
@@ -0,0 +1,254 @@
+import asyncio
+import heapq
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from enum import IntEnum
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .message import Message
+from .utils import log, DebouncedWriter
+from .exception import PublishQueueFull
+
+# finished jobs kept for lookups, oldest dropped first
+FINISHED_JOBS = 1024
+# shortest wait of a deferred job, so a busy limiter isn't polled in a loop
+MIN_DEFER = 0.05
+
+Item = Tuple[int, int, "PublishJob"]
+
+
+class Deferred(Exception):
+    # raised by the handler when the account `key` can't take the job before
+    # `delay` seconds
+    def __init__(self, delay: float, key: Optional[str]) -> None:
+        super().__init__(delay, key)
+        self.delay = delay
+        self.key = key
+
+
+class Priority(IntEnum):
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+@dataclass
+class PublishJob:
+    message: Message
+    priority: Priority = Priority.NORMAL
+    bot_id: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    created: float = field(default_factory=time.time)
+    future: "asyncio.Future[Tuple[str, List[str]]]" = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+    def dump(self) -> Optional[Dict[str, Any]]:
+        try:
+            message = self.message.dump()
+        except ValueError:
+            # e.g. images backed by a one-shot stream, which only live in memory
+            return None
+        return {
+            "id": self.id,
+            "priority": int(self.priority),
+            "bot_id": self.bot_id,
+            "created": self.created,
+            "message": message,
+        }
+
+    @classmethod
+    def load(cls, data: Dict[str, Any]) -> "PublishJob":
+        return cls(
+            message=Message.load(data["message"]),
+            priority=Priority(data["priority"]),
+            bot_id=data["bot_id"],
+            id=data["id"],
+            created=data["created"],
+        )
+
+
+class PublishQueue:
+    # Jobs an account can't take yet wait in that account's list, outside
+    # the priority queue; a single timer per account hands the first of them
+    # back when it is due, and the next follows once that one got through.
+    # Waiting jobs still count against `maxsize` and the queue length.
+
+    def __init__(
+        self,
+        handler: Callable[[PublishJob], Awaitable[Tuple[str, List[str]]]],
+        path: Optional[Path],
+        maxsize: int,
+        workers: int,
+        block: bool,
+    ) -> None:
+        self._handler = handler
+        self._path = path
+        self._maxsize = maxsize
+        self._block = block
+        self._worker_count = workers
+        self._queue: "asyncio.PriorityQueue[Item]" = asyncio.PriorityQueue()
+        self._seq = 0
+        self._jobs: Dict[str, PublishJob] = {}
+        self._finished: "OrderedDict[str, PublishJob]" = OrderedDict()
+        self._space = asyncio.Event()
+        self._parked: Dict[Optional[str], List[Item]] = {}
+        self._timers: Dict[Optional[str], asyncio.TimerHandle] = {}
+        # jobs handed back from a wait list, by the account they waited for
+        self._released: Dict[str, Optional[str]] = {}
+        self._workers: List["asyncio.Task[None]"] = []
+        self._writer = DebouncedWriter(path) if path else None
+
+    def __len__(self) -> int:
+        return self._queue.qsize() + sum(len(items) for items in self._parked.values())
+
+    def get(self, job_id: str) -> Optional[PublishJob]:
+        return self._jobs.get(job_id) or self._finished.get(job_id)
+
+    async def start(self) -> None:
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self._worker_count)
+        ]
+        # only the file is read in a thread, jobs own a future of this loop
+        restored = self._load(await asyncio.to_thread(self._read))
+        for job in restored:
+            job.future.add_done_callback(self._log_restored)
+            await self._put(job, block=True)
+        if restored:
+            log("INFO", f"Restored {len(restored)} pending publish jobs")
+
+    async def stop(self) -> None:
+        # waiting jobs are still in _jobs and get saved with the rest
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        if self._writer:
+            self._writer.schedule(self._snapshot)
+            await self._writer.flush()
+
+    async def submit(
+        self,
+        message: Message,
+        priority: Priority = Priority.NORMAL,
+        bot_id: Optional[str] = None,
+    ) -> PublishJob:
+        job = PublishJob(message, priority, bot_id)
+        await self._put(job, block=self._block)
+        return job
+
+    async def _put(self, job: PublishJob, block: bool) -> None:
+        while 0 < self._maxsize <= len(self._jobs):
+            if not block:
+                raise PublishQueueFull
+            self._space.clear()
+            await self._space.wait()
+        self._jobs[job.id] = job
+        self._queue.put_nowait(self._item(job))
+        self._mark_dirty()
+
+    def _item(self, job: PublishJob) -> Item:
+        self._seq += 1
+        return (int(job.priority), self._seq, job)
+
+    async def _work(self) -> None:
+        while True:
+            _, _, job = await self._queue.get()
+            released = job.id in self._released
+            key = self._released.pop(job.id, None)
+            if not released and job.bot_id in self._parked:
+                # queue up behind the jobs already waiting for the account
+                heapq.heappush(self._parked[job.bot_id], self._item(job))
+                self._queue.task_done()
+                continue
+            try:
+                result = await self._handler(job)
+            except asyncio.CancelledError:
+                # keep the job on disk so it is retried after restart
+                raise
+            except Deferred as err:
+                self._park(job, err)
+                continue
+            except Exception as err:
+                if not job.future.done():
+                    job.future.set_exception(err)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self._queue.task_done()
+            if released and key not in self._timers:
+                # the account took a job, give the next waiting one a try
+                self._release(key)
+            self._jobs.pop(job.id, None)
+            self._finished[job.id] = job
+            if len(self._finished) > FINISHED_JOBS:
+                self._finished.popitem(last=False)
+            self._space.set()
+            self._mark_dirty()
+
+    def _park(self, job: PublishJob, err: "Deferred") -> None:
+        heapq.heappush(self._parked.setdefault(err.key, []), self._item(job))
+        if err.key not in self._timers:
+            self._timers[err.key] = asyncio.get_running_loop().call_later(
+                max(err.delay, MIN_DEFER), self._release, err.key
+            )
+
+    def _release(self, key: Optional[str]) -> None:
+        self._timers.pop(key, None)
+        items = self._parked.get(key)
+        if not items:
+            return
+        item = heapq.heappop(items)
+        if not items:
+            del self._parked[key]
+        self._released[item[2].id] = key
+        self._queue.put_nowait(item)
+
+    @staticmethod
+    def _log_restored(future: "asyncio.Future[Tuple[str, List[str]]]") -> None:
+        if future.cancelled():
+            return
+        err = future.exception()
+        if err:
+            log("ERROR", "Restored publish job failed", err)
+        else:
+            log("INFO", f"Restored publish job done: {future.result()}")
+
+    def _snapshot(self) -> str:
+        jobs = [job.dump() for job in self._jobs.values()]
+        return json.dumps([job for job in jobs if job is not None])
+
+    def _read(self) -> List[Dict[str, Any]]:
+        if self._path is None or not os.path.isfile(self._path):
+            return []
+        try:
+            return json.loads(self._path.read_text())
+        except json.decoder.JSONDecodeError as err:
+            log(
+                "WARNING",
+                f"Publish queue {self._path} failed to parse: <{type(err).__name__}: {err}>",
+            )
+            return []
+
+    def _load(self, items: List[Dict[str, Any]]) -> List[PublishJob]:
+        try:
+            return [PublishJob.load(data) for data in items]
+        except (TypeError, KeyError, ValueError) as err:
+            log(
+                "WARNING",
+                f"Publish queue {self._path} failed to parse: <{type(err).__name__}: {err}>",
+            )
+            return []
+
+    def _mark_dirty(self) -> None:
+        if self._writer:
+            self._writer.schedule(self._snapshot)
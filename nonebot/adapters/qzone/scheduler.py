@@ -0,0 +1,226 @@
+import asyncio
+import heapq
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .message import Message
+from .publisher import Priority
+from .utils import log, DebouncedWriter
+
+PREFETCH, DUE = 0, 1
+# wake up at least this often, the wall clock may have been adjusted
+MAX_SLEEP = 60.0
+# wait before handing a post over again when the publish queue refused it
+FIRE_RETRY = 30.0
+
+
+@dataclass
+class ScheduledPost:
+    message: Message
+    at: float
+    bot_id: Optional[str] = None
+    priority: Priority = Priority.NORMAL
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    created: float = field(default_factory=time.time)
+
+    @property
+    def due(self) -> datetime:
+        return datetime.fromtimestamp(self.at)
+
+    def dump(self) -> Optional[Dict[str, Any]]:
+        try:
+            message = self.message.dump()
+        except ValueError:
+            return None
+        return {
+            "id": self.id,
+            "at": self.at,
+            "bot_id": self.bot_id,
+            "priority": int(self.priority),
+            "created": self.created,
+            "message": message,
+        }
+
+    @classmethod
+    def load(cls, data: Dict[str, Any]) -> "ScheduledPost":
+        return cls(
+            message=Message.load(data["message"]),
+            at=data["at"],
+            bot_id=data["bot_id"],
+            priority=Priority(data["priority"]),
+            id=data["id"],
+            created=data["created"],
+        )
+
+
+class Scheduler:
+    # One timer for every scheduled post: a heap of (time, seq, kind, id)
+    # entries, cancelled posts leave stale entries that are skipped.
+
+    def __init__(
+        self,
+        fire: Callable[[ScheduledPost], Awaitable[Any]],
+        prefetch: Callable[[ScheduledPost], Awaitable[Any]],
+        path: Optional[Path],
+        lead: float,
+    ) -> None:
+        self._fire = fire
+        self._prefetch = prefetch
+        self._path = path
+        self._lead = lead
+        self._posts: Dict[str, ScheduledPost] = {}
+        self._heap: List[Tuple[float, int, int, str]] = []
+        self._seq = 0
+        self._wake = asyncio.Event()
+        self._timer: Optional["asyncio.Task[None]"] = None
+        self._tasks: Set["asyncio.Task[Any]"] = set()
+        self._writer = DebouncedWriter(path) if path else None
+
+    def __len__(self) -> int:
+        return len(self._posts)
+
+    async def start(self) -> None:
+        for post in await asyncio.to_thread(self._read):
+            self._add(post)
+        if self._posts:
+            log("INFO", f"Restored {len(self._posts)} scheduled posts")
+        self._timer = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        for task in (self._timer, *self._tasks):
+            if task:
+                task.cancel()
+        await asyncio.gather(
+            *(task for task in (self._timer, *self._tasks) if task),
+            return_exceptions=True,
+        )
+        if self._writer:
+            self._writer.schedule(self._snapshot)
+            await self._writer.flush()
+
+    def schedule(
+        self,
+        message: Message,
+        at: datetime,
+        bot_id: Optional[str] = None,
+        priority: Priority = Priority.NORMAL,
+    ) -> ScheduledPost:
+        post = ScheduledPost(message, at.timestamp(), bot_id, priority)
+        self._add(post)
+        self._mark_dirty()
+        return post
+
+    def cancel(self, post_id: str) -> bool:
+        if self._posts.pop(post_id, None) is None:
+            return False
+        self._mark_dirty()
+        return True
+
+    def get(self, post_id: str) -> Optional[ScheduledPost]:
+        return self._posts.get(post_id)
+
+    def list(self, bot_id: Optional[str] = None) -> List[ScheduledPost]:
+        return sorted(
+            (
+                post
+                for post in self._posts.values()
+                if bot_id is None or post.bot_id == bot_id
+            ),
+            key=lambda post: post.at,
+        )
+
+    def _add(self, post: ScheduledPost) -> None:
+        self._posts[post.id] = post
+        if self._lead > 0:
+            self._push(post.at - self._lead, PREFETCH, post.id)
+        self._push(post.at, DUE, post.id)
+        self._wake.set()
+
+    def _push(self, when: float, kind: int, post_id: str) -> None:
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, kind, post_id))
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            while self._heap and self._heap[0][0] <= time.time():
+                _, _, kind, post_id = heapq.heappop(self._heap)
+                post = self._posts.get(post_id)
+                if post is None:
+                    continue
+                if kind == PREFETCH:
+                    self._spawn(self._run_prefetch(post))
+                else:
+                    self._spawn(self._run_fire(post))
+            timeout = MAX_SLEEP
+            if self._heap:
+                timeout = min(timeout, max(0.0, self._heap[0][0] - time.time()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _spawn(self, coro: Awaitable[Any]) -> None:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_prefetch(self, post: ScheduledPost) -> None:
+        try:
+            await self._prefetch(post)
+        except Exception as err:
+            # not fatal, the images are uploaded when the post fires
+            log("WARNING", f"Prefetching scheduled post {post.id} failed", err)
+        finally:
+            # the prefetch may have pinned the post to an account
+            self._mark_dirty()
+
+    async def _run_fire(self, post: ScheduledPost) -> None:
+        late = time.time() - post.at
+        log("INFO", f"Scheduled post {post.id} is due ({late:.1f}s late)")
+        try:
+            await self._fire(post)
+        except asyncio.CancelledError:
+            # still in the store, it fires again after restart
+            raise
+        except Exception as err:
+            log(
+                "WARNING",
+                f"Scheduled post {post.id} not accepted, retrying in {FIRE_RETRY:.0f}s",
+                err,
+            )
+            if post.id in self._posts:
+                self._push(time.time() + FIRE_RETRY, DUE, post.id)
+                self._wake.set()
+            return
+        # dropped only once handed over, so a crash can't lose it
+        self._posts.pop(post.id, None)
+        self._mark_dirty()
+
+    def _snapshot(self) -> str:
+        posts = [post.dump() for post in self._posts.values()]
+        return json.dumps([post for post in posts if post is not None])
+
+    def _read(self) -> List[ScheduledPost]:
+        if self._path is None or not os.path.isfile(self._path):
+            return []
+        try:
+            return [
+                ScheduledPost.load(data) for data in json.loads(self._path.read_text())
+            ]
+        except (json.decoder.JSONDecodeError, TypeError, KeyError, ValueError) as err:
+            log(
+                "WARNING",
+                f"Schedule {self._path} failed to parse: <{type(err).__name__}: {err}>",
+            )
+            return []
+
+    def _mark_dirty(self) -> None:
+        if self._writer:
+            self._writer.schedule(self._snapshot)
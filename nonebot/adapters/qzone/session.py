@@ -1,18 +1,76 @@
 import asyncio
+import hashlib
 import json
 import math
 import time
 import re
 import os
+import socket
+import uuid
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Any, Callable, Coroutine, List, Optional, Dict, Union, Tuple
+from enum import Enum
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    List,
+    NamedTuple,
+    Optional,
+    Dict,
+    TypeVar,
+    Union,
+    Tuple,
+)
 
 from nonebot.drivers import URL, Request, Response, Cookies
 from nonebot.utils import escape_tag
 
+from .cache import UploadCache, image_digest
 from .config import Config
-from .utils import log, open_file, save_image, remove_file
-from .exception import NotLoggedIn, AlreadyLoggedIn
+from .hosts import HostHealth, HostSelector
+from .imaging import ImageProcessor
+from .media import BytesSource, MediaSource, VideoMedia, guess_mime, to_data_uri
+from .metrics import Metrics
+from .parse import UploadResult, PublishResult, VideoResult, parse_checked
+from .slices import (
+    SLICE_APPIDS,
+    SLICE_SIZE,
+    SliceProgress,
+    SlicedUpload,
+    measure,
+    spool,
+)
+from .store import Record, SessionStore, create_store
+from .throttle import AIMD, AdaptiveLimiter, CircuitBreaker, TokenBucket
+from .transport import Transport
+from .video import extract_cover
+from .utils import (
+    log,
+    log_lazy,
+    open_file,
+    save_image,
+    remove_file,
+    remove_file_if_exists,
+    DebouncedWriter,
+    SingleFlight,
+    TTLCache,
+)
+from .exception import (
+    NotLoggedIn,
+    AlreadyLoggedIn,
+    AuthExpired,
+    CircuitOpen,
+    Throttled,
+    QzoneApiError,
+    HostUnavailable,
+    UnexpectedResponse,
+)
+
+T = TypeVar("T")
+
+_ID_SEGMENT = re.compile(r"[0-9a-fA-F]{16,}|[0-9]+")
 
 
 def _cookies_to_dict(cookies: Cookies) -> dict:
@@ -22,27 +80,231 @@ def _cookies_to_dict(cookies: Cookies) -> dict:
     return cookie_dict
 
 
+class Exchange(NamedTuple):
+    time: datetime
+    method: str
+    url: str
+    status: Optional[int]
+    elapsed: float
+    size: int
+    preview: bytes
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "time": self.time.isoformat(),
+            "method": self.method,
+            "url": self.url,
+            "status": self.status,
+            "elapsed": self.elapsed,
+            "size": self.size,
+            "preview": self.preview.decode(errors="replace"),
+        }
+
+
+class SessionState(Enum):
+    LOGGED_OUT = "logged_out"
+    VALIDATING = "validating"
+    READY = "ready"
+    DEGRADED = "degraded"
+
+
 class Session:
     CookieRefreshTime: timedelta = timedelta(minutes=10)
+    RefreshRetryTime: timedelta = timedelta(seconds=5)
+    RefreshLeaseTime: timedelta = timedelta(minutes=1)
 
     def __init__(
         self,
-        request: Callable[[Request], Coroutine[Any, Any, Response]],
+        transport: Transport,
         config: Config,
+        bot_id: str,
+        metrics: Optional[Metrics] = None,
+        processor: Optional[ImageProcessor] = None,
+        store: Optional[SessionStore] = None,
     ) -> None:
-        self._request = request
+        self.transport = transport
+        self.metrics = metrics or Metrics()
+        self._owns_processor = processor is None
+        self.processor = processor or ImageProcessor(config)
+        self._owns_store = store is None
+        self.store = store or create_store(config)
+        self._cookie_version = 0
+        # identifies this session among every process sharing the store
+        self._lease_owner = (
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        )
         self.config = config
+        self.bot_id = bot_id
+        self.cookie_path = config.cookie_path_of(bot_id)
+        self.qrcode_path = config.qrcode_path_of(bot_id)
+        self._cookie_writer = DebouncedWriter(
+            self.cookie_path,
+            config.cookie_save_delay.total_seconds(),
+            self._store_cookies,
+        )
         self.qq_number: Optional[str] = None
+        self.state = SessionState.LOGGED_OUT
+        self._validator: Optional["asyncio.Task[None]"] = None
+        self._login_task: Optional["asyncio.Task[None]"] = None
         self._cookies: Cookies = Cookies()
         self.cookies_last_used: Optional[datetime] = None
-        self._load_cookies()
+        self.cookies_last_refreshed: Optional[datetime] = None
+        self.refresh_error: Optional[BaseException] = None
+        self._flights = SingleFlight()
+        self._reads = TTLCache(
+            config.read_cache_ttl.total_seconds(), config.read_cache_size
+        )
+        self._engagements = SingleFlight(config.engage_coalesce.total_seconds())
+        self._engage_limiter = asyncio.Semaphore(config.engage_concurrency)
+        self.exchanges: Deque[Exchange] = deque(maxlen=config.exchange_log_size)
+        self._gtk: Optional[Tuple[str, int]] = None
+        self._qzreferrer: Optional[Tuple[str, str]] = None
+        self.pending_publishes = 0
+        self.publish_limiter = TokenBucket(config.publish_rate, config.publish_burst)
+        self.last_failure: Optional[float] = None
+        self.upload_limiter = AdaptiveLimiter(config.upload_concurrency)
+        # halve on throttling, win back a slot every few clean uploads and a
+        # tenth of the configured publish rate per clean publish
+        self._upload_control = AIMD(
+            config.upload_concurrency, 1, 1 / max(config.upload_concurrency, 4)
+        )
+        self._publish_control = AIMD(
+            config.publish_rate, config.publish_rate / 16, config.publish_rate / 10
+        )
+        self.breaker = CircuitBreaker(
+            config.circuit_threshold,
+            config.circuit_reset.total_seconds(),
+            (Throttled, UnexpectedResponse, HostUnavailable),
+        )
+        self.upload_hosts = HostSelector(config.upload_hosts)
+        self.upload_cache = UploadCache(
+            config.upload_cache_dir if config.upload_cache_persist else None,
+            config.upload_cache_size,
+            config.upload_cache_ttl,
+        )
+        self.metrics.cookie_age.set_function(self._cookie_age, account=bot_id)
+        self.metrics.circuit_open.set_function(
+            lambda: float(self.breaker.is_open), account=bot_id
+        )
+        self.metrics.publish_rate.set_function(
+            lambda: self.publish_limiter.rate, account=bot_id
+        )
+        self.metrics.upload_limit.set_function(
+            lambda: self.upload_limiter.limit, account=bot_id
+        )
+        self.maintainer: Optional["asyncio.Task[None]"] = None
+
+    async def start(self) -> None:
+        await self._load_cookies()
         self.maintainer = asyncio.create_task(self._maintain_cookies())
+        self.maintainer.add_done_callback(self._on_maintainer_done)
 
     async def request(self, method: str, url: Union[URL, str], **kwargs) -> Response:
         if "cookies" not in kwargs:
+            # don't send cookies that are about to be replaced
+            await self._flights.wait("refresh")
             kwargs["cookies"] = self.cookies
             self.cookies_last_used = datetime.now()
-        return await self._request(Request(method, url, **kwargs))
+        if "timeout" not in kwargs:
+            timeout = self._endpoint_timeout(str(url))
+            if timeout is not None:
+                kwargs["timeout"] = timeout
+        start = time.perf_counter()
+        status: Optional[int] = None
+        content = b""
+        try:
+            response = await self.transport.request(Request(method, url, **kwargs))
+            status = response.status_code
+            if isinstance(response.content, bytes):
+                content = response.content
+            return response
+        finally:
+            self._record_exchange(method, url, status, start, content)
+
+    def _record_exchange(
+        self,
+        method: str,
+        url: Union[URL, str],
+        status: Optional[int],
+        start: float,
+        content: bytes,
+    ) -> None:
+        # keep a bounded trail of recent calls instead of dumping every body
+        endpoint = self._endpoint_name(url)
+        elapsed = time.perf_counter() - start
+        self.metrics.request_seconds.observe(elapsed, endpoint=endpoint)
+        self.metrics.requests.inc(
+            endpoint=endpoint, status=str(status) if status else "error"
+        )
+        exchange = Exchange(
+            datetime.now(),
+            method,
+            str(url).split("?", 1)[0],
+            status,
+            elapsed,
+            len(content),
+            content[:256],
+        )
+        self.exchanges.append(exchange)
+        log_lazy(
+            "TRACE",
+            lambda: escape_tag(
+                f"{method} {exchange.url} -> {status} "
+                f"({exchange.size} bytes, {exchange.elapsed:.3f}s)"
+            ),
+        )
+
+    @staticmethod
+    def _endpoint_name(url: Union[URL, str]) -> str:
+        # drop per-request ids such as the md5 in FileBatchControl/<md5>,
+        # every distinct label is a new time series
+        parts = str(url).split("?", 1)[0].rstrip("/").split("/")
+        while len(parts) > 1 and _ID_SEGMENT.fullmatch(parts[-1]):
+            parts.pop()
+        return parts[-1]
+
+    def _checked(self, content: bytes) -> dict:
+        try:
+            data = parse_checked(content, self.config.throttle_codes)
+        except QzoneApiError as err:
+            self.metrics.api_errors.inc(code=str(err.code), account=self.bot_id)
+            raise
+        if self.state == SessionState.DEGRADED:
+            # Qzone accepted the cookies, whatever failed before has passed
+            log("INFO", f"Session of {self.bot_id} recovered")
+            self.state = SessionState.READY
+        return data
+
+    def _adapt(self, operation: str, throttled: bool) -> None:
+        if throttled:
+            self.metrics.throttled.inc(operation=operation, account=self.bot_id)
+        if not self.config.adaptive_throttle:
+            return
+        if operation == "upload":
+            limit = math.ceil(self._upload_control.update(throttled))
+            if limit != self.upload_limiter.limit:
+                log("INFO", f"Upload concurrency of {self.bot_id} is now {limit}")
+                self.upload_limiter.limit = limit
+        else:
+            self.publish_limiter.rate = self._publish_control.update(throttled)
+            if throttled:
+                log(
+                    "WARNING",
+                    f"Throttled, publish rate of {self.bot_id} lowered to "
+                    f"{self.publish_limiter.rate:.3f}/s",
+                )
+
+    def _cookie_age(self) -> Optional[float]:
+        if self.cookies_last_refreshed is None or not self.logged_in:
+            return None
+        return (datetime.now() - self.cookies_last_refreshed).total_seconds()
+
+    def _endpoint_timeout(self, url: str) -> Optional[float]:
+        path = url.split("?", 1)[0]
+        for endpoint, timeout in self.config.endpoint_timeouts.items():
+            if path.endswith(endpoint):
+                return timeout
+        return None
 
     async def get(self, url: Union[URL, str], **kwargs) -> Response:
         return await self.request("GET", url, **kwargs)
@@ -60,63 +322,226 @@ class Session:
         if "uin" in value:
             self._save_cookies()
 
-    def _load_cookies(self) -> None:
-        if not os.path.isfile(self.config.cookie_path):
-            log("INFO", f"Cookie file {self.config.cookie_path} not found")
-            return
-
+    async def _load_cookies(self) -> None:
         try:
-            data = json.loads(self.config.cookie_path.read_text())
-            last_used = datetime.fromtimestamp(data["last_used"])
-            if datetime.now() - last_used > self.CookieRefreshTime:
-                log(
-                    "INFO",
-                    f"Cookies in {self.config.cookie_path} are considered expired",
-                )
-                self._delete_cookies()
+            record = await self.store.load(self.bot_id)
+            if record is None or record.value is None:
+                log("INFO", f"No stored cookies of {self.bot_id}")
+                self._cookie_version = record.version if record else 0
                 return
-
-            self.cookies_last_used = last_used
-            self.cookies.update(data["cookies"])
-            self.qq_number = self.cookies["uin"][1:]
-            log(
-                "INFO",
-                f"Cookies loaded from {self.config.cookie_path}: {self.qq_number} logged in",
-            )
+            self._adopt_cookies(record)
         except (json.decoder.JSONDecodeError, TypeError, KeyError) as err:
             log(
                 "INFO",
-                f"Cookies in {self.config.cookie_path} failed to parse: <{type(err).__name__}: {err}>",
+                f"Stored cookies of {self.bot_id} failed to parse: <{type(err).__name__}: {err}>",
             )
             self._delete_cookies()
+            return
+        except Exception as err:
+            # an unreachable store must not keep the adapter from starting
+            log("WARNING", f"Failed to load cookies of {self.bot_id}", err)
+            return
+        log("INFO", f"Cookies of {self.bot_id} loaded: validating {self.qq_number}")
+        # serve with the restored cookies while a probe checks them
+        self.state = SessionState.VALIDATING
+        self._validator = asyncio.create_task(self._validate_cookies())
 
-    def _save_cookies(self) -> None:
+    def _adopt_cookies(self, record: Record) -> None:
+        assert record.value is not None
+        data = json.loads(record.value)
+        cookies = Cookies()
+        cookies.update(data["cookies"])
+        qq_number = cookies["uin"][1:]
+        last_used = datetime.fromtimestamp(data["last_used"])
+        self._cookies = cookies
+        self.qq_number = qq_number
+        if self.cookies_last_used is None or last_used > self.cookies_last_used:
+            self.cookies_last_used = last_used
+        self.cookies_last_refreshed = datetime.fromtimestamp(
+            data.get("last_refreshed", data["last_used"])
+        )
+        self._cookie_version = record.version
+
+    async def _sync_cookies(self) -> None:
+        # pick up cookies another process refreshed or logged in with
+        record = await self.store.load(self.bot_id)
+        if record is None or record.version <= self._cookie_version:
+            return
+        if record.value is None:
+            # deleted elsewhere, whoever writes next needs the new version
+            self._cookie_version = record.version
+            return
+        self._adopt_cookies(record)
+        log("DEBUG", f"Cookies of {self.bot_id} synced from the store")
+
+    async def _store_cookies(self, text: Optional[str]) -> None:
+        while True:
+            version = await self.store.swap(self.bot_id, self._cookie_version, text)
+            if version is not None:
+                self._cookie_version = version
+                log("DEBUG", f"Cookies of {self.bot_id} saved as version {version}")
+                return
+            current = await self.store.load(self.bot_id)
+            if text is not None and current is not None and current.value is not None:
+                stored = json.loads(current.value)
+                ours = json.loads(text)
+                if stored.get("last_refreshed", 0) >= ours.get("last_refreshed", 0):
+                    # another process was faster with fresher cookies
+                    self._adopt_cookies(current)
+                    log("INFO", f"Cookies of {self.bot_id} were updated elsewhere")
+                    return
+            self._cookie_version = current.version if current else 0
+
+    def _dump_cookies(self) -> str:
         assert self.cookies_last_used
         data = {
             "last_used": self.cookies_last_used.timestamp(),
+            "last_refreshed": (
+                self.cookies_last_refreshed or self.cookies_last_used
+            ).timestamp(),
             "cookies": _cookies_to_dict(self.cookies),
         }
-        self.config.cookie_path.write_text(json.dumps(data))
-        log("INFO", f"Cookies saved to {self.config.cookie_path}: {data}")
+        return json.dumps(data)
+
+    def _save_cookies(self) -> None:
+        self._cookie_writer.schedule(self._dump_cookies)
 
     def _delete_cookies(self) -> None:
         self._cookies.clear()
-        os.remove(self.config.cookie_path)
-        log("INFO", f"Cookies deleted: {self.cookies}")
+        self._cookie_writer.schedule_delete()
+        log("INFO", f"Cookies of {self.bot_id} deleted")
+
+    async def refresh_cookies(self) -> None:
+        with self.metrics.operation_seconds.time(operation="refresh"):
+            await self._flights.do("refresh", self._refresh_cookies)
+
+    async def _refresh_cookies(self) -> None:
+        if not self.qq_number:
+            raise NotLoggedIn
+        response = await self.get(
+            f"https://user.qzone.qq.com/{self.qq_number}/more",
+            cookies=self.cookies,
+        )
+        assert response.request
+        self.cookies_last_used = datetime.now()
+        self.cookies_last_refreshed = self.cookies_last_used
+        self.cookies = response.request.cookies
+        log("DEBUG", f"Cookies of {self.qq_number} refreshed")
+
+    def _idle_time(self) -> timedelta:
+        if self.cookies_last_used is None:
+            return self.CookieRefreshTime
+        return datetime.now() - self.cookies_last_used
 
     async def _maintain_cookies(self) -> None:
+        # refresh only sessions that have been idle for CookieRefreshTime,
+        # requests made in between keep the cookies alive on their own
+        retry = self.RefreshRetryTime
         while True:
-            if self.qq_number:
-                response = await self.get(
-                    f"https://user.qzone.qq.com/{self.qq_number}/more",
+            if not self.qq_number:
+                await asyncio.sleep(self.CookieRefreshTime.total_seconds())
+                continue
+            wait = self.CookieRefreshTime - self._idle_time()
+            if wait > timedelta(0):
+                await asyncio.sleep(wait.total_seconds())
+                continue
+            try:
+                # another process may have refreshed them meanwhile, and only
+                # the holder of the lease refreshes
+                await self._sync_cookies()
+                if self._idle_time() < self.CookieRefreshTime:
+                    continue
+                if not await self._refresh_as_leader():
+                    await asyncio.sleep(self.RefreshRetryTime.total_seconds())
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                self.refresh_error = err
+                self.state = SessionState.DEGRADED
+                log(
+                    "ERROR",
+                    f"Failed to refresh cookies of {self.qq_number}, "
+                    f"retrying in {retry.total_seconds()}s",
+                    err,
                 )
-                assert response.request
-                self.cookies = response.request.cookies
-                log("DEBUG", f"Cookies updated: {self.cookies}")
-            await asyncio.sleep(self.CookieRefreshTime.total_seconds())
+                await asyncio.sleep(retry.total_seconds())
+                retry = min(retry * 2, self.CookieRefreshTime)
+            else:
+                self.refresh_error = None
+                if self.state == SessionState.DEGRADED:
+                    self.state = SessionState.READY
+                retry = self.RefreshRetryTime
+
+    async def _refresh_as_leader(self) -> bool:
+        lease = f"refresh-{self.bot_id}"
+        ttl = self.RefreshLeaseTime.total_seconds()
+        if not await self.store.acquire_lease(lease, self._lease_owner, ttl):
+            return False
+        try:
+            await self.refresh_cookies()
+            # let the others see the new cookies before they may take over
+            await self._cookie_writer.flush()
+        finally:
+            await self.store.release_lease(lease, self._lease_owner)
+        return True
+
+    @staticmethod
+    def _on_maintainer_done(task: "asyncio.Task[None]") -> None:
+        if not task.cancelled() and task.exception():
+            log("ERROR", "Cookie maintainer stopped", task.exception())
+
+    async def _probe(self) -> bool:
+        try:
+            await self.get_posts(num=1)
+        except AuthExpired:
+            return False
+        return True
+
+    async def _validate_cookies(self) -> None:
+        try:
+            valid = await self._probe()
+        except Exception as err:
+            # can't tell either way, keep the cookies; the next successful
+            # request or refresh clears the state
+            self.state = SessionState.DEGRADED
+            log("WARNING", f"Failed to validate cookies of {self.qq_number}", err)
+            return
+
+        if valid:
+            self.state = SessionState.READY
+            log("INFO", f"Cookies validated: {self.qq_number} logged in")
+            return
+
+        log("INFO", f"Cookies of {self.bot_id} are expired")
+        self.qq_number = None
+        self.state = SessionState.LOGGED_OUT
+        self._delete_cookies()
+        if self.config.auto_login:
+            self._login_task = asyncio.create_task(self._auto_login())
 
-    def close(self) -> None:
-        self.maintainer.cancel()
+    async def _auto_login(self) -> None:
+        try:
+            await self.login()
+        except AlreadyLoggedIn:
+            pass
+        except Exception as err:
+            log("ERROR", "Automatic QR code login failed", err)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == SessionState.READY
+
+    async def close(self) -> None:
+        for task in (self.maintainer, self._validator, self._login_task):
+            if task:
+                task.cancel()
+        await self.transport.close()
+        await self._cookie_writer.flush()
+        if self._owns_store:
+            await self.store.close()
+        if self._owns_processor:
+            self.processor.close()
 
     @property
     def logged_in(self) -> bool:
@@ -144,9 +569,9 @@ class Session:
         qrcode = await self.get(
             "https://ssl.ptlogin2.qq.com/ptqrshow?appid=549000912&e=2&l=M&s=3&d=72&v=4&t=0.405252856480647&daid=5&pt_3rd_aid=0&u1=https%3A%2F%2Fqzs.qzone.qq.com%2Fqzone%2Fv5%2Floginsucc.html%3Fpara%3Dizone",
         )
-        save_image(qrcode.content, self.config.qrcode_path)
-        open_file(self.config.qrcode_path)
-        log("INFO", f"QRCode successfully saved to {self.config.qrcode_path}")
+        save_image(qrcode.content, self.qrcode_path)
+        open_file(self.qrcode_path)
+        log("INFO", f"QRCode successfully saved to {self.qrcode_path}")
         assert qrcode.request
         self.cookies = qrcode.request.cookies
 
@@ -166,16 +591,208 @@ class Session:
         return matcher.group(1) if matcher else None
 
     def _get_qzreferrer(self) -> str:
-        return f"https://user.qzone.qq.com/{self.qq_number}"
+        assert self.qq_number
+        if self._qzreferrer is None or self._qzreferrer[0] != self.qq_number:
+            self._qzreferrer = (
+                self.qq_number,
+                f"https://user.qzone.qq.com/{self.qq_number}",
+            )
+        return self._qzreferrer[1]
 
     def _get_gtk(self) -> int:
-        return self._calc_gtk(self.cookies["p_skey"])
+        # g_tk only changes together with p_skey
+        p_skey = self.cookies["p_skey"]
+        if self._gtk is None or self._gtk[0] != p_skey:
+            self._gtk = (p_skey, self._calc_gtk(p_skey))
+        return self._gtk[1]
 
     def _get_qq_number(self) -> str:
         return self.cookies["uin"][1:]
 
-    async def _upload_image(self, uri: str) -> dict:
-        log("DEBUG", f"Upload images with\n{self.cookies}")
+    async def _upload_image(self, image: bytes) -> UploadResult:
+        threshold = self.config.upload_slice_threshold
+        if threshold is not None and len(image) >= threshold:
+            checksum = await asyncio.to_thread(lambda: hashlib.md5(image).hexdigest())
+            return await self._upload_image_sliced(
+                BytesSource(image), checksum, len(image)
+            )
+        return await self._guard_upload(
+            len(image), lambda: self._do_upload_image(image)
+        )
+
+    async def _upload_image_sliced(
+        self, source: MediaSource, checksum: str, size: int
+    ) -> UploadResult:
+        data = await self._guard_upload(
+            size, lambda: self._upload_sliced(source, "image", checksum, size)
+        )
+        return UploadResult.from_slices(data)
+
+    async def _guard_upload(self, size: int, func: Callable[[], Awaitable[T]]) -> T:
+        try:
+            with self.breaker, self.metrics.operation_seconds.time(operation="upload"):
+                ret = await func()
+        except Throttled:
+            self._adapt("upload", True)
+            raise
+        self._adapt("upload", False)
+        self.metrics.upload_bytes.inc(size, account=self.bot_id)
+        return ret
+
+    async def _upload_sliced(
+        self, source: MediaSource, kind: str, checksum: str, size: int
+    ) -> Dict[str, Any]:
+        if not size:
+            raise ValueError("Cannot upload an empty file")
+        assert self.qq_number
+        upload = SlicedUpload(
+            source,
+            size,
+            lambda: self._post_slice_control(kind, checksum, size),
+            lambda progress, offset, retry, chunk, last: self._post_slice(
+                kind, checksum, size, progress, offset, retry, chunk, last
+            ),
+            self.config.upload_slice_dir / f"{self.qq_number}-{kind}-{checksum}.json",
+            self.config.upload_slice_concurrency,
+            self.config.upload_slice_retries,
+        )
+        try:
+            return await upload.run()
+        finally:
+            if upload.retried:
+                self.metrics.upload_slice_retries.inc(
+                    upload.retried, account=self.bot_id
+                )
+
+    async def _post_slice_control(
+        self, kind: str, checksum: str, size: int
+    ) -> Tuple[str, int]:
+        response = await self.post(
+            f"https://h5.qzone.qq.com/webapp/json/sliceUpload/FileBatchControl/{checksum}?g_tk={self._get_gtk()}",
+            json={
+                "control_req": [
+                    {
+                        "uin": self.qq_number,
+                        "token": {
+                            "type": 4,
+                            "data": self.cookies["p_skey"],
+                            "appid": 5,
+                        },
+                        "appid": SLICE_APPIDS[kind],
+                        "checksum": checksum,
+                        "check_type": 0,
+                        "file_len": size,
+                        "env": {"refer": "qzone", "deviceInfo": "h5"},
+                        "model": 0,
+                        "biz_req": {
+                            "sAlbumID": "",
+                            "iAlbumTypeID": 7,
+                            "iBitmap": 0,
+                            "iUploadType": 3 if kind == "video" else 0,
+                            "iBatchID": int(time.time() * 1000),
+                            "iNeedFeeds": 0,
+                            "mapExt": {"appid": "qzone", "userid": self.qq_number},
+                        },
+                        "session": "",
+                        "asy_upload": 0,
+                        "cmd": "FileUpload",
+                    }
+                ]
+            },
+        )
+        if response.status_code != 200:
+            raise UnexpectedResponse(f"HTTP {response.status_code}")
+        assert isinstance(response.content, bytes)
+        data = self._checked(response.content).get("data") or {}
+        if not data.get("session"):
+            raise UnexpectedResponse("no upload session", response.content)
+        return data["session"], int(data.get("slice_size") or SLICE_SIZE)
+
+    async def _post_slice(
+        self,
+        kind: str,
+        checksum: str,
+        size: int,
+        progress: SliceProgress,
+        offset: int,
+        retry: int,
+        chunk: bytes,
+        last: bool,
+    ) -> Dict[str, Any]:
+        seq = offset // progress.slice_size
+        end = offset + len(chunk)
+        response = await self.post(
+            "https://h5.qzone.qq.com/webapp/json/sliceUpload/FileUpload",
+            params={
+                "seq": seq,
+                "retry": retry,
+                "offset": offset,
+                "end": end,
+                "total": size,
+                "type": "form",
+                "g_tk": self._get_gtk(),
+            },
+            data={
+                "uin": self.qq_number,
+                "appid": SLICE_APPIDS[kind],
+                "session": progress.session,
+                "offset": offset,
+                "checksum": checksum,
+                "check_type": 0,
+                "retry": retry,
+                "seq": seq,
+                "end": end,
+                "cmd": "FileUpload",
+                "slice_size": progress.slice_size,
+            },
+            files={"data": ("blob", chunk, "application/octet-stream")},
+        )
+        if response.status_code >= 500:
+            raise HostUnavailable("FileUpload", f"HTTP {response.status_code}")
+        if response.status_code != 200:
+            raise UnexpectedResponse(f"HTTP {response.status_code}")
+        assert isinstance(response.content, bytes)
+        data = self._checked(response.content).get("data") or {}
+        if last and not data:
+            raise UnexpectedResponse("no result after the last slice", response.content)
+        return data
+
+    async def upload_video(
+        self, source: MediaSource, cover: Optional[MediaSource] = None
+    ) -> Tuple[VideoResult, Optional[UploadResult]]:
+        # videos always go in slices and are never read into memory whole
+        if not self.logged_in:
+            raise NotLoggedIn
+        spooled = None
+        if not source.reopenable:
+            source = spooled = await spool(source, self.config.upload_slice_dir)
+        try:
+            if cover is None and self.config.video_cover:
+                frame = await extract_cover(source, self.config.ffmpeg_path)
+                cover = BytesSource(frame) if frame else None
+            # the cover takes its own upload slot
+            video, image = await asyncio.gather(
+                self._upload_video(source),
+                self._upload_image_cached(cover) if cover else asyncio.sleep(0),
+            )
+        finally:
+            if spooled is not None:
+                await asyncio.to_thread(remove_file_if_exists, spooled.path)
+        if image is not None:
+            await self.upload_cache.flush()
+        return video, image
+
+    async def _upload_video(self, source: MediaSource) -> VideoResult:
+        async with self.upload_limiter:
+            _, checksum, size = await measure(source)
+            data = await self._guard_upload(
+                size, lambda: self._upload_sliced(source, "video", checksum, size)
+            )
+        return VideoResult.from_slices(data)
+
+    async def _do_upload_image(self, image: bytes) -> UploadResult:
+        # encode only now, so the base64 copy lives just as long as the request
+        picfile = await asyncio.to_thread(to_data_uri, image, guess_mime(image))
         data = {
             "qzreferrer": self._get_qzreferrer(),
             "filename": "filename",
@@ -192,8 +809,8 @@ class Session:
             "hd_width": 2048,
             "hd_height": 10000,
             "hd_quality": 96,
-            "backUrls": "http://upbak.photo.qzone.qq.com/cgi-bin/upload/cgi_upload_image,http://119.147.64.75/cgi-bin/upload/cgi_upload_image",
-            "url": f"https://up.qzone.qq.com/cgi-bin/upload/cgi_upload_image?g_tk={self._get_gtk()}",
+            "backUrls": ",".join(self.config.upload_hosts[1:]),
+            "url": f"{self.config.upload_hosts[0]}?g_tk={self._get_gtk()}",
             "base64": 1,
             "skey": self.cookies["skey"],
             "zzpaneluin": self.qq_number,
@@ -201,118 +818,627 @@ class Session:
             "p_skey": self.cookies["p_skey"],
             "jsonhtml_callback": "callback",
             "p_uin": self.qq_number,
-            "picfile": uri,
+            "picfile": picfile,
         }
-        html = await self.post(
-            f"https://up.qzone.qq.com/cgi-bin/upload/cgi_upload_image?g_tk={self._get_gtk()}",
-            data=data,
+        content = await self._post_upload(data)
+        return UploadResult.from_dict(self._checked(content).get("data"))
+
+    async def _post_upload(self, data: Dict[str, Union[int, str, None]]) -> bytes:
+        # start on the fastest healthy host, fail over on timeouts and 5xx,
+        # optionally racing a backup once an attempt is slower than usual
+        hosts = self.upload_hosts.ranked()
+        hedge = (
+            self.upload_hosts.hedge_delay(self.config.upload_hedge_percentile)
+            if self.config.upload_hedge_percentile
+            else None
+        )
+        pending: Dict["asyncio.Task[bytes]", Tuple[HostHealth, float]] = {}
+        tried = 0
+        error: Optional[BaseException] = None
+
+        def launch() -> None:
+            nonlocal tried
+            host = hosts[tried]
+            tried += 1
+            task = asyncio.create_task(self._attempt_upload(host, data))
+            pending[task] = host, time.perf_counter()
+
+        launch()
+        try:
+            while pending:
+                timeout = hedge if tried < len(hosts) else None
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    log_lazy("DEBUG", lambda: f"Hedging upload after {hedge:.3f}s")
+                    hedge = None
+                    launch()
+                    continue
+                for task in done:
+                    host, start = pending.pop(task)
+                    try:
+                        content = task.result()
+                    except HostUnavailable as err:
+                        log("WARNING", f"Upload to {host.url} failed: {err.reason}")
+                        error = err
+                        continue
+                    # the hosts still racing were slower than this one
+                    now = time.perf_counter()
+                    for loser, loser_start in pending.values():
+                        loser.record_loss(max(now - loser_start, now - start))
+                    return content
+                if not pending and tried < len(hosts):
+                    launch()
+            assert error
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _attempt_upload(
+        self, host: HostHealth, data: Dict[str, Union[int, str, None]]
+    ) -> bytes:
+        start = time.perf_counter()
+        try:
+            response = await self.post(f"{host.url}?g_tk={self._get_gtk()}", data=data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            host.record_failure()
+            raise HostUnavailable(host.url, f"{type(err).__name__}: {err}") from err
+        if response.status_code >= 500:
+            host.record_failure()
+            raise HostUnavailable(host.url, f"HTTP {response.status_code}")
+        elapsed = time.perf_counter() - start
+        host.record_success(elapsed)
+        self.upload_hosts.observe(elapsed)
+        assert isinstance(response.content, bytes)
+        return response.content
+
+    async def _cached_upload(self, digest: str) -> Optional[UploadResult]:
+        assert self.qq_number
+        cached = await self.upload_cache.get(self.qq_number, digest)
+        if cached is None:
+            return None
+        log_lazy("DEBUG", lambda: f"Upload cache hit for image {digest}")
+        self.metrics.upload_cache_hits.inc(account=self.bot_id)
+        return UploadResult.from_dict(cached)
+
+    async def _streams_to_slices(self, source: MediaSource) -> bool:
+        # big files nothing needs to look into are uploaded straight from
+        # their source, without reading them into memory
+        threshold = self.config.upload_slice_threshold
+        if threshold is None or self.processor.enabled:
+            return False
+        size = await source.size()
+        return size is not None and size >= threshold
+
+    async def _upload_image_cached(self, source: MediaSource) -> UploadResult:
+        assert self.qq_number
+        async with self.upload_limiter:
+            if await self._streams_to_slices(source):
+                digest, checksum, size = await measure(source)
+                ret = await self._cached_upload(digest)
+                if ret is None:
+                    ret = await self._upload_image_sliced(source, checksum, size)
+                    await self.upload_cache.put(self.qq_number, digest, ret.to_dict())
+                return ret
+            image = await source.read()
+            # keyed on the original bytes, so a hit skips preprocessing too
+            digest = await asyncio.to_thread(image_digest, image)
+            if self.processor.variant:
+                digest = f"{digest}-{self.processor.variant}"
+            cached = await self._cached_upload(digest)
+            if cached is not None:
+                return cached
+            processed = await self.processor.process(image)
+            if len(processed) < len(image):
+                self.metrics.preprocess_saved_bytes.inc(
+                    len(image) - len(processed), account=self.bot_id
+                )
+            del image
+            ret = await self._upload_image(processed)
+        await self.upload_cache.put(self.qq_number, digest, ret.to_dict())
+        return ret
+
+    async def upload_images(self, images: List[MediaSource]) -> List[UploadResult]:
+        if not self.logged_in:
+            raise NotLoggedIn
+        # gather keeps results in the order of `images`
+        results = await asyncio.gather(
+            *(self._upload_image_cached(img) for img in images)
         )
-        assert isinstance(html.content, bytes)
-        log("DEBUG", f"Upload result {html}")
-        html = html.content.decode()
-        log("DEBUG", escape_tag(html))
-        return json.loads(html[html.find("data") + 6 : html.find("ret") - 2])
+        await self.upload_cache.flush()
+        return list(results)
 
     async def login(self):
         if self.logged_in:
             raise AlreadyLoggedIn
 
+        with self.metrics.operation_seconds.time(operation="login"):
+            await self._login()
+        log("INFO", f"Logged in successfully, QQ number is {self.qq_number}")
+
+    async def _login(self) -> None:
         await self._get_qrcode()
         while True:
             await asyncio.sleep(1)
             check_sig_link = await self._check_qrcode()
             if check_sig_link:
-                # log("DEBUG", matcher.group(1))
-                log("DEBUG", str(self.cookies))
                 response = await self.get(check_sig_link)
                 assert response.request
                 self.cookies = response.request.cookies
                 self.qq_number = self._get_qq_number()
+                self.cookies_last_refreshed = datetime.now()
+                self.state = SessionState.READY
                 break
-        remove_file(self.config.qrcode_path)
-        log("DEBUG", str(self.cookies))
-        # log("DEBUG", self.cookies["p_skey"])
-        log("INFO", f"Logged in successfully, QQ number is {self.qq_number}")
+        remove_file(self.qrcode_path)
 
     async def logout(self):
         if not self.logged_in:
             raise NotLoggedIn
         self.qq_number = None
+        self.state = SessionState.LOGGED_OUT
         self._delete_cookies()
         log("INFO", "Logged out successfully")
 
+    def recently_failed(self, window: timedelta) -> bool:
+        if self.last_failure is None:
+            return False
+        return time.monotonic() - self.last_failure < window.total_seconds()
+
     async def publish(
-        self, content: str = "", images: Optional[List[str]] = None
+        self,
+        content: str = "",
+        images: Optional[List[MediaSource]] = None,
+        video: Optional[VideoMedia] = None,
     ) -> Tuple[str, List[str]]:
         if not self.logged_in:
             raise NotLoggedIn
+        if self.breaker.is_open:
+            raise CircuitOpen(self.breaker.retry_after())
+        self.pending_publishes += 1
+        try:
+            with self.metrics.operation_seconds.time(operation="publish"):
+                return await self._publish(content, images, video)
+        except Exception:
+            self.last_failure = time.monotonic()
+            raise
+        finally:
+            self.pending_publishes -= 1
+
+    async def publish_many(
+        self,
+        posts: List[Tuple[str, List[MediaSource], Optional[VideoMedia]]],
+        rate_limited: bool = True,
+    ) -> List[Union[Tuple[str, List[str]], Exception]]:
+        # upload the media of the next posts while the current one is being
+        # published, results and errors come back in input order
+        if not self.logged_in:
+            raise NotLoggedIn
+        if self.breaker.is_open:
+            raise CircuitOpen(self.breaker.retry_after())
+        depth = self.config.publish_prefetch
+        prepared: List["asyncio.Task[Tuple[Dict[str, Union[int, str]], List[str]]]"]
+        prepared = []
+        results: List[Union[Tuple[str, List[str]], Exception]] = []
+        self.pending_publishes += len(posts)
+        try:
+            for index in range(len(posts)):
+                while len(prepared) < min(index + depth + 1, len(posts)):
+                    prepared.append(
+                        asyncio.create_task(
+                            self._prepare_publish(*posts[len(prepared)])
+                        )
+                    )
+                try:
+                    with self.metrics.operation_seconds.time(operation="publish"):
+                        data, pic_id = await prepared[index]
+                        if rate_limited:
+                            await self.publish_limiter.acquire()
+                        results.append((await self._submit_publish(data), pic_id))
+                except Exception as err:
+                    self.last_failure = time.monotonic()
+                    results.append(err)
+                self.pending_publishes -= 1
+        finally:
+            self.pending_publishes -= len(posts) - len(results)
+            for task in prepared:
+                task.cancel()
+        return results
+
+    async def _publish(
+        self,
+        content: str,
+        images: Optional[List[MediaSource]],
+        video: Optional[VideoMedia] = None,
+    ) -> Tuple[str, List[str]]:
+        data, pic_id = await self._prepare_publish(content, images, video)
+        return await self._submit_publish(data), pic_id
+
+    async def _prepare_publish(
+        self,
+        content: str,
+        images: Optional[List[MediaSource]],
+        video: Optional[VideoMedia] = None,
+    ) -> Tuple[Dict[str, Union[int, str]], List[str]]:
         assert self.qq_number
-        log("DEBUG", f"Publish with\n{self.cookies}")
+        if images and video:
+            raise ValueError("A post can't carry both images and a video")
 
-        data: Dict[str, Union[int, str]] = {}
+        data: Dict[str, Union[int, str]] = {
+            "syn_tweet_version": 1,
+            "paramstr": 1,
+            "pic_template": "",
+            "richtype": "",
+            "richval": "",
+            "special_url": "",
+            "subrichtype": "",
+            "con": content,
+            "feedversion": 1,
+            "ver": 1,
+            "ugc_right": 1,
+            "to_sign": 0,
+            "hostuin": self.qq_number,
+            "code_version": 1,
+            "format": "fs",
+            "qzreferrer": self._get_qzreferrer(),
+        }
         pic_id: List[str] = []
-        if not images:
-            data = {
-                "syn_tweet_version": 1,
-                "paramstr": 1,
-                "pic_template": "",
-                "richtype": "",
-                "richval": "",
-                "special_url": "",
-                "subrichtype": "",
-                "con": content,
-                "feedversion": 1,
-                "ver": 1,
-                "ugc_right": 1,
-                "to_sign": 0,
-                "hostuin": self.qq_number,
-                "code_version": 1,
-                "format": "fs",
-                "qzreferrer": self._get_qzreferrer(),
-            }
-        else:
+        if images:
             richval = []
             pic_bo = []
-            for img in images:
-                ret = await self._upload_image(img)
-                richval.append(
-                    ",{0},{1},{2},{3},{4},{5},,{4},{5}".format(
-                        ret["albumid"],
-                        ret["lloc"],
-                        ret["sloc"],
-                        ret["type"],
-                        ret["height"],
-                        ret["width"],
-                    )
-                )
-                pic_bo.append(ret["pre"][ret["pre"].find("bo=") + 3 :])
-                pic_id.append(ret["lloc"])
-            data = {
-                "syn_tweet_version": 1,
-                "paramstr": 1,
-                "pic_template": f"tpl-{len(images)}-1",
-                "richtype": 1,
-                "richval": "\t".join(richval),
-                "special_url": "",
-                "subrichtype": 1,
-                "con": content,
-                "feedversion": 1,
-                "ver": 1,
-                "ugc_right": 1,
-                "to_sign": 0,
+            for ret in await self.upload_images(images):
+                richval.append(ret.richval)
+                pic_bo.append(ret.bo)
+                pic_id.append(ret.lloc)
+            data.update(
+                {
+                    "pic_template": f"tpl-{len(images)}-1",
+                    "richtype": 1,
+                    "richval": "\t".join(richval),
+                    "subrichtype": 1,
+                    "pic_bo": "{0}\t{0}".format(",".join(pic_bo)),
+                }
+            )
+        elif video:
+            ret, cover = await self.upload_video(*video)
+            pic_id.append(ret.vid)
+            data.update(
+                {"richtype": 3, "richval": ret.richval(cover), "subrichtype": 3}
+            )
+            if cover is not None:
+                data["pic_bo"] = "{0}\t{0}".format(cover.bo)
+        return data, pic_id
+
+    async def _submit_publish(self, data: Dict[str, Union[int, str]]) -> str:
+        try:
+            with self.breaker:
+                try:
+                    ret = await self._post_publish(data)
+                except AuthExpired:
+                    await self.refresh_cookies()
+                    ret = await self._post_publish(data)
+        except Throttled:
+            self._adapt("publish", True)
+            raise
+        self._adapt("publish", False)
+        self._reads.clear()
+        return ret.tid
+
+    async def _cached_read(self, key: Tuple, fetch: Callable[[], Awaitable[T]]) -> T:
+        if not self.logged_in:
+            raise NotLoggedIn
+        if self._reads.fresh(key):
+            result = "hit"
+        elif self._reads.in_flight(key):
+            result = "shared"
+        else:
+            result = "miss"
+        self.metrics.read_cache.inc(
+            operation=key[0], result=result, account=self.bot_id
+        )
+        return await self._reads.get(key, fetch)
+
+    async def get_profile(self) -> dict:
+        return await self._cached_read(("profile",), self._fetch_profile)
+
+    async def _fetch_profile(self) -> dict:
+        response = await self.get(
+            "https://h5.qzone.qq.com/proxy/domain/base.qzone.qq.com/cgi-bin/user/cgi_userinfo_get_all",
+            params={
+                "uin": self.qq_number,
+                "vuin": self.qq_number,
+                "fupdate": 1,
+                "g_tk": self._get_gtk(),
+            },
+        )
+        if response.status_code != 200:
+            raise UnexpectedResponse(f"HTTP {response.status_code}")
+        assert isinstance(response.content, bytes)
+        return self._checked(response.content).get("data") or {}
+
+    async def get_post(self, tid: str) -> dict:
+        return await self._cached_read(("post", tid), lambda: self._fetch_post(tid))
+
+    async def _fetch_post(self, tid: str) -> dict:
+        response = await self.get(
+            "https://user.qzone.qq.com/proxy/domain/taotao.qq.com/cgi-bin/emotion_cgi_msgdetail_v6",
+            params={
+                "uin": self.qq_number,
+                "tid": tid,
+                "format": "json",
+                "g_tk": self._get_gtk(),
+            },
+        )
+        if response.status_code != 200:
+            raise UnexpectedResponse(f"HTTP {response.status_code}")
+        assert isinstance(response.content, bytes)
+        return self._checked(response.content)
+
+    async def get_visitors(self) -> dict:
+        return await self._cached_read(("visitors",), self._fetch_visitors)
+
+    async def _fetch_visitors(self) -> dict:
+        response = await self.get(
+            "https://user.qzone.qq.com/proxy/domain/g.qzone.qq.com/cgi-bin/friendshow/cgi_get_visitor_simple",
+            params={
+                "uin": self.qq_number,
+                "mask": 2,
+                "mod": 2,
+                "fupdate": 1,
+                "g_tk": self._get_gtk(),
+            },
+        )
+        if response.status_code != 200:
+            raise UnexpectedResponse(f"HTTP {response.status_code}")
+        assert isinstance(response.content, bytes)
+        return self._checked(response.content).get("data") or {}
+
+    async def get_posts(
+        self, pos: int = 0, num: int = 20, replies: int = 0, cached: bool = False
+    ) -> List[dict]:
+        # the feed poller and cleanup need what's there right now
+        if cached:
+            return await self._cached_read(
+                ("posts", pos, num, replies),
+                lambda: self._fetch_posts(pos, num, replies),
+            )
+        if not self.logged_in:
+            raise NotLoggedIn
+        return await self._fetch_posts(pos, num, replies)
+
+    async def _fetch_posts(self, pos: int, num: int, replies: int) -> List[dict]:
+        response = await self.get(
+            "https://user.qzone.qq.com/proxy/domain/taotao.qq.com/cgi-bin/emotion_cgi_msglist_v6",
+            params={
+                "uin": self.qq_number,
+                "pos": pos,
+                "num": num,
+                "replynum": replies,
+                "format": "json",
+                "g_tk": self._get_gtk(),
+            },
+        )
+        if response.status_code != 200:
+            raise UnexpectedResponse(f"HTTP {response.status_code}")
+        assert isinstance(response.content, bytes)
+        return self._checked(response.content).get("msglist") or []
+
+    def _like_key(self, tid: str) -> str:
+        return f"http://user.qzone.qq.com/{self.qq_number}/mood/{tid}"
+
+    async def get_like_counts(self, tids: List[str]) -> Dict[str, int]:
+        # one request covers every post
+        if not self.logged_in:
+            raise NotLoggedIn
+        if not tids:
+            return {}
+        keys = {self._like_key(tid): tid for tid in tids}
+        response = await self.get(
+            "https://user.qzone.qq.com/proxy/domain/r.qzone.qq.com/cgi-bin/user/qz_opcnt2",
+            params={
+                "unikey": "<|>".join(keys),
+                "face": "<|>".join("0" for _ in keys),
+                "fupdate": 1,
+                "g_tk": self._get_gtk(),
+            },
+        )
+        if response.status_code != 200:
+            raise UnexpectedResponse(f"HTTP {response.status_code}")
+        assert isinstance(response.content, bytes)
+        counts: Dict[str, int] = {}
+        for item in self._checked(response.content).get("data") or []:
+            tid = keys.get(item.get("key", ""))
+            if tid is not None:
+                counts[tid] = int(item["current"]["likedata"]["cnt"])
+        return counts
+
+    async def get_likers(self, tid: str, count: int = 60) -> List[dict]:
+        if not self.logged_in:
+            raise NotLoggedIn
+        response = await self.get(
+            "https://user.qzone.qq.com/proxy/domain/users.qzone.qq.com/cgi-bin/likes/get_like_list_app",
+            params={
+                "uin": self.qq_number,
+                "unikey": self._like_key(tid),
+                "begin_uin": 0,
+                "query_count": count,
+                "if_first_page": 1,
+                "g_tk": self._get_gtk(),
+            },
+        )
+        if response.status_code != 200:
+            raise UnexpectedResponse(f"HTTP {response.status_code}")
+        assert isinstance(response.content, bytes)
+        data = self._checked(response.content).get("data") or {}
+        return data.get("like_uin_info") or []
+
+    async def like(self, tid: str, owner: Optional[str] = None) -> None:
+        owner = owner or self.qq_number
+        await self._engage(("like", owner, tid), lambda: self._post_like(tid, owner))
+
+    async def comment(
+        self, tid: str, content: str, owner: Optional[str] = None
+    ) -> Optional[str]:
+        owner = owner or self.qq_number
+        return await self._engage(
+            ("comment", owner, tid, content),
+            lambda: self._post_comment(owner, tid, content),
+        )
+
+    async def reply(
+        self,
+        tid: str,
+        comment_id: str,
+        comment_uin: str,
+        content: str,
+        owner: Optional[str] = None,
+    ) -> Optional[str]:
+        owner = owner or self.qq_number
+        return await self._engage(
+            ("reply", owner, tid, comment_id, content),
+            lambda: self._post_comment(
+                owner,
+                tid,
+                content,
+                {"commentId": comment_id, "commentUin": comment_uin, "paramstr": 2},
+            ),
+        )
+
+    async def engage_many(
+        self, actions: List[Dict[str, Any]]
+    ) -> List[Union[Optional[str], Exception]]:
+        # bounded by engage_concurrency, results and errors in input order
+        handlers = {"like": self.like, "comment": self.comment, "reply": self.reply}
+
+        async def run(action: Dict[str, Any]) -> Optional[str]:
+            params = dict(action)
+            handler = handlers.get(params.pop("action", None))
+            if handler is None:
+                raise ValueError(f"Unknown action {action.get('action')!r}")
+            return await handler(**params)
+
+        return await asyncio.gather(
+            *(run(action) for action in actions), return_exceptions=True
+        )
+
+    async def _engage(self, key: Tuple, func: Callable[[], Awaitable[T]]) -> T:
+        # the same action on the same target shortly after runs only once
+        if not self.logged_in:
+            raise NotLoggedIn
+        if self._engagements.in_flight(key):
+            log_lazy("DEBUG", lambda: f"Coalescing {key[0]} on {key[2]}")
+
+        async def call() -> T:
+            async with self._engage_limiter:
+                with self.breaker, self.metrics.operation_seconds.time(
+                    operation=key[0]
+                ):
+                    try:
+                        return await func()
+                    except AuthExpired:
+                        await self.refresh_cookies()
+                        return await func()
+                    except Throttled:
+                        self.metrics.throttled.inc(
+                            operation=key[0], account=self.bot_id
+                        )
+                        raise
+
+        return await self._engagements.do(key, call)
+
+    async def delete(self, tid: str) -> None:
+        await self._engage(
+            ("delete", self.qq_number, tid), lambda: self._post_delete(tid)
+        )
+        self._reads.clear()
+
+    async def _post_delete(self, tid: str) -> None:
+        response = await self.post(
+            f"https://user.qzone.qq.com/proxy/domain/taotao.qzone.qq.com/cgi-bin/emotion_cgi_delete_v6?g_tk={self._get_gtk()}",
+            data={
                 "hostuin": self.qq_number,
+                "tid": tid,
+                "t1_source": 1,
                 "code_version": 1,
                 "format": "fs",
                 "qzreferrer": self._get_qzreferrer(),
-                "pic_bo": "{0}\t{0}".format(",".join(pic_bo)),
-            }
+            },
+        )
+        if response.status_code != 200:
+            raise UnexpectedResponse(f"HTTP {response.status_code}")
+        assert isinstance(response.content, bytes)
+        self._checked(response.content)
+
+    async def _post_like(self, tid: str, owner: str) -> None:
+        key = f"http://user.qzone.qq.com/{owner}/mood/{tid}"
+        response = await self.post(
+            f"https://user.qzone.qq.com/proxy/domain/w.qzone.qq.com/cgi-bin/likes/internal_dolike_app?g_tk={self._get_gtk()}",
+            data={
+                "qzreferrer": self._get_qzreferrer(),
+                "opuin": self.qq_number,
+                "unikey": key,
+                "curkey": key,
+                "from": 1,
+                "appid": 311,
+                "typeid": 0,
+                "abstime": int(time.time()),
+                "fid": tid,
+                "active": 0,
+                "fupdate": 1,
+            },
+        )
+        if response.status_code != 200:
+            raise UnexpectedResponse(f"HTTP {response.status_code}")
+        assert isinstance(response.content, bytes)
+        self._checked(response.content)
+
+    async def _post_comment(
+        self,
+        owner: str,
+        tid: str,
+        content: str,
+        extra: Optional[Dict[str, Union[int, str]]] = None,
+    ) -> Optional[str]:
+        data: Dict[str, Union[int, str, None]] = {
+            "topicId": f"{owner}_{tid}__1",
+            "feedsType": 100,
+            "inCharset": "utf-8",
+            "outCharset": "utf-8",
+            "plat": "qzone",
+            "source": "ic",
+            "hostUin": owner,
+            "isSignIn": "",
+            "platformid": 52,
+            "uin": self.qq_number,
+            "format": "fs",
+            "ref": "feeds",
+            "content": content,
+            "richval": "",
+            "richtype": "",
+            "private": 0,
+            "paramstr": 1,
+            "qzreferrer": self._get_qzreferrer(),
+        }
+        data.update(extra or {})
+        response = await self.post(
+            f"https://user.qzone.qq.com/proxy/domain/taotao.qzone.qq.com/cgi-bin/emotion_cgi_re_feeds?g_tk={self._get_gtk()}",
+            data=data,
+        )
+        if response.status_code != 200:
+            raise UnexpectedResponse(f"HTTP {response.status_code}")
+        assert isinstance(response.content, bytes)
+        ret = self._checked(response.content)
+        comment_id = (ret.get("data") or {}).get("commentid")
+        return None if comment_id is None else str(comment_id)
 
+    async def _post_publish(self, data: Dict[str, Union[int, str]]) -> PublishResult:
         url = f"https://user.qzone.qq.com/proxy/domain/taotao.qzone.qq.com/cgi-bin/emotion_cgi_publish_v6?g_tk={self._get_gtk()}"
         # log("DEBUG", f"DATA: {data}")
-        html = await self.post(url, data=data)
-        assert isinstance(html.content, bytes)
-        log("DEBUG", f"Publish result: {html}")
-        html = html.content.decode()
-        log("DEBUG", escape_tag(html))
-        ret = json.loads(html[html.find("callback(") + 9 : html.find("});") + 1])
-        return ret["t1_tid"], pic_id
+        response = await self.post(url, data=data)
+        assert isinstance(response.content, bytes)
+        if response.status_code != 200:
+            raise UnexpectedResponse(f"HTTP {response.status_code}", response.content)
+        return PublishResult.from_dict(self._checked(response.content))
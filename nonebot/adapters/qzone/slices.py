@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .exception import QzoneApiError, Throttled
+from .media import MediaSource, PathSource
+from .utils import log, log_lazy, DebouncedWriter
+
+# read size when hashing or spooling, unrelated to the slice size
+READ_CHUNK = 1 << 20
+# used when the control answer doesn't name one
+SLICE_SIZE = 512 * 1024
+SLICE_APPIDS = {"image": "pic_qzone", "video": "video_qzone"}
+
+Control = Callable[[], Awaitable[Tuple[str, int]]]
+Send = Callable[["SliceProgress", int, int, bytes, bool], Awaitable[Dict[str, Any]]]
+
+
+async def measure(source: MediaSource) -> Tuple[str, str, int]:
+    # sha256 keys the upload cache, Qzone wants the md5
+    sha256, md5, size = hashlib.sha256(), hashlib.md5(), 0
+    async for chunk in source.chunks(READ_CHUNK):
+        await asyncio.to_thread(sha256.update, chunk)
+        await asyncio.to_thread(md5.update, chunk)
+        size += len(chunk)
+    return sha256.hexdigest(), md5.hexdigest(), size
+
+
+async def spool(source: MediaSource, directory: Path) -> PathSource:
+    # a stream readable only once is parked on disk, it is read twice
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(dir=directory, prefix=".spool-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            async for chunk in source.chunks(READ_CHUNK):
+                await asyncio.to_thread(file.write, chunk)
+    except BaseException:
+        os.remove(name)
+        raise
+    return PathSource(name)
+
+
+@dataclass
+class SliceProgress:
+    session: str
+    slice_size: int
+    done: Set[int] = field(default_factory=set)
+
+    def dump(self) -> Dict[str, Any]:
+        return {
+            "session": self.session,
+            "slice_size": self.slice_size,
+            "done": sorted(self.done),
+        }
+
+    @classmethod
+    def load(cls, data: Dict[str, Any]) -> "SliceProgress":
+        return cls(data["session"], data["slice_size"], set(data["done"]))
+
+
+class SlicedUpload:
+    # The control request opens an upload session and tells the slice size.
+    # Slices go up concurrently and only failed ones are retried; the last
+    # one is sent after all others landed, its answer carries the result.
+    # Acknowledged slices are checkpointed, so an interrupted upload resumes
+    # within the same session.
+
+    def __init__(
+        self,
+        source: MediaSource,
+        size: int,
+        control: Control,
+        send: Send,
+        path: Optional[Path],
+        concurrency: int,
+        retries: int,
+    ) -> None:
+        self.source = source
+        self.size = size
+        self.control = control
+        self.send = send
+        self.path = path
+        self.retries = retries
+        self.retried = 0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._writer = DebouncedWriter(path, 1) if path else None
+        self.progress: Optional[SliceProgress] = None
+        self._failed = False
+
+    async def run(self) -> Dict[str, Any]:
+        resumed = await asyncio.to_thread(self._resume)
+        try:
+            return await self._run()
+        except QzoneApiError as err:
+            if not resumed or isinstance(err, Throttled):
+                raise
+            # the session likely expired, start over once
+            log("INFO", f"Resumed upload session rejected, restarting: {err}")
+            self.progress = None
+            return await self._run()
+        finally:
+            if self._writer:
+                await self._writer.flush()
+
+    async def _run(self) -> Dict[str, Any]:
+        self._failed = False
+        if self.progress is None:
+            session, slice_size = await self.control()
+            self.progress = SliceProgress(session, slice_size)
+            self._save()
+        progress = self.progress
+        last_offset = (self.size - 1) // progress.slice_size * progress.slice_size
+        tasks: List["asyncio.Task[None]"] = []
+        last = b""
+        offset = 0
+        try:
+            async for chunk in self.source.chunks(progress.slice_size):
+                if offset == last_offset:
+                    last = chunk
+                elif offset not in progress.done:
+                    # waiting for a slot here bounds the slices held in memory
+                    await self._slots.acquire()
+                    if self._failed:
+                        self._slots.release()
+                        break
+                    tasks.append(asyncio.create_task(self._upload(offset, chunk)))
+                offset += len(chunk)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        result = await self._send(last_offset, last, True)
+        if self._writer:
+            self._writer.schedule_delete()
+        return result
+
+    async def _upload(self, offset: int, chunk: bytes) -> None:
+        assert self.progress
+        try:
+            await self._send(offset, chunk, False)
+        except BaseException:
+            self._failed = True
+            raise
+        finally:
+            self._slots.release()
+        self.progress.done.add(offset)
+        self._save()
+
+    async def _send(self, offset: int, chunk: bytes, last: bool) -> Dict[str, Any]:
+        assert self.progress
+        attempt = 0
+        while True:
+            try:
+                return await self.send(self.progress, offset, attempt, chunk, last)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                # answers other than throttling won't change on a retry
+                retryable = not isinstance(err, QzoneApiError) or isinstance(
+                    err, Throttled
+                )
+                if not retryable or attempt >= self.retries:
+                    raise
+                log_lazy("DEBUG", lambda: f"Retrying slice at {offset}: {err!r}")
+            attempt += 1
+            self.retried += 1
+            await asyncio.sleep(0.5 * 2**attempt)
+
+    def _resume(self) -> bool:
+        if self.path is None or not self.path.is_file():
+            return False
+        try:
+            self.progress = SliceProgress.load(json.loads(self.path.read_text()))
+        except (json.decoder.JSONDecodeError, TypeError, KeyError) as err:
+            log(
+                "WARNING",
+                f"Upload checkpoint {self.path} failed to parse: "
+                f"<{type(err).__name__}: {err}>",
+            )
+            return False
+        log(
+            "INFO",
+            f"Resuming upload, {len(self.progress.done)} slices already sent",
+        )
+        return True
+
+    def _save(self) -> None:
+        if self._writer and self.progress:
+            snapshot = self.progress.dump()
+            self._writer.schedule(lambda: json.dumps(snapshot))
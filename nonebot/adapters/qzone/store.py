@@ -0,0 +1,384 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List, NamedTuple, Optional, Union
+from urllib.parse import unquote, urlparse
+
+from .config import Config
+from .utils import atomic_write_text, log, remove_file_if_exists
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+    import msvcrt
+
+
+class Record(NamedTuple):
+    # value is None once deleted
+    value: Optional[str]
+    version: int
+
+
+class SessionStore(ABC):
+    # Versioned values shared by every process serving the same accounts.
+    # `swap` only writes when the stored version still is `version` (0 when
+    # never written) and returns the new version, or None when someone was
+    # faster. Deleting leaves a tombstone, so versions only ever grow and a
+    # later login is newer than anything another process has seen.
+
+    @abstractmethod
+    async def load(self, key: str) -> Optional[Record]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def swap(self, key: str, version: int, value: Optional[str]) -> Optional[int]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release_lease(self, name: str, owner: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+@contextmanager
+def _locked(path: Path) -> Iterator[None]:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:  # pragma: no cover
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:  # pragma: no cover
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class FileStore(SessionStore):
+    # Keeps the cookie files where they always were, adding a version field.
+    # Files written before versioning load as version 1, unreadable files as
+    # absent, so the next save replaces them. A tombstone is a file holding
+    # only the version and a deleted flag.
+
+    def __init__(self, path_of: Callable[[str], Path], lease_dir: Path) -> None:
+        self._path_of = path_of
+        self._lease_dir = lease_dir
+
+    def _read(self, path: Path) -> Optional[Record]:
+        if not os.path.isfile(path):
+            return None
+        try:
+            data = json.loads(path.read_text())
+            version = data.pop("version", 1)
+        except (
+            json.decoder.JSONDecodeError,
+            UnicodeDecodeError,
+            AttributeError,
+        ) as err:
+            log(
+                "WARNING",
+                f"Cookie file {path} failed to parse: <{type(err).__name__}: {err}>",
+            )
+            return None
+        if data.get("deleted"):
+            return Record(None, version)
+        return Record(json.dumps(data), version)
+
+    def _lock_of(self, path: Path) -> Path:
+        return path.with_name(f".{path.name}.lock")
+
+    async def load(self, key: str) -> Optional[Record]:
+        return await asyncio.to_thread(self._read, self._path_of(key))
+
+    def _swap(self, key: str, version: int, value: Optional[str]) -> Optional[int]:
+        path = self._path_of(key)
+        with _locked(self._lock_of(path)):
+            current = self._read(path)
+            if (current.version if current else 0) != version:
+                return None
+            if value is None:
+                atomic_write_text(
+                    path, json.dumps({"deleted": True, "version": version + 1})
+                )
+                return version + 1
+            data = json.loads(value)
+            data["version"] = version + 1
+            atomic_write_text(path, json.dumps(data))
+            return version + 1
+
+    async def swap(self, key: str, version: int, value: Optional[str]) -> Optional[int]:
+        return await asyncio.to_thread(self._swap, key, version, value)
+
+    def _lease(self, name: str, owner: str, ttl: Optional[float]) -> bool:
+        path = self._lease_dir / f".lease-{name}"
+        with _locked(self._lock_of(path)):
+            now = time.time()
+            holder, expires = None, 0.0
+            if os.path.isfile(path):
+                try:
+                    holder, expires = json.loads(path.read_text())
+                except (json.decoder.JSONDecodeError, TypeError, ValueError):
+                    # unreadable, as good as expired
+                    holder, expires = None, 0.0
+            if holder not in (None, owner) and expires > now:
+                return False
+            if ttl is None:
+                remove_file_if_exists(path)
+            else:
+                atomic_write_text(path, json.dumps([owner, now + ttl]))
+            return True
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        return await asyncio.to_thread(self._lease, name, owner, ttl)
+
+    async def release_lease(self, name: str, owner: str) -> None:
+        await asyncio.to_thread(self._lease, name, owner, None)
+
+
+class SqliteStore(SessionStore):
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, version INTEGER NOT NULL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS leases "
+                "(name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # one short-lived connection per call, each runs in its own thread
+        db = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def _load(self, key: str) -> Optional[Record]:
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT value, version FROM sessions WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        # the value column is NOT NULL, an empty value is the tombstone
+        return Record(row[0] or None, row[1])
+
+    async def load(self, key: str) -> Optional[Record]:
+        return await asyncio.to_thread(self._load, key)
+
+    def _swap(self, key: str, version: int, value: Optional[str]) -> Optional[int]:
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT version FROM sessions WHERE key = ?", (key,)
+            ).fetchone()
+            if (row[0] if row else 0) != version:
+                return None
+            db.execute(
+                "INSERT OR REPLACE INTO sessions (key, value, version) VALUES (?, ?, ?)",
+                (key, value or "", version + 1),
+            )
+            return version + 1
+
+    async def swap(self, key: str, version: int, value: Optional[str]) -> Optional[int]:
+        return await asyncio.to_thread(self._swap, key, version, value)
+
+    def _acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._connect() as db:
+            cursor = db.execute(
+                "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, "
+                "expires = excluded.expires WHERE leases.owner = excluded.owner "
+                "OR leases.expires <= ?",
+                (name, owner, now + ttl, now),
+            )
+            return cursor.rowcount > 0
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        return await asyncio.to_thread(self._acquire, name, owner, ttl)
+
+    def _release(self, name: str, owner: str) -> None:
+        with self._connect() as db:
+            db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    async def release_lease(self, name: str, owner: str) -> None:
+        await asyncio.to_thread(self._release, name, owner)
+
+
+RespValue = Union[None, int, bytes, str, List["RespValue"]]
+
+
+class RespError(Exception):
+    pass
+
+
+class RedisStore(SessionStore):
+    # Speaks just enough RESP for GET/SET/DEL and WATCH/MULTI/EXEC, so any
+    # Redis compatible server works without a client library.
+
+    def __init__(self, url: str, prefix: str = "qzone:") -> None:
+        parsed = urlparse(url)
+        self._host = parsed.hostname or "127.0.0.1"
+        self._port = parsed.port or 6379
+        self._password = unquote(parsed.password) if parsed.password else None
+        self._db = int(parsed.path.strip("/") or 0)
+        self._prefix = prefix
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        # commands of one transaction must not interleave with others
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        if self._writer is not None and not self._writer.is_closing():
+            return
+        self._reader, self._writer = await asyncio.open_connection(
+            self._host, self._port
+        )
+        if self._password:
+            await self._command("AUTH", self._password)
+        if self._db:
+            await self._command("SELECT", str(self._db))
+
+    async def _command(self, *args: str) -> RespValue:
+        assert self._reader and self._writer
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg.encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._writer.write(b"".join(parts))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self) -> RespValue:
+        assert self._reader
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RespError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            size = int(body)
+            if size < 0:
+                return None
+            return (await self._reader.readexactly(size + 2))[:-2]
+        if kind == b"*":
+            count = int(body)
+            if count < 0:
+                return None
+            return [await self._read_reply() for _ in range(count)]
+        raise RespError(f"Unexpected reply {line!r}")
+
+    async def _call(self, *args: str) -> RespValue:
+        async with self._lock:
+            await self._connect()
+            try:
+                return await self._command(*args)
+            except BaseException:
+                # a reply left unread would answer the next command
+                await self.close()
+                raise
+
+    async def _transaction(
+        self, key: str, check: Callable[[Optional[bytes]], bool], *commands: List[str]
+    ) -> bool:
+        # optimistic: the writes only apply if `key` is unchanged since WATCH
+        async with self._lock:
+            await self._connect()
+            try:
+                await self._command("WATCH", key)
+                if not check(await self._command("GET", key)):  # type: ignore
+                    await self._command("UNWATCH")
+                    return False
+                await self._command("MULTI")
+                for command in commands:
+                    await self._command(*command)
+                return await self._command("EXEC") is not None
+            except BaseException:
+                # don't leave the shared connection inside WATCH or MULTI
+                await self.close()
+                raise
+
+    async def load(self, key: str) -> Optional[Record]:
+        data = await self._call("GET", self._prefix + key)
+        if data is None:
+            return None
+        stored = json.loads(data)  # type: ignore
+        return Record(stored["value"], stored["version"])
+
+    async def swap(self, key: str, version: int, value: Optional[str]) -> Optional[int]:
+        key = self._prefix + key
+
+        def check(data: Optional[bytes]) -> bool:
+            return (json.loads(data)["version"] if data else 0) == version
+
+        stored = json.dumps({"value": value, "version": version + 1})
+        if await self._transaction(key, check, ["SET", key, stored]):
+            return version + 1
+        return None
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        key = f"{self._prefix}lease:{name}"
+        ms = str(max(1, int(ttl * 1000)))
+        if await self._call("SET", key, owner, "NX", "PX", ms) is not None:
+            return True
+        # renew our own lease
+        return await self._transaction(
+            key,
+            lambda data: data == owner.encode(),
+            ["SET", key, owner, "PX", ms],
+        )
+
+    async def release_lease(self, name: str, owner: str) -> None:
+        key = f"{self._prefix}lease:{name}"
+        await self._transaction(key, lambda data: data == owner.encode(), ["DEL", key])
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+
+
+def create_store(config: Config) -> SessionStore:
+    backend = config.session_store
+    if backend == "file":
+        return FileStore(config.cookie_path_of, config.cache_path)
+    if backend == "sqlite":
+        return SqliteStore(config.cache_path / "sessions.db")
+    if backend.startswith("sqlite:"):
+        return SqliteStore(Path(backend[len("sqlite:") :]))
+    if backend.startswith("redis://"):
+        return RedisStore(backend)
+    raise ValueError(f"Unknown session store {backend!r}")
@@ -0,0 +1,162 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple, Type
+
+from .exception import CircuitOpen
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.burst), self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def delay(self) -> float:
+        self._refill()
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def try_acquire(self) -> bool:
+        if self._lock.locked() or self.delay() > 0:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                wait = self.delay()
+                if wait <= 0:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep(wait)
+
+
+class AdaptiveLimiter:
+    # a semaphore whose limit can be changed while tasks hold it
+    def __init__(self, limit: int) -> None:
+        self._limit = limit
+        self.active = 0
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @limit.setter
+    def limit(self, value: int) -> None:
+        self._limit = max(1, value)
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.active < self._limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+
+    async def acquire(self) -> None:
+        if self.active < self._limit and not self._waiters:
+            self.active += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        self._wake()
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
+
+
+class AIMD:
+    # additive increase on success, multiplicative decrease on throttling
+    def __init__(
+        self, maximum: float, minimum: float, increase: float, decrease: float = 0.5
+    ) -> None:
+        self.maximum = maximum
+        self.minimum = minimum
+        self.increase = increase
+        self.decrease = decrease
+        self.value = maximum
+
+    def update(self, throttled: bool) -> float:
+        if throttled:
+            self.value = max(self.minimum, self.value * self.decrease)
+        else:
+            self.value = min(self.maximum, self.value + self.increase)
+        return self.value
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        threshold: int,
+        reset_timeout: float,
+        failures: Tuple[Type[BaseException], ...],
+    ) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failure_types = failures
+        self.failures = 0
+        self.opened: Optional[float] = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.retry_after() > 0
+
+    def retry_after(self) -> float:
+        if self.opened is None:
+            return 0.0
+        return max(0.0, self.opened + self.reset_timeout - time.monotonic())
+
+    def check(self) -> None:
+        wait = self.retry_after()
+        if wait > 0:
+            raise CircuitOpen(wait)
+        if self.opened is not None:
+            # half open, let a single call through to probe the service
+            if self._probing:
+                raise CircuitOpen(self.reset_timeout)
+            self._probing = True
+
+    def record(self, error: Optional[BaseException]) -> None:
+        self._probing = False
+        if error is None:
+            self.failures = 0
+            self.opened = None
+        elif isinstance(error, self.failure_types):
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened = time.monotonic()
+
+    def __enter__(self) -> None:
+        self.check()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if isinstance(exc, (asyncio.CancelledError, CircuitOpen)):
+            self._probing = False
+        else:
+            self.record(exc)
@@ -0,0 +1,114 @@
+import importlib.util
+from abc import ABC, abstractmethod
+from http.cookiejar import Cookie, CookieJar
+from typing import Any, Callable, Coroutine
+
+from nonebot.drivers import Request, Response
+
+from .config import Config
+from .utils import log
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+
+class Transport(ABC):
+    @abstractmethod
+    async def request(self, setup: Request) -> Response:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class DriverTransport(Transport):
+    def __init__(
+        self, request: Callable[[Request], Coroutine[Any, Any, Response]]
+    ) -> None:
+        self._request = request
+
+    async def request(self, setup: Request) -> Response:
+        return await self._request(setup)
+
+
+class _NullCookieJar(CookieJar):
+    # the pooled client is shared, cookies stay with each Request instead
+    def set_cookie(self, cookie: Cookie) -> None:
+        pass
+
+    def extract_cookies(self, response: Any, request: Any) -> None:
+        pass
+
+
+class HttpxTransport(Transport):
+    MaxRedirects = 20
+
+    def __init__(self, config: Config) -> None:
+        assert httpx
+        http2 = config.http2 and importlib.util.find_spec("h2") is not None
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=config.http_max_connections,
+                max_keepalive_connections=config.http_max_keepalive,
+                keepalive_expiry=config.http_keepalive_expiry.total_seconds(),
+            ),
+            cookies=_NullCookieJar(),
+            follow_redirects=False,
+        )
+        log("DEBUG", f"Pooled HTTP transport created (http2={http2})")
+
+    @staticmethod
+    def _timeout(timeout: Any) -> Any:
+        if isinstance(timeout, (int, float)):
+            return httpx.Timeout(timeout)
+        # nonebot.drivers.Timeout only exists from nonebot2 2.2, read it by shape
+        if hasattr(timeout, "total"):
+            return httpx.Timeout(
+                timeout.total, connect=timeout.connect, read=timeout.read
+            )
+        return httpx.USE_CLIENT_DEFAULT
+
+    async def request(self, setup: Request) -> Response:
+        jar = httpx.Cookies(setup.cookies.jar)
+        request = self._client.build_request(
+            setup.method,
+            str(setup.url),
+            content=setup.content,
+            data=setup.data,
+            files=setup.files,
+            json=setup.json,
+            headers=tuple(setup.headers.items()),
+            timeout=self._timeout(setup.timeout),
+        )
+        # follow redirects by hand so every hop reads and updates the request jar,
+        # the login flow collects its cookies across several domains
+        for _ in range(self.MaxRedirects + 1):
+            jar.set_cookie_header(request)
+            response = await self._client.send(request)
+            jar.extract_cookies(response)
+            if response.next_request is None:
+                return Response(
+                    response.status_code,
+                    headers=response.headers.multi_items(),
+                    content=response.content,
+                    request=setup,
+                )
+            request = response.next_request
+        raise httpx.TooManyRedirects("Exceeded maximum allowed redirects.")
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def create_transport(
+    config: Config,
+    fallback: Callable[[Request], Coroutine[Any, Any, Response]],
+) -> Transport:
+    if config.http_pool and httpx is not None:
+        return HttpxTransport(config)
+    if config.http_pool:
+        log("WARNING", "httpx is not installed, using the driver for requests")
+    return DriverTransport(fallback)
@@ -1,10 +1,26 @@
+import asyncio
 import os
 import subprocess
 import platform
-from typing import Any, Union
+import tempfile
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 from pathlib import Path
 from enum import Enum
 
+from nonebot import get_driver
+from nonebot.log import logger
 from nonebot.utils import logger_wrapper
 
 from .config import ADAPTER_NAME
@@ -52,10 +68,31 @@ def save_image(content: Any, path: Union[Path, str]) -> None:
         file.write(content)
 
 
+def atomic_write_text(path: Union[Path, str], text: str) -> None:
+    # write to a sibling temp file first so readers never see a partial file
+    _ensure_dir(path)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
 def remove_file(path: Union[Path, str]) -> None:
     os.remove(path)
 
 
+def remove_file_if_exists(path: Union[Path, str]) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
 def open_file(path: Union[Path, str]) -> None:
     # match PLATFORM:
     #     case Platform.MACOS:
@@ -72,3 +109,166 @@ def open_file(path: Union[Path, str]) -> None:
 
 
 log = logger_wrapper(ADAPTER_NAME)
+
+
+def log_enabled(level: str) -> bool:
+    try:
+        log_level = get_driver().config.log_level
+    except ValueError:
+        return True
+    levelno = logger.level(log_level).no if isinstance(log_level, str) else log_level
+    return logger.level(level).no >= levelno
+
+
+def log_lazy(
+    level: str,
+    message: Callable[[], str],
+    exception: Optional[BaseException] = None,
+) -> None:
+    # only pay for formatting when the message is going to be printed
+    if log_enabled(level):
+        log(level, message(), exception)
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one in-flight coroutine. With
+    # `linger`, a successful result is also shared with calls made shortly
+    # after it completed.
+
+    def __init__(self, linger: float = 0) -> None:
+        self.linger = linger
+        self._calls: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        future = self._calls.get(key)
+        return future is not None and not future.done()
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._done(key, done))
+        # one caller giving up must not cancel the call for everyone else
+        return await asyncio.shield(future)
+
+    def _done(self, key: Hashable, future: "asyncio.Future[Any]") -> None:
+        if self.linger and not future.cancelled() and future.exception() is None:
+            asyncio.get_running_loop().call_later(
+                self.linger, self._forget, key, future
+            )
+        else:
+            self._forget(key, future)
+
+    def _forget(self, key: Hashable, future: "asyncio.Future[Any]") -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+    async def wait(self, key: Hashable) -> None:
+        future = self._calls.get(key)
+        if future is not None:
+            await asyncio.wait([future])
+
+
+class TTLCache:
+    # Results are kept for `ttl` seconds, the least recently used go first
+    # once there are more than `size`. Misses of the same key share a fetch.
+
+    def __init__(self, ttl: float, size: int = 256) -> None:
+        self.ttl = ttl
+        self.size = size
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._flights = SingleFlight()
+        # fetches started before a clear() must not store what they read
+        self._generation = 0
+
+    def fresh(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def in_flight(self, key: Hashable) -> bool:
+        return self._flights.in_flight((self._generation, key))
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[T]]) -> T:
+        if self.fresh(key):
+            self._entries.move_to_end(key)
+            return self._entries[key][1]
+        generation = self._generation
+
+        async def call() -> T:
+            value = await fetch()
+            if generation == self._generation and self.ttl > 0:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+            return value
+
+        return await self._flights.do((generation, key), call)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._generation += 1
+
+
+class DebouncedWriter:
+    # Coalesces bursts of updates into one atomic write performed off the
+    # event loop. `render` returns the file content, or None to delete it.
+    # A `sink` replaces the file, receiving the content (or None) instead.
+
+    def __init__(
+        self,
+        path: Union[Path, str],
+        delay: float = 0,
+        sink: Optional[Callable[[Optional[str]], Awaitable[None]]] = None,
+    ) -> None:
+        self.path = path
+        self.delay = delay
+        self.sink = sink
+        self._render: Optional[Callable[[], Optional[str]]] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._wake = asyncio.Event()
+
+    def schedule(self, render: Callable[[], Optional[str]]) -> None:
+        self._render = render
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def schedule_delete(self) -> None:
+        self.schedule(lambda: None)
+
+    async def flush(self) -> None:
+        if self._task and not self._task.done():
+            self._wake.set()
+            await self._task
+
+    async def _run(self) -> None:
+        while self._render is not None:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._write()
+
+    async def _write(self) -> None:
+        render, self._render = self._render, None
+        if render is None:
+            return
+        text = render()
+        if self.sink is not None:
+            try:
+                await self.sink(text)
+            except Exception as err:
+                log("ERROR", f"Failed to write {self.path}", err)
+            return
+        try:
+            if text is None:
+                await asyncio.to_thread(remove_file_if_exists, self.path)
+            else:
+                await asyncio.to_thread(atomic_write_text, self.path, text)
+        except OSError as err:
+            log("ERROR", f"Failed to write {self.path}", err)
@@ -0,0 +1,58 @@
+import asyncio
+import shutil
+from typing import List, Optional
+
+from .media import MediaSource, PathSource
+from .slices import READ_CHUNK
+from .utils import log
+
+
+async def extract_cover(source: MediaSource, ffmpeg: str) -> Optional[bytes]:
+    # ffmpeg runs as a child process, only its pipes are served by the loop
+    executable = shutil.which(ffmpeg)
+    if executable is None:
+        log("WARNING", f"{ffmpeg} not found, posting the video without a cover")
+        return None
+    path = source.path if isinstance(source, PathSource) else None
+    args: List[str] = [executable, "-hide_banner", "-loglevel", "error"]
+    args += ["-i", str(path) if path else "pipe:0"]
+    args += ["-frames:v", "1", "-f", "image2", "-c:v", "mjpeg", "pipe:1"]
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.DEVNULL if path else asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    assert process.stdout and process.stderr
+    # communicate() would close stdin right away, the source is fed instead
+    feeder = None if path else asyncio.create_task(_feed(process, source))
+    try:
+        cover, error = await asyncio.gather(
+            process.stdout.read(), process.stderr.read()
+        )
+        await process.wait()
+    finally:
+        if feeder:
+            feeder.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    if process.returncode != 0 or not cover:
+        log(
+            "WARNING",
+            f"Failed to extract a video cover: {error.decode(errors='replace')}",
+        )
+        return None
+    return cover
+
+
+async def _feed(process: "asyncio.subprocess.Process", source: MediaSource) -> None:
+    # ffmpeg stops reading once it has the first frame
+    assert process.stdin
+    try:
+        async for chunk in source.chunks(READ_CHUNK):
+            process.stdin.write(chunk)
+            await process.stdin.drain()
+        process.stdin.close()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
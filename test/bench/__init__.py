@@ -0,0 +1 @@
+SAMPLE_QQ = "10001"
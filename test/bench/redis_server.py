@@ -0,0 +1,158 @@
+"""Minimal in-memory Redis stand-in for exercising the redis session store.
+
+Supports the commands RedisStore sends: AUTH, SELECT, PING, GET, SET (NX, XX,
+PX, EX), DEL, WATCH, UNWATCH, MULTI and EXEC.
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+Reply = Union[None, int, bytes, str, Exception, List["Reply"]]
+
+
+class Database:
+    def __init__(self) -> None:
+        self.values: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        # bumped on every write, WATCH compares it
+        self.revisions: Dict[bytes, int] = {}
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        item = self.values.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and expires <= time.monotonic():
+            del self.values[key]
+            self.touch(key)
+            return None
+        return value
+
+    def touch(self, key: bytes) -> None:
+        self.revisions[key] = self.revisions.get(key, 0) + 1
+
+
+class Connection:
+    def __init__(self, db: Database) -> None:
+        self.db = db
+        self.watched: Dict[bytes, int] = {}
+        self.queued: Optional[List[List[bytes]]] = None
+
+    def execute(self, args: List[bytes]) -> Reply:
+        name = args[0].upper().decode()
+        if self.queued is not None and name not in ("EXEC", "MULTI", "WATCH"):
+            self.queued.append(args)
+            return "QUEUED"
+        if name in ("AUTH", "SELECT", "PING"):
+            return "PONG" if name == "PING" else "OK"
+        if name == "WATCH":
+            for key in args[1:]:
+                self.db.get(key)
+                self.watched[key] = self.db.revisions.get(key, 0)
+            return "OK"
+        if name == "UNWATCH":
+            self.watched.clear()
+            return "OK"
+        if name == "MULTI":
+            self.queued = []
+            return "OK"
+        if name == "EXEC":
+            queued, self.queued = self.queued or [], None
+            watched, self.watched = self.watched, {}
+            for key, revision in watched.items():
+                self.db.get(key)
+                if self.db.revisions.get(key, 0) != revision:
+                    return None
+            return [self.execute(command) for command in queued]
+        if name == "GET":
+            return self.db.get(args[1])
+        if name == "SET":
+            return self.set(args[1], args[2], [arg.upper() for arg in args[3:]])
+        if name == "DEL":
+            deleted = 0
+            for key in args[1:]:
+                if self.db.get(key) is not None:
+                    del self.db.values[key]
+                    self.db.touch(key)
+                    deleted += 1
+            return deleted
+        return ValueError(f"unknown command '{name}'")
+
+    def set(self, key: bytes, value: bytes, options: List[bytes]) -> Reply:
+        expires = None
+        exists = self.db.get(key) is not None
+        if b"NX" in options and exists or b"XX" in options and not exists:
+            return None
+        for unit, scale in ((b"PX", 1000), (b"EX", 1)):
+            if unit in options:
+                ttl = int(options[options.index(unit) + 1])
+                expires = time.monotonic() + ttl / scale
+        self.db.values[key] = (value, expires)
+        self.db.touch(key)
+        return "OK"
+
+
+def encode(reply: Reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return f"-ERR {reply}\r\n".encode()
+    if isinstance(reply, str):
+        return f"+{reply}\r\n".encode()
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    return b"*%d\r\n" % len(reply) + b"".join(encode(item) for item in reply)
+
+
+async def read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    args = []
+    for _ in range(int(line[1:-2])):
+        size = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+def create_handler(db: Database):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = Connection(db)
+        try:
+            while True:
+                args = await read_command(reader)
+                if args is None:
+                    break
+                writer.write(encode(connection.execute(args)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(host: str, port: int) -> asyncio.AbstractServer:
+    return await asyncio.start_server(create_handler(Database()), host, port)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    async def run() -> None:
+        server = await serve(args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""Benchmark Session.publish against the local stand-in Qzone server.
+
+Run from the test directory: python -m bench.run
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import httpx
+
+import nonebot.adapters
+
+nonebot.adapters.__path__.append(  # type: ignore
+    str((Path(__file__).parent.parent.parent / "nonebot" / "adapters").resolve())
+)
+
+from nonebot.drivers import URL, Cookies, Request, Response
+
+from nonebot.adapters.qzone.config import Config
+from nonebot.adapters.qzone.exception import CircuitOpen
+from nonebot.adapters.qzone.media import BytesSource
+from nonebot.adapters.qzone.session import Session, SessionState
+from nonebot.adapters.qzone.transport import HttpxTransport
+
+from . import SAMPLE_QQ
+
+
+class RewriteTransport(HttpxTransport):
+    def __init__(self, config: Config, base_url: str) -> None:
+        super().__init__(config)
+        self.base_url = base_url.rstrip("/")
+
+    async def request(self, setup: Request) -> Response:
+        url = setup.url
+        setup.url = URL(f"{self.base_url}/{url.host}{url.path}").with_query(url.query)
+        return await super().request(setup)
+
+
+@dataclass
+class Result:
+    scenario: str
+    posts: int
+    errors: int
+    posts_per_sec: float
+    p50_ms: float
+    p99_ms: float
+    max_upload_concurrency: int
+    peak_kib_per_post: float
+
+
+def make_image(size: int) -> bytes:
+    return b"\x89PNG\r\n\x1a\n" + os.urandom(size)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+async def create_session(config: Config, base_url: str, login: bool) -> Session:
+    session = Session(RewriteTransport(config, base_url), config, "bench")
+    await session.start()
+    if login:
+        await session.login()
+    else:
+        session.cookies = Cookies(
+            {"uin": f"o{SAMPLE_QQ}", "skey": "@bench", "p_skey": "bench"}
+        )
+        session.qq_number = SAMPLE_QQ
+        session.state = SessionState.READY
+    return session
+
+
+async def run_scenario(
+    session: Session,
+    base_url: str,
+    name: str,
+    images: int,
+    posts: int,
+    concurrency: int,
+    image_size: int,
+    many: bool = False,
+    rate_limited: bool = False,
+) -> Result:
+    async with httpx.AsyncClient() as client:
+        await client.post(f"{base_url}/_bench/reset")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def post(index: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            sources = [BytesSource(make_image(image_size)) for _ in range(images)]
+            start = time.perf_counter()
+            try:
+                if rate_limited:
+                    await session.publish_limiter.acquire()
+                await session.publish(f"bench {name} {index}", sources)
+            except Exception:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    async def post_many() -> None:
+        nonlocal errors
+        batch = [
+            (
+                f"bench {name} {index}",
+                [BytesSource(make_image(image_size)) for _ in range(images)],
+            )
+            for index in range(posts)
+        ]
+        start = time.perf_counter()
+        try:
+            results = await session.publish_many(batch, rate_limited=rate_limited)
+        except CircuitOpen:
+            errors += posts
+            return
+        for result in results:
+            if isinstance(result, Exception):
+                errors += 1
+            else:
+                # per-post latency isn't observable inside a pipeline
+                latencies.append((time.perf_counter() - start) / posts)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    if many:
+        await post_many()
+    else:
+        await asyncio.gather(*(post(i) for i in range(posts)))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    async with httpx.AsyncClient() as client:
+        stats = (await client.get(f"{base_url}/_bench/stats")).json()
+
+    latencies.sort()
+    return Result(
+        scenario=name,
+        posts=posts,
+        errors=errors,
+        posts_per_sec=len(latencies) / elapsed,
+        p50_ms=percentile(latencies, 50) * 1000,
+        p99_ms=percentile(latencies, 99) * 1000,
+        max_upload_concurrency=stats["max_uploads_in_flight"],
+        peak_kib_per_post=peak / 1024 / (posts if many else min(posts, concurrency)),
+    )
+
+
+def start_server(args: argparse.Namespace) -> "subprocess.Popen[bytes]":
+    command = [
+        sys.executable,
+        "-m",
+        "bench.server",
+        "--port",
+        str(args.port),
+        "--latency",
+        str(args.latency),
+        "--error-rate",
+        str(args.error_rate),
+        "--throttle-rate",
+        str(args.throttle_rate),
+    ]
+    if args.publish_limit:
+        command += ["--publish-limit", str(args.publish_limit)]
+    for item in args.host_latency:
+        command += ["--host-latency", item]
+    return subprocess.Popen(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+async def wait_for_server(base_url: str) -> None:
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(f"{base_url}/_bench/stats")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"Bench server at {base_url} did not start")
+
+
+async def main(args: argparse.Namespace) -> List[Result]:
+    base_url = args.server or f"http://127.0.0.1:{args.port}"
+    server: Optional["subprocess.Popen[bytes]"] = None
+    if not args.server:
+        server = start_server(args)
+    try:
+        await wait_for_server(base_url)
+        with tempfile.TemporaryDirectory() as cache_path:
+            config = Config(
+                qzone_cache_path=Path(cache_path),
+                qzone_upload_concurrency=args.upload_concurrency,
+                qzone_upload_cache_persist=False,
+                qzone_auto_login=False,
+                qzone_upload_hedge_percentile=args.hedge_percentile,
+                **(
+                    {"qzone_publish_rate": args.publish_rate}
+                    if args.publish_rate
+                    else {}
+                ),
+            )
+            session = await create_session(config, base_url, args.login)
+            try:
+                results = []
+                for name, images, many in (
+                    ("text", 0, False),
+                    ("1-image", 1, False),
+                    ("9-image", 9, False),
+                    ("9-img-many", 9, True),
+                ):
+                    results.append(
+                        await run_scenario(
+                            session,
+                            base_url,
+                            name,
+                            images,
+                            args.posts,
+                            args.concurrency,
+                            args.image_size,
+                            many,
+                            args.publish_rate is not None,
+                        )
+                    )
+            finally:
+                await session.close()
+        return results
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+
+def report(results: List[Result], as_json: bool) -> None:
+    if as_json:
+        print(json.dumps([asdict(result) for result in results], indent=2))
+        return
+    header = (
+        f"{'scenario':<10}{'posts':>7}{'errors':>8}{'posts/s':>10}"
+        f"{'p50 ms':>10}{'p99 ms':>10}{'uploads':>9}{'KiB/post':>10}"
+    )
+    print(header)
+    for r in results:
+        print(
+            f"{r.scenario:<10}{r.posts:>7}{r.errors:>8}{r.posts_per_sec:>10.2f}"
+            f"{r.p50_ms:>10.1f}{r.p99_ms:>10.1f}{r.max_upload_concurrency:>9}"
+            f"{r.peak_kib_per_post:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--server", help="use an already running bench server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--posts", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--upload-concurrency", type=int, default=3)
+    parser.add_argument("--image-size", type=int, default=200 * 1024)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--publish-limit", type=float, default=None)
+    parser.add_argument(
+        "--publish-rate",
+        type=float,
+        default=None,
+        help="rate limit publishing like the adapter does, adapting to throttling",
+    )
+    parser.add_argument("--host-latency", action="append", default=[])
+    parser.add_argument("--hedge-percentile", type=float, default=None)
+    parser.add_argument("--login", action="store_true", help="log in via QR flow")
+    parser.add_argument("--json", action="store_true")
+    arguments = parser.parse_args()
+    report(asyncio.run(main(arguments)), arguments.json)
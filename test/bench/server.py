@@ -0,0 +1,507 @@
+"""Local stand-in for the Qzone endpoints used by Session.
+
+Requests are addressed as http://<bind>/<original host>/<original path>.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+from . import SAMPLE_QQ
+
+PNG_1PX = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082"
+)
+
+
+@dataclass
+class Behaviour:
+    latency: float = 0.05
+    jitter: float = 0.02
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    # posts per second the account may publish before being throttled
+    publish_limit: Optional[float] = None
+    endpoint_latency: Dict[str, float] = field(default_factory=dict)
+    host_latency: Dict[str, float] = field(default_factory=dict)
+    slice_size: int = 512 * 1024
+
+
+async def parse_multipart(request: Request) -> Dict[str, bytes]:
+    # the stdlib MIME parser saves depending on python-multipart here
+    head = f"Content-Type: {request.headers['content-type']}\r\n\r\n".encode()
+    message = BytesParser(policy=HTTP).parsebytes(head + await request.body())
+    return {
+        part.get_param("name", header="content-disposition"): part.get_payload(
+            decode=True
+        )
+        for part in message.iter_parts()
+    }
+
+
+@dataclass
+class Stats:
+    uploads_in_flight: int = 0
+    max_uploads_in_flight: int = 0
+    uploads: int = 0
+    publishes: int = 0
+    throttled: int = 0
+    errors: int = 0
+    engagements: int = 0
+    deletes: int = 0
+    reads: int = 0
+    slices: int = 0
+    sliced_uploads: int = 0
+
+
+def create_app(behaviour: Behaviour) -> FastAPI:
+    app = FastAPI()
+    stats = Stats()
+    publish_times = []
+    # newest first, like the real msglist
+    posts: List[Dict[str, Any]] = []
+
+    def find_post(tid: str) -> Dict[str, Any]:
+        for post in posts:
+            if post["tid"] == tid:
+                return post
+        raise KeyError(tid)
+
+    async def delay(endpoint: str, host: str = "") -> None:
+        latency = behaviour.host_latency.get(
+            host, behaviour.endpoint_latency.get(endpoint, behaviour.latency)
+        )
+        await asyncio.sleep(max(0.0, random.gauss(latency, behaviour.jitter)))
+
+    def failed() -> bool:
+        if random.random() < behaviour.error_rate:
+            stats.errors += 1
+            return True
+        return False
+
+    def throttled() -> bool:
+        if random.random() < behaviour.throttle_rate:
+            return True
+        if behaviour.publish_limit is None:
+            return False
+        now = time.monotonic()
+        while publish_times and now - publish_times[0] > 1:
+            publish_times.pop(0)
+        if len(publish_times) >= behaviour.publish_limit:
+            return True
+        publish_times.append(now)
+        return False
+
+    @app.get("/_bench/stats")
+    async def get_stats() -> Dict[str, int]:
+        return asdict(stats)
+
+    @app.post("/_bench/reset")
+    async def reset() -> Dict[str, int]:
+        nonlocal stats
+        stats = Stats()
+        publish_times.clear()
+        posts.clear()
+        return asdict(stats)
+
+    @app.post("/_bench/activity")
+    async def activity(request: Request) -> Dict[str, Any]:
+        # let somebody else comment, reply or like one of the posts
+        body = await request.json()
+        post = find_post(body.get("tid") or posts[0]["tid"])
+        uin = int(body.get("uin", 20002))
+        name = body.get("name", f"user{uin}")
+        if body["kind"] == "like":
+            if uin not in [liker["fuin"] for liker in post["likes"]]:
+                post["likes"].insert(0, {"fuin": uin, "nick": name})
+            return {"tid": post["tid"]}
+        entry = {
+            "uin": uin,
+            "name": name,
+            "content": body.get("content", "bench"),
+            "create_time": int(time.time()),
+        }
+        if body["kind"] == "reply":
+            comment = post["commentlist"][int(body.get("comment", 1)) - 1]
+            entry["tid"] = len(comment["list_3"]) + 1
+            comment["list_3"].append(entry)
+        else:
+            entry["tid"] = len(post["commentlist"]) + 1
+            entry["list_3"] = []
+            post["commentlist"].append(entry)
+            post["cmtnum"] = len(post["commentlist"])
+        return {"tid": post["tid"], "id": entry["tid"]}
+
+    @app.get("/photogz.photo.store.qq.com/psc")
+    async def photo(request: Request) -> Response:
+        await delay("psc")
+        # distinct bytes per picture, trailing data after IEND is ignored
+        return Response(PNG_1PX + request.url.query.encode(), media_type="image/png")
+
+    @app.get("/ssl.ptlogin2.qq.com/ptqrshow")
+    async def ptqrshow() -> Response:
+        await delay("ptqrshow")
+        response = Response(PNG_1PX, media_type="image/png")
+        response.set_cookie("qrsig", uuid.uuid4().hex)
+        return response
+
+    @app.get("/ssl.ptlogin2.qq.com/ptqrlogin")
+    async def ptqrlogin() -> Response:
+        await delay("ptqrlogin")
+        link = f"https://ptlogin2.qzone.qq.com/check_sig?uin={SAMPLE_QQ}"
+        return Response(
+            f"ptuiCB('0','0','{link}','0','登录成功！', 'bench')",
+            media_type="application/javascript",
+        )
+
+    @app.get("/ptlogin2.qzone.qq.com/check_sig")
+    async def check_sig() -> Response:
+        response = Response("")
+        response.set_cookie("uin", f"o{SAMPLE_QQ}")
+        response.set_cookie("skey", "@bench")
+        response.set_cookie("p_skey", uuid.uuid4().hex)
+        return response
+
+    @app.get("/user.qzone.qq.com/{qq}/more")
+    async def more(qq: str) -> Response:
+        await delay("more")
+        return Response("<html></html>", media_type="text/html")
+
+    @app.get(
+        "/user.qzone.qq.com/proxy/domain/taotao.qq.com/cgi-bin/emotion_cgi_msglist_v6"
+    )
+    async def msglist(pos: int = 0, num: int = 20, replynum: int = 0) -> Response:
+        await delay("emotion_cgi_msglist_v6")
+        # like the real list, comments only come along when asked for
+        skipped = {"likes"} if replynum else {"likes", "commentlist"}
+        page = [
+            {key: value for key, value in post.items() if key not in skipped}
+            for post in posts[pos : pos + num]
+        ]
+        return Response(
+            json.dumps({"code": 0, "msglist": page, "total": len(posts)}),
+            media_type="application/json",
+        )
+
+    @app.get(
+        "/user.qzone.qq.com/proxy/domain/taotao.qq.com/cgi-bin/emotion_cgi_msgdetail_v6"
+    )
+    async def msgdetail(tid: str) -> Response:
+        await delay("emotion_cgi_msgdetail_v6")
+        stats.reads += 1
+        try:
+            post = find_post(tid)
+        except KeyError:
+            body = {"code": -4, "message": "说说不存在"}
+        else:
+            body = {"code": 0, **{k: v for k, v in post.items() if k != "likes"}}
+        return Response(json.dumps(body), media_type="application/json")
+
+    @app.get(
+        "/h5.qzone.qq.com/proxy/domain/base.qzone.qq.com/cgi-bin/user/cgi_userinfo_get_all"
+    )
+    async def userinfo(uin: str) -> Response:
+        await delay("cgi_userinfo_get_all")
+        stats.reads += 1
+        data = {"uin": int(uin), "nickname": "bench", "msgnum": len(posts)}
+        body = json.dumps({"code": 0, "data": data})
+        return Response(f"_Callback({body});", media_type="text/html")
+
+    @app.get(
+        "/user.qzone.qq.com/proxy/domain/g.qzone.qq.com/cgi-bin/friendshow/cgi_get_visitor_simple"
+    )
+    async def visitors() -> Response:
+        await delay("cgi_get_visitor_simple")
+        stats.reads += 1
+        data = {"todaycount": 3, "totalcount": 42, "items": []}
+        body = json.dumps({"code": 0, "data": data})
+        return Response(f"_Callback({body});", media_type="text/html")
+
+    @app.get("/user.qzone.qq.com/proxy/domain/r.qzone.qq.com/cgi-bin/user/qz_opcnt2")
+    async def like_counts(unikey: str) -> Response:
+        await delay("qz_opcnt2")
+        data = []
+        for key in unikey.split("<|>"):
+            try:
+                post = find_post(key.rsplit("/", 1)[-1])
+            except KeyError:
+                continue
+            likedata = {"cnt": len(post["likes"]), "ilike": 0}
+            data.append({"key": key, "current": {"likedata": likedata}})
+        body = json.dumps({"code": 0, "data": data})
+        return Response(f"_Callback({body});", media_type="text/html")
+
+    @app.get(
+        "/user.qzone.qq.com/proxy/domain/users.qzone.qq.com/cgi-bin/likes/get_like_list_app"
+    )
+    async def like_list(unikey: str, query_count: int = 60) -> Response:
+        await delay("get_like_list_app")
+        post = find_post(unikey.rsplit("/", 1)[-1])
+        data = {
+            "like_uin_info": post["likes"][:query_count],
+            "total_number": len(post["likes"]),
+        }
+        body = json.dumps({"code": 0, "data": data})
+        return Response(f"_Callback({body});", media_type="text/html")
+
+    slice_sessions: Dict[str, Dict[str, Any]] = {}
+
+    @app.post("/h5.qzone.qq.com/webapp/json/sliceUpload/FileBatchControl/{checksum}")
+    async def slice_control(checksum: str, request: Request) -> Response:
+        await delay("FileBatchControl")
+        req = (await request.json())["control_req"][0]
+        session = uuid.uuid4().hex
+        slice_sessions[session] = {
+            "checksum": checksum,
+            "size": req["file_len"],
+            "appid": req["appid"],
+            "slices": {},
+        }
+        data = {"session": session, "slice_size": behaviour.slice_size}
+        return Response(
+            json.dumps({"ret": 0, "data": data}), media_type="application/json"
+        )
+
+    @app.post("/h5.qzone.qq.com/webapp/json/sliceUpload/FileUpload")
+    async def slice_upload(request: Request) -> Response:
+        form = await parse_multipart(request)
+        await delay("FileUpload")
+        if failed():
+            return Response("", status_code=500)
+        upload = slice_sessions.get(form["session"].decode())
+        if upload is None:
+            body = {"ret": -1, "msg": "session expired"}
+            return Response(json.dumps(body), media_type="application/json")
+        stats.slices += 1
+        offset = int(form["offset"])
+        upload["slices"][offset] = form["data"]
+        if int(form["end"]) < upload["size"]:
+            return Response(
+                json.dumps({"ret": 0, "data": {}}), media_type="application/json"
+            )
+        content = b"".join(upload["slices"][key] for key in sorted(upload["slices"]))
+        if hashlib.md5(content).hexdigest() != upload["checksum"]:
+            return Response(
+                json.dumps({"ret": -2, "msg": "checksum mismatch"}),
+                media_type="application/json",
+            )
+        del slice_sessions[form["session"].decode()]
+        stats.sliced_uploads += 1
+        lloc = uuid.uuid4().hex
+        biz = {
+            "sAlbumID": "V_bench",
+            "sPhotoID": lloc,
+            "iPhotoType": 1,
+            "iHeight": 1,
+            "iWidth": 1,
+            "sBURL": f"http://bench/{lloc}?bo=AQABAAAAAAA!",
+        }
+        if upload["appid"] == "video_qzone":
+            biz = {"sVid": lloc, "iDuration": 1000}
+        return Response(
+            json.dumps({"ret": 0, "data": {"biz": biz}}), media_type="application/json"
+        )
+
+    @app.post("/{host}/cgi-bin/upload/cgi_upload_image")
+    async def upload(host: str, request: Request) -> Response:
+        stats.uploads_in_flight += 1
+        stats.max_uploads_in_flight = max(
+            stats.max_uploads_in_flight, stats.uploads_in_flight
+        )
+        try:
+            await request.body()
+            await delay("cgi_upload_image", host)
+            if failed():
+                return Response("", status_code=500)
+            stats.uploads += 1
+            lloc = uuid.uuid4().hex
+            data = {
+                "albumid": "V_bench",
+                "lloc": lloc,
+                "sloc": lloc,
+                "type": 1,
+                "height": 1,
+                "width": 1,
+                "pre": f"http://bench/{lloc}?bo=AQABAAAAAAA!",
+            }
+            body = json.dumps({"data": data, "ret": 0})
+            return Response(
+                f"<html><script>frameElement.callback({body});</script></html>",
+                media_type="text/html",
+            )
+        finally:
+            stats.uploads_in_flight -= 1
+
+    @app.post(
+        "/user.qzone.qq.com/proxy/domain/taotao.qzone.qq.com/cgi-bin/emotion_cgi_delete_v6"
+    )
+    async def delete(request: Request) -> Response:
+        form = parse_qs((await request.body()).decode())
+        await delay("emotion_cgi_delete_v6")
+        if failed():
+            return Response("", status_code=500)
+        try:
+            posts.remove(find_post(form["tid"][0]))
+        except KeyError:
+            body: Dict[str, Any] = {"code": -10001, "message": "说说不存在"}
+        else:
+            stats.deletes += 1
+            body = {"code": 0, "message": "succ"}
+        return Response(
+            f"<script>frameElement.callback({json.dumps(body)});</script>",
+            media_type="text/html",
+        )
+
+    @app.post(
+        "/user.qzone.qq.com/proxy/domain/w.qzone.qq.com/cgi-bin/likes/internal_dolike_app"
+    )
+    async def dolike(request: Request) -> Response:
+        form = parse_qs((await request.body()).decode())
+        await delay("internal_dolike_app")
+        stats.engagements += 1
+        try:
+            post = find_post(form["fid"][0])
+        except KeyError:
+            body = {"code": -10001, "message": "说说不存在"}
+        else:
+            uin = int(form["opuin"][0])
+            if uin not in [liker["fuin"] for liker in post["likes"]]:
+                post["likes"].insert(0, {"fuin": uin, "nick": "bench"})
+            body = {"code": 0, "message": "succ"}
+        return Response(
+            f"<script>frameElement.callback({json.dumps(body)});</script>",
+            media_type="text/html",
+        )
+
+    @app.post(
+        "/user.qzone.qq.com/proxy/domain/taotao.qzone.qq.com/cgi-bin/emotion_cgi_re_feeds"
+    )
+    async def re_feeds(request: Request) -> Response:
+        form = {
+            key: values[0]
+            for key, values in parse_qs((await request.body()).decode()).items()
+        }
+        await delay("emotion_cgi_re_feeds")
+        stats.engagements += 1
+        try:
+            post = find_post(form["topicId"].split("_")[1])
+        except KeyError:
+            body: Dict[str, Any] = {"code": -10001, "message": "说说不存在"}
+            return Response(
+                f"<script>frameElement.callback({json.dumps(body)});</script>",
+                media_type="text/html",
+            )
+        entry: Dict[str, Any] = {
+            "uin": int(form["uin"]),
+            "name": "bench",
+            "content": form.get("content", ""),
+            "create_time": int(time.time()),
+        }
+        if form.get("paramstr") == "2":
+            comment = post["commentlist"][int(form["commentId"]) - 1]
+            entry["tid"] = len(comment["list_3"]) + 1
+            comment["list_3"].append(entry)
+        else:
+            entry["tid"] = len(post["commentlist"]) + 1
+            entry["list_3"] = []
+            post["commentlist"].append(entry)
+            post["cmtnum"] = len(post["commentlist"])
+        body = {"code": 0, "data": {"commentid": entry["tid"]}}
+        return Response(
+            f"<script>frameElement.callback({json.dumps(body)});</script>",
+            media_type="text/html",
+        )
+
+    @app.post(
+        "/user.qzone.qq.com/proxy/domain/taotao.qzone.qq.com/cgi-bin/emotion_cgi_publish_v6"
+    )
+    async def publish(request: Request) -> Response:
+        form = parse_qs((await request.body()).decode())
+        await delay("emotion_cgi_publish_v6")
+        if failed():
+            return Response("", status_code=500)
+        if throttled():
+            stats.throttled += 1
+            body = {"code": -10000, "message": "操作过于频繁，请稍后再试"}
+        else:
+            stats.publishes += 1
+            tid = uuid.uuid4().hex[:24]
+            richval = form.get("richval", [""])[0]
+            video = None
+            if form.get("richtype", [""])[0] == "3":
+                vid, cover, _, _, duration = richval.split(",")
+                video = {"video_id": vid, "cover": cover, "duration": int(duration)}
+                richval = ""
+            pictures = [
+                {"url1": f"https://photogz.photo.store.qq.com/psc?/{tid}/{index}"}
+                for index, _ in enumerate(filter(None, richval.split("\t")))
+            ]
+            posts.insert(
+                0,
+                {
+                    "tid": tid,
+                    "uin": int(SAMPLE_QQ),
+                    "content": form.get("con", [""])[0],
+                    "created_time": int(time.time()),
+                    "cmtnum": 0,
+                    "commentlist": [],
+                    "likes": [],
+                    "pic": pictures,
+                    **({"video": [video]} if video else {}),
+                },
+            )
+            body = {"code": 0, "t1_tid": tid}
+        return Response(f"_Callback({json.dumps(body)});", media_type="text/html")
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--publish-limit", type=float, default=None)
+    parser.add_argument("--slice-size", type=int, default=512 * 1024)
+    parser.add_argument(
+        "--host-latency",
+        action="append",
+        default=[],
+        metavar="HOST=SECONDS",
+        help="override the latency of one upload host",
+    )
+    args = parser.parse_args()
+    host_latency = {
+        host: float(seconds)
+        for host, seconds in (item.split("=", 1) for item in args.host_latency)
+    }
+    behaviour = Behaviour(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        publish_limit=args.publish_limit,
+        host_latency=host_latency,
+        slice_size=args.slice_size,
+    )
+    uvicorn.run(create_app(behaviour), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+from pathlib import Path
+
+import nonebot.adapters
+
+nonebot.adapters.__path__.append(  # type: ignore
+    str((Path(__file__).parent.parent / "nonebot" / "adapters").resolve())
+)
@@ -6,7 +6,7 @@ from nonebot.adapters import Message
 from nonebot.adapters.qzone import PublishEvent, LoginEvent, LogoutEvent, QueryEvent
 from nonebot.adapters.qzone import MessageSegment
 
-from . import SAMPLE_IMAGE_PATH, to_uri
+from . import SAMPLE_IMAGE_PATH
 
 
 publish = on_command("publish", to_me())
@@ -20,8 +20,8 @@ async def handle_publish(message: Message = CommandArg()):
     bot = get_bot("qzone_bot")
     logger.debug(f"{type(message)} {message}")
     msg = MessageSegment.text(str(message))
-    msg += MessageSegment.image(to_uri(SAMPLE_IMAGE_PATH))
-    msg += MessageSegment.image(to_uri(SAMPLE_IMAGE_PATH))
+    msg += MessageSegment.image(SAMPLE_IMAGE_PATH)
+    msg += MessageSegment.image(SAMPLE_IMAGE_PATH)
     tid, pic_id = await bot.send(PublishEvent(), msg)
     await publish.send(f"Published: {tid} {pic_id}")
 
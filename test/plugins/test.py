@@ -1,4 +1,5 @@
 import asyncio
+from datetime import datetime, timedelta
 
 from nonebot import get_bot, on_command
 from nonebot.params import CommandArg
@@ -8,7 +9,7 @@ from nonebot.adapters import Message
 from nonebot.adapters.qzone import PublishEvent
 from nonebot.adapters.qzone import MessageSegment
 
-from . import SAMPLE_IMAGE_PATH, to_uri
+from . import SAMPLE_IMAGE_PATH
 
 
 test_delay = on_command("test-delay", to_me())
@@ -18,12 +19,13 @@ test_multi = on_command("test-multi", to_me())
 @test_delay.handle()
 async def handle_test_delay(message: Message = CommandArg()):
     time = int(str(message))
-    await test_delay.send(f"Delayed publishing is scheduled for {time} minutes later")
-    await asyncio.sleep(time * 60)
     bot = get_bot("qzone_bot")
     msg = MessageSegment.text("test-delay")
-    tid, pic_id = await bot.send(PublishEvent(), msg)
-    await test_delay.send(f"Delayed published: {tid} {pic_id}")
+    msg += MessageSegment.image(SAMPLE_IMAGE_PATH)
+    post = await bot.schedule_publish(msg, datetime.now() + timedelta(minutes=time))
+    await test_delay.send(
+        f"Delayed publishing is scheduled for {time} minutes later: {post.id}"
+    )
 
 
 @test_multi.handle()
@@ -36,6 +38,6 @@ async def handle_test_multi(message: Message = CommandArg()):
     await test_delay.send(f"Try publishing for {times} times")
     bot = get_bot("qzone_bot")
     msg = MessageSegment.text("test-multi")
-    msg += MessageSegment.image(to_uri(SAMPLE_IMAGE_PATH))
+    msg += MessageSegment.image(SAMPLE_IMAGE_PATH)
     for i in range(times):
         asyncio.create_task(publish(i + 1, msg))
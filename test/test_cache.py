@@ -0,0 +1,67 @@
+import asyncio
+import time
+from datetime import timedelta
+
+from nonebot.adapters.qzone.cache import UploadCache
+
+DAY = timedelta(days=1)
+
+
+def test_entries_survive_reload(tmp_path):
+    async def run():
+        cache = UploadCache(tmp_path, 8, DAY)
+        await cache.put("a", "d1", {"lloc": "x"})
+        await cache.flush()
+        assert await UploadCache(tmp_path, 8, DAY).get("a", "d1") == {"lloc": "x"}
+        assert await UploadCache(tmp_path, 8, DAY).get("b", "d1") is None
+
+    asyncio.run(run())
+
+
+def test_least_recently_used_goes_first():
+    async def run():
+        cache = UploadCache(None, 2, DAY)
+        await cache.put("a", "d1", {})
+        await cache.put("a", "d2", {})
+        await cache.get("a", "d1")
+        await cache.put("a", "d3", {})
+        assert await cache.get("a", "d1") == {}
+        assert await cache.get("a", "d2") is None
+
+    asyncio.run(run())
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    async def run():
+        cache = UploadCache(tmp_path, 8, timedelta(seconds=0.05))
+        await cache.put("a", "d1", {})
+        await cache.flush()
+        time.sleep(0.06)
+        assert await cache.get("a", "d1") is None
+        assert await UploadCache(tmp_path, 8, DAY).get("a", "d1") is None
+
+    asyncio.run(run())
+
+
+def test_failed_flush_is_retried(tmp_path):
+    blocker = tmp_path / "cache"
+    blocker.write_text("")
+
+    async def run():
+        cache = UploadCache(blocker, 8, DAY)
+        await cache.put("a", "d1", {"lloc": "x"})
+        await cache.flush()
+        blocker.unlink()
+        await cache.flush()
+        assert await UploadCache(blocker, 8, DAY).get("a", "d1") == {"lloc": "x"}
+
+    asyncio.run(run())
+
+
+def test_corrupt_file_is_ignored(tmp_path):
+    (tmp_path / "a.json").write_text("{")
+
+    async def run():
+        assert await UploadCache(tmp_path, 8, DAY).get("a", "d1") is None
+
+    asyncio.run(run())
@@ -0,0 +1,24 @@
+import pytest
+
+from nonebot.adapters.qzone.adapter import Adapter
+from nonebot.adapters.qzone.message import Message, MessageSegment
+
+
+def test_reply_keeps_mention():
+    # the shape Bot.send builds for a ReplyEvent
+    message = Message("@{uin:1,nick:a,auto:1} ") + "hello"
+    assert Adapter._extract(message) == ("@{uin:1,nick:a,auto:1} hello", [], None)
+
+
+def test_text_segments_concatenate():
+    message = MessageSegment.text("a") + MessageSegment.image(b"x") + "b"
+    content, images, video = Adapter._extract(message)
+    assert content == "ab"
+    assert len(images) == 1
+    assert video is None
+
+
+def test_one_video_per_post():
+    message = MessageSegment.video(b"x") + MessageSegment.video(b"y")
+    with pytest.raises(ValueError):
+        Adapter._extract(message)
@@ -0,0 +1,108 @@
+import asyncio
+import copy
+
+from nonebot.adapters.qzone.config import Config
+from nonebot.adapters.qzone.event import CommentEvent, ReplyEvent
+from nonebot.adapters.qzone.feed import FeedPoller
+from nonebot.adapters.qzone.session import Session
+
+
+class Feed:
+    def __init__(self, posts: int) -> None:
+        self.posts = [
+            {"tid": f"t{n}", "cmtnum": 0, "commentlist": []} for n in range(posts)
+        ]
+        self.calls = []
+
+    def comment(self, post: int, uin: str) -> None:
+        comments = self.posts[post]["commentlist"]
+        comments.append({"tid": len(comments) + 1, "uin": uin, "list_3": []})
+        self.posts[post]["cmtnum"] = len(comments)
+
+    def reply(self, post: int, uin: str) -> None:
+        replies = self.posts[post]["commentlist"][0]["list_3"]
+        replies.append({"tid": len(replies) + 1, "uin": uin})
+
+    async def get_posts(self, pos=0, num=20, replies=0):
+        self.calls.append((num, replies))
+        page = copy.deepcopy(self.posts[pos : pos + num])
+        for post in page if not replies else ():
+            del post["commentlist"]
+        return page
+
+
+def poller(tmp_path, feed):
+    config = Config(qzone_cache_path=tmp_path, qzone_feed_posts=5)
+    session = Session(None, config, "bot")
+    session.qq_number = "1"
+    session.get_posts = feed.get_posts
+
+    async def no_likes(tids):
+        return {tid: 0 for tid in tids}
+
+    session.get_like_counts = no_likes
+    return FeedPoller(session, config, lambda event: asyncio.sleep(0))
+
+
+def test_unchanged_posts_are_not_refetched(tmp_path):
+    feed = Feed(5)
+    feed.comment(3, "2")
+
+    async def run():
+        feed_poller = poller(tmp_path, feed)
+        assert await feed_poller.poll() == []
+        assert await feed_poller.poll() == []
+        assert feed.calls == [(5, 100), (5, 0)]
+        feed.calls.clear()
+        feed.comment(1, "3")
+        events = await feed_poller.poll()
+        assert [(type(e), e.user_id, e.tid) for e in events] == [
+            (CommentEvent, "3", "t1")
+        ]
+        # comments only down to the changed post
+        assert feed.calls == [(5, 0), (2, 100)]
+
+    asyncio.run(run())
+
+
+def test_replies_turn_up_in_the_sweep(tmp_path):
+    feed = Feed(5)
+    feed.comment(3, "2")
+
+    async def run():
+        feed_poller = poller(tmp_path, feed)
+        await feed_poller.poll()
+        feed.reply(3, "4")
+        events = []
+        for _ in range(FeedPoller.FullSweep):
+            events += await feed_poller.poll()
+        assert [(type(e), e.user_id) for e in events] == [(ReplyEvent, "4")]
+        assert feed.calls[-1] == (5, 100)
+
+    asyncio.run(run())
+
+
+def test_stop_cancels_dispatch(tmp_path):
+    feed = Feed(1)
+    feed.comment(0, "2")
+
+    async def run():
+        feed_poller = poller(tmp_path, feed)
+        blocked = asyncio.Event()
+
+        async def dispatch(event):
+            blocked.set()
+            await asyncio.sleep(60)
+
+        feed_poller.dispatch = dispatch
+        feed_poller.interval = feed_poller.interval_min = 0.01
+        feed_poller.start()
+        await asyncio.sleep(0.02)
+        feed.comment(0, "3")
+        await asyncio.wait_for(blocked.wait(), 1)
+        handlers = set(feed_poller._handlers)
+        await feed_poller.stop()
+        assert handlers and all(task.cancelled() for task in handlers)
+        assert feed_poller._task.done()
+
+    asyncio.run(run())
@@ -0,0 +1,56 @@
+import asyncio
+
+from nonebot.drivers import Response
+
+from nonebot.adapters.qzone.config import Config
+from nonebot.adapters.qzone.hosts import HostSelector
+from nonebot.adapters.qzone.session import Session
+
+PRIMARY, BACKUP = Config().upload_hosts
+
+
+def urls(selector):
+    return [host.url for host in selector.ranked()]
+
+
+def test_backups_are_https_by_default():
+    assert PRIMARY != BACKUP and BACKUP.startswith("https://")
+
+
+def test_primary_first_until_a_backup_proves_faster():
+    selector = HostSelector([PRIMARY, BACKUP])
+    assert urls(selector) == [PRIMARY, BACKUP]
+    primary, backup = selector.hosts
+    primary.record_success(0.5)
+    assert urls(selector) == [PRIMARY, BACKUP]
+    backup.record_success(0.1)
+    assert urls(selector) == [BACKUP, PRIMARY]
+    backup.record_failure()
+    assert urls(selector) == [PRIMARY, BACKUP]
+
+
+def test_hedge_losers_are_charged(tmp_path):
+    config = Config(qzone_cache_path=tmp_path, qzone_upload_hedge_percentile=50)
+    delays = {PRIMARY: 0.3, BACKUP: 0.02}
+
+    async def post(url, **kwargs):
+        await asyncio.sleep(delays[url.split("?", 1)[0]])
+        return Response(200, content=url.encode())
+
+    async def run():
+        session = Session(None, config, "bot")
+        session.cookies = {"p_skey": "x"}
+        session.post = post
+        primary, backup = session.upload_hosts.hosts
+        for _ in range(HostSelector.MinSamples):
+            session.upload_hosts.observe(0.05)
+        content = await session._post_upload({})
+        assert content.startswith(BACKUP.encode())
+        # the primary was still running when the backup answered
+        assert primary.latency is not None and primary.latency > backup.latency
+        assert [host.url for host in session.upload_hosts.ranked()] == [
+            BACKUP,
+            PRIMARY,
+        ]
+
+    asyncio.run(run())
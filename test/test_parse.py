@@ -0,0 +1,68 @@
+import pytest
+
+from nonebot.adapters.qzone.exception import (
+    AuthExpired,
+    QzoneApiError,
+    Throttled,
+    UnexpectedResponse,
+)
+from nonebot.adapters.qzone.parse import parse_checked
+from nonebot.adapters.qzone.session import Session
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        b'{"code": 0, "data": 1}',
+        b'_Callback({"code": 0, "data": 1});',
+        b'<script>frameElement.callback({"code": 0, "data": 1});</script>',
+    ],
+)
+def test_wrapped_json_is_unwrapped(content):
+    assert parse_checked(content)["data"] == 1
+
+
+@pytest.mark.parametrize(
+    "content, error",
+    [
+        (b'{"code": -3000, "message": "login"}', AuthExpired),
+        (b'{"ret": -10000, "msg": "busy"}', Throttled),
+        ('{"code": -1, "message": "操作过于频繁"}'.encode(), Throttled),
+        (b'{"code": -2, "message": "bad"}', QzoneApiError),
+        (b'{"code": "oops"}', QzoneApiError),
+    ],
+)
+def test_error_codes_raise(content, error):
+    with pytest.raises(error) as info:
+        parse_checked(content)
+    assert type(info.value) is error
+
+
+def test_throttle_codes_are_configurable():
+    with pytest.raises(Throttled):
+        parse_checked(b'{"code": -2}', {-2})
+
+
+@pytest.mark.parametrize("content", [b"", b"<html>busy</html>", b"{nope}"])
+def test_non_json_is_unexpected(content):
+    with pytest.raises(UnexpectedResponse):
+        parse_checked(content)
+
+
+@pytest.mark.parametrize(
+    "url, name",
+    [
+        ("https://up.qzone.qq.com/cgi-bin/upload/cgi_upload_image", "cgi_upload_image"),
+        (
+            "https://h5.qzone.qq.com/webapp/json/sliceUpload/FileBatchControl/"
+            "d41d8cd98f00b204e9800998ecf8427e?g_tk=1",
+            "FileBatchControl",
+        ),
+        (
+            "https://user.qzone.qq.com/proxy/domain/x/emotion_cgi_publish_v6?g=1",
+            "emotion_cgi_publish_v6",
+        ),
+    ],
+)
+def test_endpoint_labels_drop_ids(url, name):
+    assert Session._endpoint_name(url) == name
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import pytest
+
+from nonebot.adapters.qzone.exception import PublishQueueFull
+from nonebot.adapters.qzone.message import Message
+from nonebot.adapters.qzone.publisher import Deferred, PublishQueue
+from nonebot.adapters.qzone.throttle import TokenBucket
+
+
+def test_pending_jobs_survive_restart(tmp_path):
+    path = tmp_path / "queue.json"
+
+    async def first():
+        async def handler(job):
+            await asyncio.Event().wait()
+
+        queue = PublishQueue(handler, path, 10, 1, True)
+        await queue.start()
+        jobs = [await queue.submit(Message(str(i))) for i in range(3)]
+        # one job is in flight when the queue stops, two are waiting
+        await asyncio.sleep(0)
+        await queue.stop()
+        return [job.id for job in jobs]
+
+    async def second(ids):
+        handled = []
+
+        async def handler(job):
+            handled.append(job.id)
+            return job.id, []
+
+        queue = PublishQueue(handler, path, 10, 1, True)
+        await queue.start()
+        results = await asyncio.gather(*(queue.get(i).future for i in ids))
+        await queue.stop()
+        return handled, results
+
+    ids = asyncio.run(first())
+    handled, results = asyncio.run(second(ids))
+    assert sorted(handled) == sorted(ids)
+    assert [tid for tid, _ in results] == ids
+
+
+def test_finished_jobs_stay_visible(tmp_path):
+    async def run():
+        async def handler(job):
+            return "tid", []
+
+        queue = PublishQueue(handler, None, 10, 1, True)
+        await queue.start()
+        job = await queue.submit(Message("x"))
+        await job.future
+        await queue.stop()
+        return queue.get(job.id)
+
+    job = asyncio.run(run())
+    assert job is not None and job.future.result() == ("tid", [])
+
+
+def test_deferred_jobs_count_against_the_bound():
+    async def run():
+        async def handler(job):
+            raise Deferred(60, "a")
+
+        queue = PublishQueue(handler, None, 5, 2, False)
+        await queue.start()
+        for i in range(5):
+            await queue.submit(Message(str(i)), bot_id="a")
+        await asyncio.sleep(0.05)
+        depth = len(queue)
+        with pytest.raises(PublishQueueFull):
+            await queue.submit(Message("full"), bot_id="a")
+        await queue.stop()
+        return depth
+
+    assert asyncio.run(run()) == 5
+
+
+def test_deferred_jobs_follow_the_rate():
+    # what Adapter._handle_job does with an account's token bucket
+    async def run():
+        bucket = TokenBucket(20, 1)
+        calls = 0
+        published = []
+
+        async def handler(job):
+            nonlocal calls
+            calls += 1
+            if not bucket.try_acquire():
+                raise Deferred(bucket.delay(), job.bot_id)
+            published.append(time.monotonic())
+            return job.id, []
+
+        queue = PublishQueue(handler, None, 100, 4, True)
+        await queue.start()
+        start = time.monotonic()
+        jobs = [await queue.submit(Message(str(i)), bot_id="a") for i in range(10)]
+        await asyncio.wait_for(asyncio.gather(*(job.future for job in jobs)), 5)
+        await queue.stop()
+        return calls, published[-1] - start
+
+    calls, elapsed = asyncio.run(run())
+    # one token up front, then 20/s: nine more take 0.45s
+    assert 0.4 <= elapsed < 0.8
+    # each job is tried about twice, not polled
+    assert calls <= 20
+
+
+def test_other_accounts_pass_a_waiting_one():
+    async def run():
+        done = []
+
+        async def handler(job):
+            if job.bot_id == "slow":
+                raise Deferred(60, "slow")
+            done.append(job.bot_id)
+            return job.id, []
+
+        queue = PublishQueue(handler, None, 100, 1, True)
+        await queue.start()
+        for bot_id in ("slow", "slow", "fast", "fast"):
+            await queue.submit(Message("x"), bot_id=bot_id)
+        await asyncio.sleep(0.05)
+        depth = len(queue)
+        await queue.stop()
+        return done, depth
+
+    done, depth = asyncio.run(run())
+    assert done == ["fast", "fast"]
+    assert depth == 2
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from nonebot.adapters.qzone import scheduler as scheduler_module
+from nonebot.adapters.qzone.message import Message
+from nonebot.adapters.qzone.publisher import Priority
+from nonebot.adapters.qzone.scheduler import Scheduler
+
+
+async def nothing(post):
+    pass
+
+
+def test_scheduled_posts_survive_restart(tmp_path):
+    path = tmp_path / "schedule.json"
+
+    async def run():
+        first = Scheduler(nothing, nothing, path, 0)
+        await first.start()
+        later = datetime.now() + timedelta(hours=1)
+        kept = first.schedule(Message("kept"), later, "bot", Priority.HIGH)
+        dropped = first.schedule(Message("dropped"), later)
+        assert first.cancel(dropped.id)
+        await first.stop()
+
+        second = Scheduler(nothing, nothing, path, 0)
+        await second.start()
+        [post] = second.list()
+        assert (post.id, post.bot_id, post.priority) == (kept.id, "bot", Priority.HIGH)
+        assert post.message == Message("kept") and post.at == kept.at
+        await second.stop()
+
+    asyncio.run(run())
+
+
+def test_overdue_posts_fire_once_restored(tmp_path):
+    path = tmp_path / "schedule.json"
+    fired = []
+
+    async def fire(post):
+        fired.append(post.message)
+
+    async def run():
+        first = Scheduler(nothing, nothing, path, 0)
+        await first.start()
+        first.schedule(Message("late"), datetime.now() + timedelta(seconds=0.05))
+        await first.stop()
+        await asyncio.sleep(0.1)
+
+        second = Scheduler(fire, nothing, path, 0)
+        await second.start()
+        await asyncio.sleep(0.05)
+        assert fired == [Message("late")] and len(second) == 0
+        await second.stop()
+        # handed over, so it's gone from the store too
+        third = Scheduler(fire, nothing, path, 0)
+        await third.start()
+        assert len(third) == 0
+        await third.stop()
+
+    asyncio.run(run())
+
+
+def test_prefetch_runs_ahead_and_refused_posts_retry(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "FIRE_RETRY", 0.05)
+    events = []
+
+    async def prefetch(post):
+        events.append(("prefetch", time.time()))
+
+    async def fire(post):
+        events.append(("fire", time.time()))
+        if len(events) < 3:
+            raise RuntimeError("queue full")
+
+    async def run():
+        scheduler = Scheduler(fire, prefetch, None, 0.05)
+        await scheduler.start()
+        post = scheduler.schedule(Message("x"), datetime.now() + timedelta(seconds=0.1))
+        await asyncio.sleep(0.3)
+        assert [kind for kind, _ in events] == ["prefetch", "fire", "fire"]
+        assert events[0][1] < post.at <= events[1][1]
+        assert len(scheduler) == 0
+        await scheduler.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from nonebot.adapters.qzone.exception import QzoneApiError
+from nonebot.adapters.qzone.media import BytesSource
+from nonebot.adapters.qzone.slices import SlicedUpload
+
+SLICE = 4
+DATA = bytes(range(22))
+
+
+class Remote:
+    def __init__(self, fail_at=None):
+        self.sessions = 0
+        self.sent = []
+        self.fail_at = fail_at
+
+    async def control(self):
+        self.sessions += 1
+        return f"s{self.sessions}", SLICE
+
+    async def send(self, progress, offset, retry, chunk, last):
+        if offset == self.fail_at:
+            raise QzoneApiError(-1, "slice rejected")
+        if progress.session != f"s{self.sessions}":
+            raise QzoneApiError(-2, "unknown session")
+        self.sent.append((offset, chunk, last))
+        return {"done": last}
+
+
+def upload(remote, path, concurrency=1):
+    return SlicedUpload(
+        BytesSource(DATA), len(DATA), remote.control, remote.send, path, concurrency, 0
+    )
+
+
+def assemble(sent):
+    return b"".join(chunk for _, chunk, _ in sorted(sent))
+
+
+def test_slices_arrive_with_the_last_one_last(tmp_path):
+    remote = Remote()
+    path = tmp_path / "upload.json"
+
+    async def run():
+        assert await upload(remote, path, 3).run() == {"done": True}
+
+    asyncio.run(run())
+    assert assemble(remote.sent) == DATA
+    assert remote.sent[-1] == (20, DATA[20:], True)
+    assert not any(last for _, _, last in remote.sent[:-1])
+    assert not path.exists()
+
+
+def test_interrupted_upload_resumes_where_it_stopped(tmp_path):
+    remote = Remote(fail_at=8)
+    path = tmp_path / "upload.json"
+
+    async def run():
+        with pytest.raises(QzoneApiError):
+            await upload(remote, path).run()
+        assert path.exists()
+        remote.fail_at = None
+        first = list(remote.sent)
+        assert await upload(remote, path).run() == {"done": True}
+        return first
+
+    first = asyncio.run(run())
+    assert [offset for offset, _, _ in first] == [0, 4]
+    # same session, the acknowledged slices aren't sent again
+    assert remote.sessions == 1
+    assert [offset for offset, _, _ in remote.sent[2:]] == [8, 12, 16, 20]
+    assert assemble(remote.sent) == DATA
+
+
+def test_expired_session_starts_over(tmp_path):
+    remote = Remote(fail_at=8)
+    path = tmp_path / "upload.json"
+
+    async def run():
+        with pytest.raises(QzoneApiError):
+            await upload(remote, path).run()
+        # the server forgot the session meanwhile
+        remote.sessions += 1
+        remote.fail_at = None
+        remote.sent.clear()
+        assert await upload(remote, path).run() == {"done": True}
+
+    asyncio.run(run())
+    assert remote.sessions == 3
+    assert assemble(remote.sent) == DATA
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from bench.redis_server import serve
+from nonebot.adapters.qzone.config import Config
+from nonebot.adapters.qzone.session import Session
+from nonebot.adapters.qzone.store import FileStore, RedisStore, SqliteStore
+
+
+def run_with_store(kind, tmp_path, test):
+    async def run():
+        server = None
+        if kind == "file":
+            store = FileStore(lambda key: tmp_path / f"cookies-{key}", tmp_path)
+        elif kind == "sqlite":
+            store = SqliteStore(tmp_path / "sessions.db")
+        else:
+            server = await serve("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            store = RedisStore(f"redis://127.0.0.1:{port}")
+        try:
+            await test(store)
+        finally:
+            await store.close()
+            if server:
+                server.close()
+
+    asyncio.run(run())
+
+
+STORES = pytest.mark.parametrize("kind", ["file", "sqlite", "redis"])
+
+
+@STORES
+def test_swap_is_compare_and_set(kind, tmp_path):
+    async def test(store):
+        assert await store.load("a") is None
+        assert await store.swap("a", 0, '{"n": 1}') == 1
+        assert await store.swap("a", 0, '{"n": 2}') is None
+        assert await store.swap("a", 1, '{"n": 2}') == 2
+        record = await store.load("a")
+        assert json.loads(record.value) == {"n": 2} and record.version == 2
+
+    run_with_store(kind, tmp_path, test)
+
+
+@STORES
+def test_versions_grow_across_delete(kind, tmp_path):
+    async def test(store):
+        assert await store.swap("a", 0, '{"n": 1}') == 1
+        assert await store.swap("a", 1, None) == 2
+        record = await store.load("a")
+        assert record.value is None and record.version == 2
+        # a stale writer can't resurrect the deleted value
+        assert await store.swap("a", 1, '{"n": 1}') is None
+        assert await store.swap("a", 2, '{"n": 3}') == 3
+
+    run_with_store(kind, tmp_path, test)
+
+
+@STORES
+def test_lease_has_one_holder(kind, tmp_path):
+    async def test(store):
+        assert await store.acquire_lease("l", "one", 30)
+        assert not await store.acquire_lease("l", "two", 30)
+        # renewing our own lease works
+        assert await store.acquire_lease("l", "one", 30)
+        await store.release_lease("l", "one")
+        assert await store.acquire_lease("l", "two", 30)
+
+    run_with_store(kind, tmp_path, test)
+
+
+def test_file_store_survives_corrupt_files(tmp_path):
+    async def test(store):
+        (tmp_path / "cookies-a").write_text("{garbage")
+        assert await store.load("a") is None
+        assert await store.swap("a", 0, '{"n": 1}') == 1
+        (tmp_path / ".lease-l").write_text('["one", ')
+        assert await store.acquire_lease("l", "two", 30)
+
+    run_with_store("file", tmp_path, test)
+
+
+def cookies(skey: str, refreshed: float) -> str:
+    return json.dumps(
+        {
+            "last_used": refreshed,
+            "last_refreshed": refreshed,
+            "cookies": {"uin": "o10000", "skey": skey, "p_skey": skey},
+        }
+    )
+
+
+@STORES
+def test_other_process_adopts_login_after_logout(kind, tmp_path):
+    config = Config(qzone_cache_path=tmp_path)
+
+    async def test(store):
+        first = Session(None, config, "bot", store=store)
+        second = Session(None, config, "bot", store=store)
+        await first._store_cookies(cookies("old", time.time() - 60))
+        await second._sync_cookies()
+        assert second.cookies["skey"] == "old"
+        # logout, then a fresh login in the first process
+        await first._store_cookies(None)
+        await first._store_cookies(cookies("new", time.time()))
+        # the second process still holds the old cookies and tries to save
+        await second._store_cookies(cookies("old", time.time() - 60))
+        assert second.cookies["skey"] == "new"
+        record = await store.load("bot")
+        assert json.loads(record.value)["cookies"]["skey"] == "new"
+
+    run_with_store(kind, tmp_path, test)